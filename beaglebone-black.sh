@@ -52,25 +52,33 @@ include third_stage
 include clean_system
 
 status 'Kernel compile'
-git clone https://github.com/beagleboard/linux -b 4.14 --depth 1 ${work_dir}/usr/src/kernel
-cd ${work_dir}/usr/src/kernel
-git rev-parse HEAD >${work_dir}/usr/src/kernel-at-commit
 export ARCH=arm
 
 # Edit the CROSS_COMPILE variable as needed
 export CROSS_COMPILE=arm-linux-gnueabihf-
-touch .scmversion
-patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/kali-wifi-injection-4.14.patch
-patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/0001-wireless-carl9170-Enable-sniffer-mode-promisc-flag-t.patch
-make bb.org_defconfig
-make -j $(grep -c processor /proc/cpuinfo)
-cp arch/arm/boot/zImage ${work_dir}/boot/zImage
-mkdir -p ${work_dir}/boot/dtbs
-cp arch/arm/boot/dts/*.dtb ${work_dir}/boot/dtbs/
-make INSTALL_MOD_PATH=${work_dir} modules_install
-#make INSTALL_MOD_PATH=${work_dir} firmware_install
-make mrproper
-make bb.org_defconfig
+
+# Kernel, modules, dtbs and cleaned source tree, from an earlier build of the same inputs when there is one
+if ! kernel_cache_restore "${work_dir}" -g "https://github.com/beagleboard/linux#4.14" -t "${CROSS_COMPILE}gcc" -e bb.org_defconfig \
+    "${repo_dir}"/patches/kali-wifi-injection-4.14.patch "${repo_dir}"/patches/0001-wireless-carl9170-Enable-sniffer-mode-promisc-flag-t.patch; then
+    git_clone https://github.com/beagleboard/linux -b 4.14 --depth 1 ${work_dir}/usr/src/kernel
+    cd ${work_dir}/usr/src/kernel
+    git rev-parse HEAD >${work_dir}/usr/src/kernel-at-commit
+    touch .scmversion
+    patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/kali-wifi-injection-4.14.patch
+    patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/0001-wireless-carl9170-Enable-sniffer-mode-promisc-flag-t.patch
+    make bb.org_defconfig
+    make -j $(grep -c processor /proc/cpuinfo)
+    cp arch/arm/boot/zImage ${work_dir}/boot/zImage
+    mkdir -p ${work_dir}/boot/dtbs
+    cp arch/arm/boot/dts/*.dtb ${work_dir}/boot/dtbs/
+    make INSTALL_MOD_PATH=${work_dir} modules_install
+    #make INSTALL_MOD_PATH=${work_dir} firmware_install
+    make mrproper
+    make bb.org_defconfig
+    kernel_cache_save "${work_dir}"
+
+fi
+
 cd "${base_dir}"
 
 status 'Create uEnv.txt file'
@@ -187,7 +195,7 @@ mkdir -p "${base_dir}"/root/boot
 mount "${bootp}" "${base_dir}"/root/boot
 
 status "Rsyncing rootfs into image file"
-rsync -HPavz -q --exclude boot "${work_dir}"/ "${base_dir}"/root/
+rsync -Hav -q --exclude boot "${work_dir}"/ "${base_dir}"/root/
 sync
 
 status "Rsyncing rootfs into image file (/boot)"
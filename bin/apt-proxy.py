@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+
+###############################################
+# Caching APT proxy shared by the builds running on this host
+#
+# Every build downloads its own copy of every .deb, in debootstrap_exec and
+# again in the third stage. This proxy keeps one copy of each file:
+# - Storage is content addressed ("<cache>/blobs/<sha256>"), identical
+#   files under different URLs (suites, mirrors) are stored once
+# - Concurrent requests for the same URL share one upstream fetch; every
+#   client is streamed the bytes as they arrive
+# - Range requests ("Range: bytes=a-b") are served from the cache
+# - Least recently used files are removed when the cache goes over its
+#   quota (-q GiB)
+# Pool files and by-hash indexes never change and are kept until evicted;
+# other files (Release, Packages, ...) are reused for -t seconds.
+#
+# Two ways to use it:
+# - As http_proxy: ./common.d/check.sh already picks up a proxy listening
+#   on port 3142 (the default here) when it runs as root, and sets
+#   proxy_url for debootstrap and the third stage (see apt_options.sh and
+#   disable_proxy in functions.sh)
+# - As the mirror: with -u <upstream>, "http://127.0.0.1:3142/<path>" is
+#   "<upstream>/<path>", so mirror="http://127.0.0.1:3142" in builder.txt.
+#   The upstream can be a file:// URL (a local mirror or a test directory)
+#
+# Dependencies:
+# sudo apt -y install python3
+#
+# Usage:
+# ./bin/apt-proxy.py [-b <address:port>] [-c <cache dir>] [-q <quota GiB>] [-t <index ttl seconds>] [-u <upstream URL>] [-v]
+#
+# E.g.:
+# sudo ./bin/apt-proxy.py -c local/apt-cache -q 50 &
+# ./bin/apt-proxy.py -b 127.0.0.1:8000 -u file:///srv/mirror/kali -c /tmp/apt-cache
+
+import getopt
+import hashlib
+import http.server
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+bind = "127.0.0.1:3142"
+
+cachedir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "local", "apt-cache")
+
+quota = 20  # GiB
+
+ttl = 300  # Seconds an index file (Release, Packages, ...) is reused
+
+upstream = ""
+
+verbose = False
+
+CHUNK_SIZE = 1 << 20
+
+# Files that never change under the same URL
+IMMUTABLE = re.compile(r"/(pool|by-hash)/")
+
+# Straight to the upstream, never through an http_proxy pointing back here
+opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} [-b <address:port>] [-c <cache dir>] [-q <quota GiB>] [-t <index ttl seconds>] [-u <upstream URL>] [-v]"
+        outstr += f"\nE.g. : {prog} -c local/apt-cache -q 50\n"
+
+    print(outstr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global bind, cachedir, quota, ttl, upstream, verbose
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hb:c:q:t:u:v",
+            [
+                "bind=",
+                "cachedir=",
+                "quota=",
+                "ttl=",
+                "upstream=",
+                "verbose"
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-b", "--bind"):
+                bind = arg
+
+            elif opt in ("-c", "--cachedir"):
+                cachedir = arg
+
+            elif opt in ("-q", "--quota"):
+                quota = float(arg)
+
+            elif opt in ("-t", "--ttl"):
+                ttl = float(arg)
+
+            elif opt in ("-u", "--upstream"):
+                upstream = arg.rstrip("/")
+
+            elif opt in ("-v", "--verbose"):
+                verbose = True
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    except ValueError as e:
+        bail(f"Invalid value: {e}")
+
+    if quota <= 0:
+        bail(f"Invalid quota: {quota}")
+
+    return 0
+
+
+class Store:
+    # Content addressed blobs, plus one small JSON file per URL pointing to its blob
+    def __init__(self, directory, quota_bytes):
+        self.directory = os.path.abspath(directory)
+        self.quota = quota_bytes
+        self.lock = threading.Lock()
+
+        for sub in ("blobs", "urls", "tmp"):
+            os.makedirs(os.path.join(self.directory, sub), exist_ok=True)
+
+        # Leftovers of interrupted fetches
+        for name in os.listdir(os.path.join(self.directory, "tmp")):
+            os.unlink(os.path.join(self.directory, "tmp", name))
+
+        self.total = sum(os.path.getsize(path) for path in self.blobs())
+
+    def blobs(self):
+        for root, dirs, names in os.walk(os.path.join(self.directory, "blobs")):
+            for name in names:
+                yield os.path.join(root, name)
+
+    def blob_path(self, digest):
+        return os.path.join(self.directory, "blobs", digest[:2], digest)
+
+    def url_path(self, url):
+        return os.path.join(self.directory, "urls", hashlib.sha256(url.encode()).hexdigest())
+
+    def tmp_file(self):
+        return tempfile.NamedTemporaryFile(dir=os.path.join(self.directory, "tmp"), delete=False)
+
+    def lookup(self, url):
+        # (entry, blob path) when the URL is cached and still valid, else None
+        try:
+            with open(self.url_path(url)) as f:
+                entry = json.load(f)
+
+            path = self.blob_path(entry["sha256"])
+
+            if not entry["immutable"] and time.time() - entry["fetched"] > ttl:
+                return None
+
+            # Last used, for the eviction
+            os.utime(path)
+
+        except FileNotFoundError:
+            # Evicted blob, or a URL seen for the first time
+            if os.path.exists(self.url_path(url)):
+                os.unlink(self.url_path(url))
+
+            return None
+
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return entry, path
+
+    def add(self, url, tmp, digest, size, immutable, content_type):
+        # Move a fetched file into place, returns its blob path
+        path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self.lock:
+            if os.path.exists(path):
+                os.unlink(tmp)
+                os.utime(path)
+
+            else:
+                os.rename(tmp, path)
+                self.total += size
+
+        entry = {"url": url, "sha256": digest, "size": size, "immutable": immutable, "fetched": time.time(), "content_type": content_type}
+
+        with tempfile.NamedTemporaryFile("w", dir=os.path.join(self.directory, "tmp"), delete=False) as f:
+            json.dump(entry, f)
+
+        os.replace(f.name, self.url_path(url))
+
+        return path
+
+    def evict(self):
+        # Least recently used blobs first, down to 90% of the quota. Open files
+        # keep being served, the URL files of removed blobs are misses
+        with self.lock:
+            if self.total <= self.quota:
+                return 0
+
+            removed = 0
+
+            for mtime, size, path in sorted((os.stat(path).st_mtime, os.path.getsize(path), path) for path in self.blobs()):
+                if self.total <= self.quota * 0.9:
+                    break
+
+                os.unlink(path)
+                self.total -= size
+                removed += 1
+
+        print(f"[i] Evicted {removed} file(s), cache is {self.total / (1 << 30):.2f} GiB")
+
+        return removed
+
+
+class Fetch:
+    # One upstream download, shared by every request for the same URL
+    def __init__(self, url):
+        self.url = url
+        self.cond = threading.Condition()
+        self.started = False  # Headers received, tmp is being written
+        self.done = False
+        self.status = 200
+        self.error = ""
+        self.length = None
+        self.content_type = "application/octet-stream"
+        self.written = 0
+        self.tmp = ""
+        self.path = ""  # Blob, once done
+
+
+class Proxy:
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.stats = {"hits": 0, "misses": 0, "shared": 0, "bytes_upstream": 0, "bytes_served": 0}
+
+    def count(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+    def fetch(self, url):
+        # The running download of url, started if there is none
+        with self.lock:
+            fetch = self.inflight.get(url)
+
+            if fetch:
+                self.stats["shared"] += 1
+
+                return fetch
+
+            fetch = self.inflight[url] = Fetch(url)
+            self.stats["misses"] += 1
+
+        threading.Thread(target=self.download, args=(fetch,), daemon=True).start()
+
+        return fetch
+
+    def download(self, fetch):
+        h = hashlib.sha256()
+        tmp = None
+
+        try:
+            request = urllib.request.Request(fetch.url, headers={"User-Agent": "kali-arm-apt-proxy"})
+
+            with opener.open(request, timeout=60) as response:
+                tmp = self.store.tmp_file()
+
+                with fetch.cond:
+                    length = response.headers.get("Content-Length")
+                    fetch.length = int(length) if length else None
+                    fetch.content_type = response.headers.get("Content-Type", fetch.content_type)
+                    fetch.tmp = tmp.name
+                    fetch.started = True
+                    fetch.cond.notify_all()
+
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                    h.update(chunk)
+                    tmp.write(chunk)
+                    tmp.flush()
+
+                    with fetch.cond:
+                        fetch.written += len(chunk)
+                        fetch.cond.notify_all()
+
+                tmp.close()
+
+            if fetch.length is not None and fetch.written != fetch.length:
+                raise OSError(f"Short read: {fetch.written}/{fetch.length} bytes")
+
+            with fetch.cond:
+                fetch.path = self.store.add(fetch.url, tmp.name, h.hexdigest(), fetch.written, bool(IMMUTABLE.search(fetch.url)), fetch.content_type)
+                fetch.length = fetch.written
+
+            self.count("bytes_upstream", fetch.written)
+
+            if verbose:
+                print(f"[+] Fetched: {fetch.url} ({fetch.written} bytes)")
+
+        except urllib.error.HTTPError as e:
+            fetch.status = e.code
+            fetch.error = str(e.reason)
+
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            # file:// upstreams report a missing file as a URLError
+            fetch.status = 404 if isinstance(getattr(e, "reason", None), FileNotFoundError) else 502
+            fetch.error = str(e)
+            print(f"[-] {fetch.url}: {e}")
+
+        finally:
+            with fetch.cond:
+                if tmp and os.path.exists(tmp.name):
+                    tmp.close()
+                    os.unlink(tmp.name)
+
+                fetch.done = True
+                fetch.cond.notify_all()
+
+            with self.lock:
+                del self.inflight[fetch.url]
+
+            self.store.evict()
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive, apt fetches many small files per connection
+    protocol_version = "HTTP/1.1"
+
+    proxy = None
+
+    def log_message(self, format, *args):
+        if verbose:
+            sys.stderr.write(f"[i] {self.address_string()} {format % args}\n")
+
+    def target(self):
+        # Upstream URL of the request, None when it cannot be served
+        path = self.path
+
+        if path.startswith("http://"):
+            return path
+
+        if not upstream or not path.startswith("/") or "/../" in f"{path}/":
+            return None
+
+        return f"{upstream}{path}"
+
+    def error(self, code, message):
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(message) + 1))
+        self.end_headers()
+
+        if self.command != "HEAD":
+            self.wfile.write(f"{message}\n".encode())
+
+    def byte_range(self, size):
+        # (start, end) of a single "bytes=" range, None for the whole file, False if unsatisfiable
+        header = self.headers.get("Range", "")
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+
+        if not header or not match or match.group(1) == match.group(2) == "":
+            return None
+
+        if match.group(1) == "":
+            start, end = max(0, size - int(match.group(2))), size - 1
+
+        else:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+
+        if start > end or start >= size:
+            return False
+
+        return start, end
+
+    def send_file(self, path, size, content_type):
+        # Opened before anything is sent: a blob evicted meanwhile raises FileNotFoundError
+        with open(path, "rb") as f:
+            span = self.byte_range(size)
+
+            if span is False:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+                return
+
+            start, end = span or (0, size - 1)
+
+            self.send_response(206 if span else 200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+
+            if span:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+
+            self.end_headers()
+
+            if self.command == "HEAD":
+                return
+
+            f.seek(start)
+            left = end - start + 1
+
+            while left > 0:
+                chunk = f.read(min(left, CHUNK_SIZE))
+
+                if not chunk:
+                    break
+
+                self.wfile.write(chunk)
+                left -= len(chunk)
+
+        self.proxy.count("bytes_served", end - start + 1)
+
+    def stream(self, fetch):
+        # Follow a running download, sending the bytes as they land in its tmp file
+        with fetch.cond:
+            fetch.cond.wait_for(lambda: fetch.started or fetch.done)
+
+            # Already in the cache, or failed: nothing to follow
+            if fetch.done or fetch.path:
+                return False
+
+            # Opened under the lock: the tmp file is only moved or removed under it
+            f = open(fetch.tmp, "rb")
+            length = fetch.length
+
+        with f:
+            self.send_response(200)
+            self.send_header("Content-Type", fetch.content_type)
+
+            if length is not None:
+                self.send_header("Content-Length", str(length))
+
+            else:
+                # The end of the body is the end of the connection
+                self.send_header("Connection", "close")
+                self.close_connection = True
+
+            self.end_headers()
+
+            sent = 0
+
+            while True:
+                with fetch.cond:
+                    fetch.cond.wait_for(lambda: fetch.written > sent or fetch.done)
+                    available = fetch.written - sent
+
+                # Done, or failed: whatever was written has been sent
+                if available == 0:
+                    break
+
+                while available > 0:
+                    chunk = f.read(min(available, CHUNK_SIZE))
+
+                    if not chunk:
+                        raise OSError(f"{fetch.tmp} is shorter than written")
+
+                    self.wfile.write(chunk)
+                    sent += len(chunk)
+                    available -= len(chunk)
+
+        self.proxy.count("bytes_served", sent)
+
+        return True
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            with self.proxy.lock:
+                body = json.dumps(dict(self.proxy.stats, cache_bytes=self.proxy.store.total)).encode()
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+            return
+
+        url = self.target()
+
+        if not url:
+            self.error(400, "Not a proxy request, and no upstream (-u) to map it to")
+
+            return
+
+        cached = self.proxy.store.lookup(url)
+
+        if cached:
+            entry, path = cached
+            self.proxy.count("hits")
+
+            try:
+                self.send_file(path, entry["size"], entry.get("content_type", "application/octet-stream"))
+
+                return
+
+            except FileNotFoundError:
+                # Evicted in between
+                pass
+
+        fetch = self.proxy.fetch(url)
+
+        # Ranges and HEAD are answered from the complete file
+        if self.command == "GET" and "Range" not in self.headers and self.stream(fetch):
+            return
+
+        with fetch.cond:
+            fetch.cond.wait_for(lambda: fetch.done)
+
+        if not fetch.path:
+            self.error(fetch.status, fetch.error or "Upstream error")
+
+            return
+
+        self.send_file(fetch.path, fetch.length, fetch.content_type)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_CONNECT(self):
+        # https is not cached, apt only goes through the proxy for http://
+        self.error(405, "CONNECT is not supported")
+
+
+def main(argv):
+    getargs(argv)
+
+    host, _, port = bind.rpartition(":")
+
+    try:
+        store = Store(cachedir, quota * (1 << 30))
+
+    except OSError as e:
+        bail(f"Cannot use the cache directory: {cachedir}", str(e))
+
+    Handler.proxy = Proxy(store)
+
+    try:
+        server = http.server.ThreadingHTTPServer((host or "0.0.0.0", int(port)), Handler)
+
+    except (OSError, ValueError) as e:
+        bail(f"Cannot listen on {bind}", str(e))
+
+    server.daemon_threads = True
+
+    print(f"[i] Listening on {bind}, cache {cachedir} ({store.total / (1 << 30):.2f}/{quota:g} GiB){', upstream ' + upstream if upstream else ''}")
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    stats = Handler.proxy.stats
+    print(f"\n[i] Hits: {stats['hits']}, misses: {stats['misses']}, shared fetches: {stats['shared']}, upstream: {stats['bytes_upstream']} bytes, served: {stats['bytes_served']} bytes")
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
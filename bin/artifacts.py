@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+###############################################
+# Metadata of the release artifacts in the image directory
+#
+# For every release image, reads what the release manifests publish:
+# - "<imagedir>/<image>.img.xz.sha256sum": compressed SHA-256
+# - "<imagedir>/<image>.img.sha256sum"   : uncompressed SHA-256
+# - "<imagedir>/<image>.img.xz"          : size, and the uncompressed size
+#                                          from the xz index (./bin/xzindex.py), and
+#                                          whether xz can decompress it in parallel
+#
+# Each image is read once, whatever number of manifests it ends up in.
+# The images are read on a pool of threads; the results keep the order of
+# the input, so the output does not depend on the number of jobs.
+#
+# The metadata is kept in a state file ("<imagedir>/.release-state.json")
+# with the size and mtime_ns of the three files it came from. An image
+# whose files did not change since is not read again; only rebuilt images
+# are. Pass force=True (release.py --force) to ignore the state.
+#
+# Usage (from another script in ./bin/):
+# import artifacts
+# state = artifacts.State("images/.release-state.json")
+# found, errors = artifacts.collect("images", "2022.3", ["kali-linux-2022.3-raspberry-pi-arm64.img"], state=state)
+# state.save()
+# found["kali-linux-2022.3-raspberry-pi-arm64.img"].extract_size
+
+import collections
+import concurrent.futures
+import json
+import os
+import tempfile
+import threading
+
+import checksums
+import xzindex
+
+file_ext = [
+    "xz",
+    "xz.sha256sum",
+    "sha256sum"
+    ]
+
+STATE_FILE = ".release-state.json"
+
+STATE_VERSION = 2
+
+Artifact = collections.namedtuple("Artifact", [
+    "url",
+    "extract_size",
+    "extract_sha256",
+    "image_download_size",
+    "image_download_sha256",
+    "blocks",
+    "parallel",
+    "verified"
+])
+
+
+class State:
+    # Artifact metadata keyed by file name, with the stat signature it was read at
+    def __init__(self, file, force=False):
+        self.file = file
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.entries = {}
+        self.hits = 0
+
+        if force:
+            return
+
+        try:
+            with open(file) as f:
+                state = json.load(f)
+
+            if state.get("version") == STATE_VERSION:
+                self.entries = state["artifacts"]
+
+        except (OSError, ValueError, KeyError, AttributeError):
+            self.entries = {}
+
+    def get(self, filename, signature):
+        with self.lock:
+            entry = self.entries.get(filename)
+
+        if entry and entry["signature"] == signature:
+            with self.lock:
+                self.hits += 1
+
+            return entry
+
+        return None
+
+    def put(self, filename, entry):
+        with self.lock:
+            self.entries[filename] = entry
+            self.dirty = True
+
+    def save(self):
+        # Temporary file and rename, a crash never leaves a truncated state
+        if not self.dirty:
+            return 0
+
+        with self.lock:
+            directory = os.path.dirname(os.path.abspath(self.file))
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".release-state-")
+
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"version": STATE_VERSION, "artifacts": self.entries}, f, indent=2, sort_keys=True)
+
+                os.replace(tmp, self.file)
+
+            finally:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+
+            self.dirty = False
+
+        return 0
+
+
+def signature(imagedir, filename):
+    # [size, mtime_ns] of every file the metadata comes from
+    sig = []
+
+    for ext in file_ext:
+        st = os.stat(f"{imagedir}/{filename}.{ext}")
+        sig.append([st.st_size, st.st_mtime_ns])
+
+    return sig
+
+
+def url(release, filename):
+    return f"https://kali.download/arm-images/kali-{release}/{filename}.xz"
+
+
+def read(imagedir, release, filename, verify=False, cache=None, state=None):
+    # Collect the artifact metadata of one image, returns (artifact, errors)
+    errors = []
+
+    # Check to make sure files got created
+    for ext in file_ext:
+        check_file = f"{imagedir}/{filename}.{ext}"
+
+        if not os.path.isfile(check_file):
+            errors.append(f"Missing: '{check_file}'")
+
+    if errors:
+        return None, errors
+
+    try:
+        sig = signature(imagedir, filename)
+
+    except OSError as e:
+        return None, [f"Cannot read '{imagedir}/{filename}': {e}"]
+
+    entry = state.get(filename, sig) if state else None
+
+    # Unchanged since the last run; a verified entry also satisfies --verify
+    if entry and (entry["verified"] or not verify):
+        return Artifact(
+            url(release, filename),
+            entry["extract_size"],
+            entry["extract_sha256"],
+            entry["image_download_size"],
+            entry["image_download_sha256"],
+            entry["blocks"],
+            entry["parallel"],
+            "unchanged" if verify else ""
+        ), []
+
+    try:
+        with open(f"{imagedir}/{filename}.xz.sha256sum") as f:
+            image_download_sha256 = f.read().split()[0]
+
+        with open(f"{imagedir}/{filename}.sha256sum") as f:
+            extract_sha256 = f.read().split()[0]
+
+        # Read the uncompressed size straight from the xz index
+        info = xzindex.read_index(f"{imagedir}/{filename}.xz")
+
+        image_download_size = os.path.getsize(f"{imagedir}/{filename}.xz")
+
+    except (OSError, IndexError) as e:
+        return None, [f"Cannot read the checksums of '{imagedir}/{filename}': {e}"]
+
+    except xzindex.XZError as e:
+        return None, [f"Cannot read the xz index of '{imagedir}/{filename}.xz': {e}"]
+
+    # Never publish a digest that does not match the artifact
+    verified = ""
+
+    if verify:
+        result = checksums.verify(f"{imagedir}/{filename}.xz", cache)
+
+        if result.errors:
+            return None, [f"{imagedir}/{filename}.xz: {error}" for error in result.errors]
+
+        verified = checksums.throughput(result)
+
+    # Only keep metadata of files that did not change while they were read
+    try:
+        unchanged = signature(imagedir, filename) == sig
+
+    except OSError:
+        unchanged = False
+
+    if state and unchanged:
+        state.put(filename, {
+            "signature": sig,
+            "extract_size": info.uncompressed_size,
+            "extract_sha256": extract_sha256,
+            "image_download_size": image_download_size,
+            "image_download_sha256": image_download_sha256,
+            "blocks": len(info.blocks),
+            "parallel": len(info.blocks) > 1 and info.sized,
+            "verified": verify
+        })
+
+    return Artifact(
+        url(release, filename),
+        info.uncompressed_size,
+        extract_sha256,
+        image_download_size,
+        image_download_sha256,
+        len(info.blocks),
+        len(info.blocks) > 1 and info.sized,
+        verified
+    ), []
+
+
+def collect(imagedir, release, filenames, jobs=4, verify=False, cache=None, state=None):
+    # Returns ({filename: artifact} in input order, errors); duplicates are read once
+    filenames = list(dict.fromkeys(filenames))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(lambda filename: read(imagedir, release, filename, verify, cache, state), filenames))
+
+    found = {}
+    errors = []
+
+    for filename, (artifact, image_errors) in zip(filenames, results):
+        if image_errors:
+            errors += image_errors
+
+        else:
+            found[filename] = artifact
+
+    return found, errors
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+###############################################
+# Put an image together from the staged rootfs, without loop devices
+#
+# The device scripts partition the image with parted, attach it with
+# losetup (make_loop() in ./common.d/functions.sh), format the partitions,
+# mount them and rsync the working dir into them. This writes the same
+# image straight from the working dir instead:
+# - the MBR partition table: boot (vfat 0x0c, or ext 0x83) from -s to -b
+#   MiB, root (0x83) from -b MiB to the end
+# - the root filesystem, created in place at its partition offset by
+#   `mkfs.ext4 -d` (ownership, modes, hard links, device nodes and xattrs
+#   are copied), without the contents of /boot
+# - the boot filesystem from <rootfs>/boot: ext with `mkfs -d` in place as
+#   well, vfat with mkfs.vfat + mcopy in a file that is then spliced in
+# - both are checked with e2fsck/fsck.vfat
+#
+# No mount, no block device: several builds can assemble their images at
+# the same time, and the separate copy pass goes away.
+#
+# The root partition is sized as make_image() sizes the image: the rootfs,
+# plus <free space> MiB. The partition UUIDs are "<disk id>-01" and
+# "<disk id>-02", so cmdline.txt/fstab can be written before the image
+# exists (assemble_prepare() in ./common.d/functions.sh).
+#
+# Dependencies:
+# sudo apt -y install python3 e2fsprogs dosfstools mtools
+#
+# Usage:
+# ./bin/assemble-image.py [-b <boot end MiB>] [-t vfat|ext2|ext3|ext4] [-f ext2|ext3|ext4] [-F <free space MiB>] [-s <first partition MiB>]
+#                         [-U <root fs UUID>] [-i <disk id>] <rootfs dir> <image.img>
+#
+# E.g.:
+# ./bin/assemble-image.py -b 256 -t vfat -f ext4 -F 300 -i 5c2a9f13 base/rpi/working images/kali-linux-2022.3-raspberry-pi-arm64.img
+
+import getopt
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+
+import sparse
+
+boot_end = 256  # MiB, 0 for no boot partition
+
+boot_fstype = "vfat"
+
+root_fstype = "ext4"
+
+free_space = 300  # MiB
+
+first_partition = 1  # MiB
+
+root_uuid = ""
+
+disk_id = None
+
+rootfs = ""
+
+image = ""
+
+MIB = 1 << 20
+
+SECTOR_SIZE = 512
+
+CHUNK_SIZE = 4 * MIB
+
+# As mkfs_partitions() in ./common.d/functions.sh
+FEATURES = {"ext4": "^64bit,^metadata_csum", "ext3": "^64bit", "ext2": "^64bit"}
+
+PARTITION_TYPES = {"vfat": 0x0C, "ext2": 0x83, "ext3": 0x83, "ext4": 0x83}
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} [-b <boot end MiB>] [-t vfat|ext2|ext3|ext4] [-f ext2|ext3|ext4] [-F <free space MiB>] [-s <first partition MiB>]"
+        outstr += "\n         [-U <root fs UUID>] [-i <disk id>] <rootfs dir> <image.img>"
+        outstr += f"\nE.g. : {prog} -b 256 -t vfat -f ext4 -F 300 base/rpi/working images/kali.img\n"
+
+    print(outstr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global boot_end, boot_fstype, root_fstype, free_space, first_partition, root_uuid, disk_id, rootfs, image
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hb:t:f:F:s:U:i:",
+            [
+                "boot-end=",
+                "boot-fstype=",
+                "root-fstype=",
+                "free-space=",
+                "start=",
+                "uuid=",
+                "disk-id="
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-b", "--boot-end"):
+                boot_end = int(arg)
+
+            elif opt in ("-t", "--boot-fstype"):
+                boot_fstype = arg
+
+            elif opt in ("-f", "--root-fstype"):
+                root_fstype = arg
+
+            elif opt in ("-F", "--free-space"):
+                free_space = int(arg)
+
+            elif opt in ("-s", "--start"):
+                first_partition = int(arg)
+
+            elif opt in ("-U", "--uuid"):
+                root_uuid = arg
+
+            elif opt in ("-i", "--disk-id"):
+                disk_id = int(arg, 16)
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    except ValueError as e:
+        bail(f"Invalid value: {e}")
+
+    if len(args) != 2:
+        bail("Missing rootfs dir or image")
+
+    rootfs, image = args
+
+    if boot_fstype not in PARTITION_TYPES or root_fstype not in FEATURES:
+        bail(f"Unsupported filesystem: {boot_fstype if boot_fstype not in PARTITION_TYPES else root_fstype}")
+
+    if boot_end and boot_end <= first_partition:
+        bail("The boot partition must end after it starts")
+
+    if not os.path.isdir(rootfs):
+        bail(f"No such directory: {rootfs}")
+
+    if disk_id is None:
+        disk_id = random.getrandbits(32)
+
+    return 0
+
+
+def tree_size(path, exclude=None):
+    # Bytes used by a tree, as `du -s -B1`, hard links counted once
+    seen = set()
+    total = 0
+
+    for root, dirs, files in os.walk(path):
+        if exclude and root == path and exclude in dirs:
+            dirs.remove(exclude)
+
+        for name in dirs + files:
+            st = os.lstat(os.path.join(root, name))
+
+            if st.st_nlink > 1:
+                if (st.st_dev, st.st_ino) in seen:
+                    continue
+
+                seen.add((st.st_dev, st.st_ino))
+
+            total += st.st_blocks * 512
+
+    return total
+
+
+def mbr(partitions):
+    # Partition table sector: [(type, start byte, end byte)], CHS unused (LBA only)
+    sector = bytearray(SECTOR_SIZE)
+    struct.pack_into("<I", sector, 440, disk_id)
+
+    for i, (ptype, start, end) in enumerate(partitions):
+        struct.pack_into("<B3sB3sII", sector, 446 + i * 16, 0, b"\xfe\xff\xff", ptype, b"\xfe\xff\xff",
+                         start // SECTOR_SIZE, (end - start) // SECTOR_SIZE)
+
+    sector[510:512] = b"\x55\xaa"
+
+    return bytes(sector)
+
+
+def run(cmd, ok=(0,)):
+    ret = subprocess.run(cmd, env=dict(os.environ, MTOOLS_SKIP_CHECK="1")).returncode
+
+    if ret not in ok:
+        raise OSError(f"{cmd[0]} exited with {ret}")
+
+    return ret
+
+
+def mkfs_ext(fstype, label, source, start, end, uuid=""):
+    # Created in place in the image, from the source dir
+    cmd = ["mkfs", "-t", fstype, "-q", "-F", "-E", f"offset={start}", "-O", FEATURES[fstype], "-L", label, "-d", source]
+
+    if uuid:
+        cmd += ["-U", uuid]
+
+    run(cmd + [image, f"{(end - start) // 1024}k"])
+
+    # 1: errors corrected
+    run(["e2fsck", "-y", "-f", f"{image}?offset={start}"], ok=(0, 1))
+
+
+def mkfs_vfat(source, start, end):
+    # mkfs.vfat and mtools work on files, build it next to the image and splice it in
+    part = f"{image}.boot"
+
+    try:
+        with open(part, "wb") as f:
+            f.truncate(end - start)
+
+        run(["mkfs.vfat", "-n", "BOOT", "-F", "32", "-i", f"{disk_id:08x}", part])
+        entries = [os.path.join(source, name) for name in sorted(os.listdir(source))]
+
+        if entries:
+            run(["mcopy", "-s", "-p", "-m", "-i", part] + entries + ["::/"])
+
+        run(["fsck.vfat", "-n", part])
+
+        with open(part, "rb") as src, open(image, "r+b") as dst:
+            for offset, length, is_data in sparse.extents(src.fileno()):
+                if not is_data:
+                    continue
+
+                src.seek(offset)
+                dst.seek(start + offset)
+
+                while length:
+                    chunk = src.read(min(length, CHUNK_SIZE))
+                    dst.write(chunk)
+                    length -= len(chunk)
+
+    finally:
+        if os.path.exists(part):
+            os.unlink(part)
+
+
+def assemble():
+    boot_dir = os.path.join(rootfs, "boot")
+    has_boot = boot_end > 0
+    root_bytes = tree_size(rootfs, "boot" if has_boot else None)
+
+    # make_image(): rootfs / 1000 KiB + free space + 4 MiB
+    root_start = (boot_end if has_boot else first_partition) * MIB
+    root_end = root_start + (root_bytes // 1000 // 1024 + free_space + 4) * MIB
+    partitions = []
+
+    if has_boot:
+        partitions.append((PARTITION_TYPES[boot_fstype], first_partition * MIB, boot_end * MIB))
+
+    partitions.append((PARTITION_TYPES[root_fstype], root_start, root_end))
+
+    print(f"[i] Image: {root_end // MIB} MiB, root partition {(root_end - root_start) // MIB} MiB ({root_bytes // MIB} MiB used), disk id {disk_id:08x}")
+
+    with open(image, "wb") as f:
+        f.truncate(root_end)
+        f.write(mbr(partitions))
+
+    if not has_boot:
+        mkfs_ext(root_fstype, "ROOTFS", rootfs, root_start, root_end, root_uuid)
+
+        return 0
+
+    # The root filesystem gets an empty /boot (same owner and mode), the contents go to the boot partition
+    staged_boot = os.path.join(os.path.dirname(os.path.abspath(rootfs)), f".{os.path.basename(os.path.abspath(rootfs))}-boot")
+    os.rename(boot_dir, staged_boot)
+
+    try:
+        os.mkdir(boot_dir)
+        shutil.copystat(staged_boot, boot_dir)
+        st = os.stat(staged_boot)
+        os.chown(boot_dir, st.st_uid, st.st_gid)
+
+        mkfs_ext(root_fstype, "ROOTFS", rootfs, root_start, root_end, root_uuid)
+
+    finally:
+        os.rmdir(boot_dir)
+        os.rename(staged_boot, boot_dir)
+
+    if boot_fstype == "vfat":
+        mkfs_vfat(boot_dir, first_partition * MIB, boot_end * MIB)
+
+    else:
+        mkfs_ext(boot_fstype, "BOOT", boot_dir, first_partition * MIB, boot_end * MIB)
+
+    return 0
+
+
+def main(argv):
+    getargs(argv)
+
+    try:
+        assemble()
+
+    except OSError as e:
+        if os.path.exists(image):
+            os.unlink(image)
+
+        bail(f"Cannot assemble: {image}", str(e))
+
+    print(f"[+] Image created: {image} (root PARTUUID {disk_id:08x}-0{2 if boot_end else 1})")
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+
+# ARM Devices ~ https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/devices.yml
+
+###############################################
+# Scalability benchmark for the ./bin/ scripts
+#
+# It writes synthetic catalogs in the devices.yml schema (see the comment
+# at the top of ./devices.yml), runs every ./bin/ script against each of
+# them, and records the wall-clock time and peak memory (max RSS) of every
+# run. Each run is appended as one JSON object per line to the results
+# file, tagged with the git commit, so numbers can be compared across
+# commits.
+#
+# Every script is run twice per catalog: "cold" with an empty catalog
+# cache (see ./bin/catalog.py) and "warm" with the cache populated.
+#
+# Dependencies:
+# sudo apt -y install python3 python3-yaml
+#
+# Usage:
+# ./bin/benchmark.py [-s <sizes>] [-n <max images per board>] [-d <duplicate rate>] [-o <results file>] [-a] [-k]
+# ./bin/benchmark.py -g <output file> [-s <size>] [-n <max images per board>] [-d <duplicate rate>]
+# ./bin/benchmark.py -c <commit> [-o <results file>]
+#
+# E.g.:
+# ./bin/benchmark.py -s 100,1000,10000,100000
+# ./bin/benchmark.py -g /tmp/devices.yml -s 10000 -d 0.3
+# ./bin/benchmark.py -c 6c1cba5
+
+import datetime
+import getopt
+import json
+import lzma
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+bindir = os.path.dirname(os.path.abspath(__file__))
+
+repodir = os.path.dirname(bindir)
+
+sizes = [100, 1000, 10000, 100000]
+
+max_images = 4
+
+dup_rate = 0.2
+
+resultfile = os.path.join(repodir, "logs", "benchmark.jsonl")
+
+generate = ""
+
+compare = ""
+
+artifacts = False
+
+keep = False
+
+seed = 2022
+
+release = "bench"
+
+# Scripts and the arguments they need; {release} and {outdir} are filled in per run
+scripts = [
+    ["generate_devices_stats.py"],
+    ["generate_devices_table.py"],
+    ["generate_images_overview.py"],
+    ["generate_images_stats.py"],
+    ["generate_images_table.py"],
+    ["generate_kernel_stats.py"],
+    ["generate_reports.py", "-r", "{release}", "-o", "{outdir}"],
+    ["pre-release.py", "-i", "devices.yml", "-r", "{release}", "-o", "{outdir}"]
+]
+
+# Only run when artifacts exist for the synthetic images (-a)
+artifact_scripts = [
+    ["post-release.py", "-i", "devices.yml", "-r", "{release}", "-o", "{outdir}"],
+    ["release.py", "-i", "devices.yml", "-r", "{release}", "-o", "{outdir}"]
+]
+
+architectures = ["armel", "armhf", "arm64"]
+
+supports = ["kali", "community", "eol"]
+
+kernels = ["custom", "kali", "vendor"]
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} [-s <sizes>] [-n <max images per board>] [-d <duplicate rate>] [-o <results file>] [-a] [-k]"
+        outstr += f"\n       {prog} -g <output file> [-s <size>] [-n <max images per board>] [-d <duplicate rate>]"
+        outstr += f"\n       {prog} -c <commit> [-o <results file>]"
+        outstr += f"\nE.g. : {prog} -s 100,1000,10000 -n 4 -d 0.2\n"
+
+    print(outstr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global sizes, max_images, dup_rate, resultfile, generate, compare, artifacts, keep
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hs:n:d:o:g:c:ak",
+            [
+                "sizes=",
+                "images=",
+                "duplicates=",
+                "output=",
+                "generate=",
+                "compare=",
+                "artifacts",
+                "keep"
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-s", "--sizes"):
+                sizes = [int(size) for size in arg.split(",")]
+
+            elif opt in ("-n", "--images"):
+                max_images = int(arg)
+
+            elif opt in ("-d", "--duplicates"):
+                dup_rate = float(arg)
+
+            elif opt in ("-o", "--output"):
+                resultfile = arg
+
+            elif opt in ("-g", "--generate"):
+                generate = arg
+
+            elif opt in ("-c", "--compare"):
+                compare = arg
+
+            elif opt in ("-a", "--artifacts"):
+                artifacts = True
+
+            elif opt in ("-k", "--keep"):
+                keep = True
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    except ValueError as e:
+        bail(f"Invalid value: {e}")
+
+    if max_images < 0 or not 0 <= dup_rate <= 1:
+        bail("-n must be >= 0 and -d between 0 and 1")
+
+    return 0
+
+
+def synthetic_catalog(boards, max_images, dup_rate, seed):
+    # Returns the devices.yml text and the list of release (support: kali) image files
+    rnd = random.Random(seed)
+
+    lines = []
+    names = []
+    release_images = []
+
+    # Keep the schema comment from the real catalog, as the scripts have to skip it
+    with open(os.path.join(repodir, "devices.yml")) as f:
+        for line in f:
+            if line.startswith("---"):
+                break
+
+            lines.append(line.rstrip("\n"))
+
+    lines.append("---")
+    lines.append("")
+    lines.append("devices:")
+
+    # Roughly 20 boards per vendor, like the real catalog
+    for b in range(boards):
+        if b % 20 == 0:
+            lines.append(f"  - vendor{b // 20}:")
+
+        lines.append(f'      - board: "board-{b}"')
+        lines.append(f'        name: "Synthetic Board {b}"')
+        lines.append(f'        cpu: "CPU {rnd.randint(1, 50)}"')
+        lines.append(f'        cpu-cores: "{rnd.choice([1, 2, 4, 8])}"')
+        lines.append('        gpu: "Synthetic GPU"')
+        lines.append('        ram: "LPDDR4"')
+        lines.append(f'        ram-size: ["{rnd.choice([512, 1024, 2048])}", "{rnd.choice([4096, 8192])}"]')
+        lines.append('        ethernet: "1"')
+        lines.append('        ethernet-speed: "1000"')
+        lines.append('        wifi: "2.4GHz"')
+        lines.append('        bluetooth: "true"')
+        lines.append('        usb2: "2"')
+        lines.append('        usb3: "1"')
+        lines.append('        storage: ["sdcard", "emmc"]')
+        lines.append('        notes: ""')
+
+        qty = rnd.randint(0, max_images)
+
+        if qty == 0:
+            continue
+
+        lines.append("        images:")
+
+        for i in range(qty):
+            if names and rnd.random() < dup_rate:
+                name = rnd.choice(names)
+
+            else:
+                name = f"Synthetic Board {b} image {i}"
+                names.append(name)
+
+            arch = rnd.choice(architectures)
+            support = rnd.choice(supports)
+            image = f"board-{b}-{i}-{arch}.img"
+
+            if support == "kali":
+                release_images.append(image)
+
+            lines.append(f'          - image: "{image}"')
+            lines.append(f'            name: "{name}"')
+            lines.append(f'            architecture: "{arch}"')
+            lines.append(f'            preferred-image: "{"true" if i == 0 else "false"}"')
+            lines.append(f'            support: "{support}"')
+            lines.append(f'            slug: "board-{b}"')
+            lines.append(f'            build-script: "board-{b}.sh"')
+            lines.append(f'            kernel: "{rnd.choice(kernels)}"')
+            lines.append('            kernel-version: "5.15.44"')
+            lines.append('            image-notes: ""')
+            lines.append("")
+
+    return "\n".join(lines) + "\n", release_images
+
+
+def write_artifacts(outdir, images):
+    # Tiny but valid release artifacts, so post-release.py has something to read
+    os.makedirs(outdir, exist_ok=True)
+
+    payload = lzma.compress(b"\0" * 4096)
+
+    for image in images:
+        filename = os.path.join(outdir, f"kali-linux-{release}-{image}")
+
+        with open(f"{filename}.xz", "wb") as f:
+            f.write(payload)
+
+        with open(f"{filename}.xz.sha256sum", "w") as f:
+            f.write(f"{'0' * 64}  {os.path.basename(filename)}.xz\n")
+
+        with open(f"{filename}.sha256sum", "w") as f:
+            f.write(f"{'0' * 64}  {os.path.basename(filename)}\n")
+
+    return 0
+
+
+def run(cmd, cwd, env):
+    # Run one script and return (wall seconds, peak RSS in KiB, exit code)
+    start = time.perf_counter()
+
+    with open(os.devnull, "w") as devnull:
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=devnull, stderr=subprocess.STDOUT)
+
+    # wait4() gives the rusage of this child only, not of every child so far
+    pid, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+
+    if os.WIFEXITED(status):
+        proc.returncode = os.WEXITSTATUS(status)
+
+    else:
+        proc.returncode = -os.WTERMSIG(status)
+
+    return wall, rusage.ru_maxrss, proc.returncode
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "-C", repodir, "rev-parse", "--short", "HEAD"],
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def benchmark():
+    commit = git_commit()
+    timestamp = datetime.datetime.now().isoformat(timespec="seconds")
+
+    os.makedirs(os.path.dirname(os.path.abspath(resultfile)), exist_ok=True)
+
+    print(f"{'boards':>8} {'script':<28} {'cache':<5} {'seconds':>9} {'max rss (MiB)':>14} {'exit':>5}")
+
+    for boards in sizes:
+        workdir = tempfile.mkdtemp(prefix=f"kali-arm-bench-{boards}-")
+
+        try:
+            content, release_images = synthetic_catalog(boards, max_images, dup_rate, seed)
+
+            with open(os.path.join(workdir, "devices.yml"), "w") as f:
+                f.write(content)
+
+            outdir = os.path.join(workdir, "images")
+
+            todo = list(scripts)
+
+            if artifacts:
+                write_artifacts(outdir, release_images)
+                todo += artifact_scripts
+
+            for script in todo:
+                cmd = [sys.executable, os.path.join(bindir, script[0])]
+                cmd += [arg.format(release=release, outdir=outdir) for arg in script[1:]]
+
+                env = dict(os.environ)
+                env["KALI_ARM_CACHE_DIR"] = os.path.join(workdir, "cache")
+
+                # A fresh cache per script, so "cold" always means a real parse
+                shutil.rmtree(env["KALI_ARM_CACHE_DIR"], ignore_errors=True)
+
+                for cache in ("cold", "warm"):
+                    wall, rss, code = run(cmd, workdir, env)
+
+                    result = {
+                        "commit": commit,
+                        "timestamp": timestamp,
+                        "host": platform.node(),
+                        "python": platform.python_version(),
+                        "script": script[0],
+                        "boards": boards,
+                        "max_images": max_images,
+                        "dup_rate": dup_rate,
+                        "catalog_bytes": len(content),
+                        "cache": cache,
+                        "seconds": round(wall, 4),
+                        "max_rss_kb": rss,
+                        "returncode": code
+                    }
+
+                    with open(resultfile, "a") as f:
+                        f.write(json.dumps(result) + "\n")
+
+                    print(f"{boards:>8} {script[0]:<28} {cache:<5} {wall:>9.3f} {rss / 1024:>14.1f} {code:>5}")
+
+        finally:
+            if keep:
+                print(f"[i] Kept: {workdir}")
+
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n[+] Results appended to: {resultfile}")
+
+    return 0
+
+
+def load_results(file):
+    results = []
+
+    try:
+        with open(file) as f:
+            for line in f:
+                if line.strip():
+                    results.append(json.loads(line))
+
+    except (OSError, ValueError) as e:
+        bail(f"Cannot read results file: {file}", str(e))
+
+    return results
+
+
+def compare_results():
+    # Compare the most recent commit in the results file against an older one
+    results = load_results(resultfile)
+
+    if not results:
+        bail(f"No results in: {resultfile}", "Run the benchmark first")
+
+    current = results[-1]["commit"]
+
+    def index(commit):
+        runs = {}
+
+        for r in results:
+            if r["commit"].startswith(commit):
+                # Later runs of the same commit win
+                runs[(r["script"], r["boards"], r["cache"])] = r
+
+        return runs
+
+    old = index(compare)
+    new = index(current)
+
+    if not old:
+        bail(f"No results for commit: {compare}", f"See: {resultfile}")
+
+    print(f"{compare} -> {current}\n")
+    print(f"{'boards':>8} {'script':<28} {'cache':<5} {'seconds':>20} {'max rss (MiB)':>20}")
+
+    for key in sorted(set(old) & set(new), key=lambda k: (k[1], k[0], k[2])):
+        o, n = old[key], new[key]
+        ratio = n["seconds"] / o["seconds"] if o["seconds"] else 0
+
+        print(f"{key[1]:>8} {key[0]:<28} {key[2]:<5} "
+              f"{o['seconds']:>7.3f} -> {n['seconds']:<7.3f} x{ratio:<4.2f} "
+              f"{o['max_rss_kb'] / 1024:>7.1f} -> {n['max_rss_kb'] / 1024:<7.1f}")
+
+    return 0
+
+
+def main(argv):
+    getargs(argv)
+
+    if generate:
+        content, release_images = synthetic_catalog(sizes[0], max_images, dup_rate, seed)
+
+        with open(generate, "w") as f:
+            f.write(content)
+
+        print(f"[+] Synthetic catalog ({sizes[0]} boards) written: {generate}")
+
+    elif compare:
+        compare_results()
+
+    else:
+        benchmark()
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
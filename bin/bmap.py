@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+
+###############################################
+# Create a block map (.bmap) for an image
+#
+# A bmap lists the blocks of an image that hold data, with a SHA-256 per
+# range, in the format bmaptool (https://github.com/yoctoproject/bmaptool)
+# reads. `bmaptool copy <image>.img.xz /dev/sdX` then only writes those
+# blocks instead of the full img_size from make_image().
+#
+# A block is mapped when it holds data in the image file (SEEK_DATA, see
+# ./bin/sparse.py) and is used by the filesystem it belongs to:
+# - the partitions come from the MBR or GPT
+# - ext2/3/4: the block bitmaps (groups with BLOCK_UNINIT count as used)
+# - vfat: the FAT (FAT12/16/32)
+# Anything else (partition table, gaps, other filesystems) counts as used.
+#
+# Dependencies:
+# sudo apt -y install python3
+#
+# Usage:
+# ./bin/bmap.py <image.img> [<output.bmap>]
+#
+# E.g.:
+# ./bin/bmap.py images/kali-linux-2022.3-raspberry-pi-arm64.img
+#
+# From another script in ./bin/:
+# import bmap
+# ranges = bmap.mapped_ranges("image.img")
+# hasher = bmap.RangeHasher(ranges, os.path.getsize("image.img"))
+# hasher.update(chunk)  # every chunk of the image, in order
+# xml = bmap.render(os.path.getsize("image.img"), ranges, hasher.hexdigests())
+
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+
+import checksums
+import sparse
+
+BLOCK_SIZE = 4096
+
+SECTOR_SIZE = 512
+
+# MBR partition types that are containers or the GPT protective entry
+MBR_EXTENDED = (0x05, 0x0F, 0x85)
+MBR_GPT = 0xEE
+
+EXT_MAGIC = 0xEF53
+EXT_INCOMPAT_META_BG = 0x10
+EXT_INCOMPAT_64BIT = 0x80
+EXT_BG_BLOCK_UNINIT = 0x02
+
+
+def merge(ranges):
+    # Sort and merge overlapping or adjacent (start, end) ranges
+    merged = []
+
+    for start, end in sorted(ranges):
+        if end <= start:
+            continue
+
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def intersect(a, b):
+    # Both merged, returns the merged intersection
+    out = []
+    i = j = 0
+
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+
+        if start < end:
+            out.append((start, end))
+
+        if a[i][1] < b[j][1]:
+            i += 1
+
+        else:
+            j += 1
+
+    return out
+
+
+def bitmap_runs(bitmap, count):
+    # (first, length) of the runs of set bits, least significant bit first
+    runs = []
+    first = -1
+
+    for index, byte in enumerate(bitmap[:(count + 7) // 8]):
+        # Whole bytes that do not end or start a run
+        if (byte == 0xFF and first >= 0) or (byte == 0 and first < 0):
+            continue
+
+        for bit in range(8):
+            i = index * 8 + bit
+
+            if i >= count:
+                break
+
+            if byte >> bit & 1:
+                if first < 0:
+                    first = i
+
+            elif first >= 0:
+                runs.append((first, i - first))
+                first = -1
+
+    if first >= 0:
+        runs.append((first, count - first))
+
+    return runs
+
+
+def partitions(fd):
+    # (start, end) in bytes of every primary MBR or GPT partition
+    mbr = os.pread(fd, SECTOR_SIZE, 0)
+
+    if len(mbr) < SECTOR_SIZE or mbr[510:512] != b"\x55\xaa":
+        return []
+
+    found = []
+
+    for i in range(4):
+        ptype, lba, sectors = struct.unpack_from("<4xB3xII", mbr, 446 + i * 16)
+
+        if ptype == MBR_GPT:
+            return gpt_partitions(fd)
+
+        if ptype and ptype not in MBR_EXTENDED and sectors:
+            found.append((lba * SECTOR_SIZE, (lba + sectors) * SECTOR_SIZE))
+
+    return found
+
+
+def gpt_partitions(fd):
+    header = os.pread(fd, SECTOR_SIZE, SECTOR_SIZE)
+
+    if header[:8] != b"EFI PART":
+        return []
+
+    entries_lba, count, entry_size = struct.unpack_from("<QII", header, 72)
+
+    if entry_size < 128 or count > 1024:
+        return []
+
+    table = os.pread(fd, count * entry_size, entries_lba * SECTOR_SIZE)
+    found = []
+
+    for i in range(len(table) // entry_size):
+        entry = table[i * entry_size:(i + 1) * entry_size]
+
+        # Unused entries have a zero partition type GUID
+        if not any(entry[:16]):
+            continue
+
+        first, last = struct.unpack_from("<QQ", entry, 32)
+        found.append((first * SECTOR_SIZE, (last + 1) * SECTOR_SIZE))
+
+    return found
+
+
+def ext_used(fd, start):
+    # Used byte ranges of an ext2/3/4 filesystem, None if it is not one
+    sb = os.pread(fd, 1024, start + 1024)
+
+    if len(sb) < 1024 or struct.unpack_from("<H", sb, 0x38)[0] != EXT_MAGIC:
+        return None
+
+    blocks, first_data_block, log_block_size, blocks_per_group = struct.unpack_from("<I12xII4xI", sb, 0x04)
+    incompat = struct.unpack_from("<I", sb, 0x60)[0]
+
+    # The group descriptors are scattered with meta_bg, not worth it for our images
+    if incompat & EXT_INCOMPAT_META_BG or not blocks_per_group:
+        return None
+
+    desc_size = 32
+
+    if incompat & EXT_INCOMPAT_64BIT:
+        desc_size = max(32, struct.unpack_from("<H", sb, 0xFE)[0])
+        blocks |= struct.unpack_from("<I", sb, 0x150)[0] << 32
+
+    block_size = 1024 << log_block_size
+    groups = (blocks - first_data_block + blocks_per_group - 1) // blocks_per_group
+
+    descs = os.pread(fd, groups * desc_size, start + (first_data_block + 1) * block_size)
+
+    if len(descs) < groups * desc_size:
+        return None
+
+    # The boot block in front of the first group (1 KiB block size)
+    used = [(start, start + first_data_block * block_size)]
+
+    for group in range(groups):
+        desc = descs[group * desc_size:(group + 1) * desc_size]
+        bitmap_block = struct.unpack_from("<I", desc, 0x00)[0]
+        flags = struct.unpack_from("<H", desc, 0x12)[0]
+
+        if desc_size >= 64:
+            bitmap_block |= struct.unpack_from("<I", desc, 0x20)[0] << 32
+
+        first = first_data_block + group * blocks_per_group
+        count = min(blocks_per_group, blocks - first)
+
+        if flags & EXT_BG_BLOCK_UNINIT:
+            # No bitmap on disk yet, leave it to the data extents
+            runs = [(0, count)]
+
+        else:
+            runs = bitmap_runs(os.pread(fd, block_size, start + bitmap_block * block_size), count)
+
+        for run, length in runs:
+            offset = start + (first + run) * block_size
+            used.append((offset, offset + length * block_size))
+
+    return used
+
+
+def fat_used(fd, start):
+    # Used byte ranges of a FAT12/16/32 filesystem, None if it is not one
+    boot = os.pread(fd, SECTOR_SIZE, start)
+
+    if len(boot) < SECTOR_SIZE or boot[510:512] != b"\x55\xaa":
+        return None
+
+    if boot[54:57] != b"FAT" and boot[82:85] != b"FAT":
+        return None
+
+    sector_size, cluster_sectors, reserved, fats, root_entries, total, fat_sectors = struct.unpack_from("<HBHBHH1xH", boot, 11)
+
+    if not total:
+        total = struct.unpack_from("<I", boot, 32)[0]
+
+    if not fat_sectors:
+        fat_sectors = struct.unpack_from("<I", boot, 36)[0]
+
+    if sector_size not in (512, 1024, 2048, 4096) or not cluster_sectors or not fats or not fat_sectors:
+        return None
+
+    root_sectors = (root_entries * 32 + sector_size - 1) // sector_size
+    data_start = reserved + fats * fat_sectors + root_sectors
+
+    if total <= data_start:
+        return None
+
+    clusters = (total - data_start) // cluster_sectors
+    cluster_size = cluster_sectors * sector_size
+
+    fat = os.pread(fd, fat_sectors * sector_size, start + reserved * sector_size)
+
+    # The FAT type only depends on the number of clusters
+    if clusters < 4085:
+        entries = []
+
+        for n in range(clusters + 2):
+            offset = n * 3 // 2
+
+            if offset + 1 >= len(fat):
+                break
+
+            value = fat[offset] | fat[offset + 1] << 8
+            entries.append(value >> 4 if n & 1 else value & 0xFFF)
+
+    elif clusters < 65525:
+        entries = struct.unpack_from(f"<{min(clusters + 2, len(fat) // 2)}H", fat)
+
+    else:
+        entries = [value & 0x0FFFFFFF for value in struct.unpack_from(f"<{min(clusters + 2, len(fat) // 4)}I", fat)]
+
+    # Boot sector, FATs and the FAT12/16 root directory
+    used = [(start, start + data_start * sector_size)]
+    data = start + data_start * sector_size
+
+    for n in range(2, len(entries)):
+        if entries[n]:
+            offset = data + (n - 2) * cluster_size
+            used.append((offset, offset + cluster_size))
+
+    return used
+
+
+def used_ranges(fd, size):
+    # Byte ranges the filesystems use, plus everything outside a known filesystem
+    used = []
+    known = []
+
+    for start, end in partitions(fd):
+        end = min(end, size)
+
+        if start >= end:
+            continue
+
+        ranges = ext_used(fd, start)
+
+        if ranges is None:
+            ranges = fat_used(fd, start)
+
+        if ranges is None:
+            continue
+
+        known.append((start, end))
+        used += [(max(s, start), min(e, end)) for s, e in ranges]
+
+    # Gaps between the known filesystems: partition table, bootloaders, ...
+    position = 0
+
+    for start, end in merge(known):
+        used.append((position, start))
+        position = end
+
+    used.append((position, size))
+
+    return merge(used)
+
+
+def mapped_ranges(image):
+    # (first block, last block) of every mapped range, inclusive like bmaptool
+    with open(image, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        data = merge((offset, offset + length) for offset, length, is_data in sparse.extents(f.fileno(), size) if is_data)
+        used = used_ranges(f.fileno(), size)
+
+    blocks = merge((start // BLOCK_SIZE, (end + BLOCK_SIZE - 1) // BLOCK_SIZE) for start, end in intersect(data, used))
+
+    return [(first, end - 1) for first, end in blocks]
+
+
+class RangeHasher:
+    # SHA-256 of every mapped range, fed with the whole image in order
+    def __init__(self, ranges, size):
+        self.ranges = [(first * BLOCK_SIZE, min((last + 1) * BLOCK_SIZE, size)) for first, last in ranges]
+        self.hashes = [hashlib.sha256() for r in ranges]
+        self.offset = 0
+        self.index = 0
+
+    def update(self, chunk):
+        end = self.offset + len(chunk)
+
+        while self.index < len(self.ranges):
+            start, stop = self.ranges[self.index]
+
+            if start >= end:
+                break
+
+            lo = max(start, self.offset)
+            hi = min(stop, end)
+
+            if lo < hi:
+                self.hashes[self.index].update(chunk[lo - self.offset:hi - self.offset])
+
+            if stop > end:
+                break
+
+            self.index += 1
+
+        self.offset = end
+
+    def hexdigests(self):
+        return [h.hexdigest() for h in self.hashes]
+
+
+def human(size):
+    for unit in ("bytes", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            break
+
+        size /= 1024
+
+    return f"{size:.1f} {unit}"
+
+
+def render(size, ranges, digests):
+    # bmap format 2.0, as written by `bmaptool create`
+    blocks = (size + BLOCK_SIZE - 1) // BLOCK_SIZE
+    mapped = sum(last - first + 1 for first, last in ranges)
+    percent = mapped * 100 / max(blocks, 1)
+
+    xml = '<?xml version="1.0" ?>\n'
+    xml += '<!-- Block map of an image file: the blocks that hold data and their\n'
+    xml += '     SHA-256, so that flashing can skip the rest. See bmaptool. -->\n'
+    xml += '<bmap version="2.0">\n'
+    xml += f'    <!-- Image size in bytes: {human(size)} -->\n'
+    xml += f'    <ImageSize> {size} </ImageSize>\n\n'
+    xml += '    <!-- Size of a block in bytes -->\n'
+    xml += f'    <BlockSize> {BLOCK_SIZE} </BlockSize>\n\n'
+    xml += '    <!-- Count of blocks in the image file -->\n'
+    xml += f'    <BlocksCount> {blocks} </BlocksCount>\n\n'
+    xml += f'    <!-- Count of mapped blocks: {human(mapped * BLOCK_SIZE)} or {percent:.1f}% -->\n'
+    xml += f'    <MappedBlocksCount> {mapped} </MappedBlocksCount>\n\n'
+    xml += '    <!-- Type of checksum used in this file -->\n'
+    xml += '    <ChecksumType> sha256 </ChecksumType>\n\n'
+    xml += '    <!-- The checksum of this bmap file, with this field set to all zeros -->\n'
+    xml += '    <BmapFileChecksum> {} </BmapFileChecksum>\n\n'
+    xml += '    <!-- The block ranges which are mapped (contain data) in the image -->\n'
+    xml += '    <BlockMap>\n'
+
+    for (first, last), digest in zip(ranges, digests):
+        blockrange = f"{first}-{last}" if last > first else f"{first}"
+        xml += f'        <Range chksum="{digest}"> {blockrange} </Range>\n'
+
+    xml += '    </BlockMap>\n'
+    xml += '</bmap>\n'
+
+    # Same as bmaptool: hash the file with a zero checksum, then fill it in
+    checksum = hashlib.sha256(xml.format("0" * 64).encode()).hexdigest()
+
+    return xml.format(checksum)
+
+
+def write_bmap(xml, file):
+    # Temporary file and rename, a crash never leaves a truncated bmap
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file)), prefix=".bmap-")
+
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(xml)
+
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, file)
+
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+    return 0
+
+
+def create(image):
+    # Map and hash an image on its own, returns the bmap XML
+    size = os.path.getsize(image)
+    ranges = mapped_ranges(image)
+    hasher = RangeHasher(ranges, size)
+
+    for chunk in checksums.read_chunks(image):
+        hasher.update(chunk)
+
+    return render(size, ranges, hasher.hexdigests())
+
+
+def main(argv):
+    if len(argv) not in (1, 2) or argv[0] in ("-h", "--help"):
+        print(f"\nUsage: {sys.argv[0]} <image.img> [<output.bmap>]\n")
+        sys.exit(2)
+
+    image = argv[0]
+    output = argv[1] if len(argv) == 2 else f"{image}.bmap"
+
+    try:
+        xml = create(image)
+        write_bmap(xml, output)
+
+    except OSError as e:
+        print(f"[-] {image}: {e.strerror}")
+        exit(1)
+
+    print(f"[+] {output}")
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+
+###############################################
+# debootstrap first stage (--foreign) from packages fetched beforehand
+#
+# debootstrap downloads, checks and unpacks the base system one package
+# at a time. This takes the packages of a build from the plan of
+# ./bin/resolve-packages.py (-o), and their .debs from a local pool (-D,
+# filled by resolve-packages.py -f -D), and with -j workers:
+# - checks every .deb against the Size and SHA256 of the Packages index
+# - copies it (hardlinks when possible) to /var/cache/apt/archives
+# - extracts the data of the "required" ones into the target
+#   (`dpkg-deb --fsys-tarfile | tar`)
+# then leaves the target as `debootstrap --foreign` does: merged /usr,
+# empty dpkg status, /etc/fstab, sources.list, and /debootstrap with the
+# host's debootstrap, functions and suite script, and the arch, suite,
+# mirror, required, base and debpaths files. The second stage is the usual
+# one, in the target: /debootstrap/debootstrap --second-stage.
+#
+# The required packages are extracted in parallel, in no particular order.
+# Files several of them ship are overwritten by dpkg in the second stage.
+#
+# Dependencies:
+# sudo apt -y install python3 debootstrap dpkg tar
+#
+# Usage:
+# ./bin/bootstrap.py -p <plan.json> -D <pool dir> -a <architecture> [-b <build-script>] [-s <suite>] [-u <mirror URL>]
+#                    [-c <components>] [-j <jobs>] [-S] <target dir>
+#
+# E.g.:
+# ./bin/resolve-packages.py -p local/indexes -a arm64 -o local/packages.json -f -D local/pool
+# sudo ./bin/bootstrap.py -p local/packages.json -D local/pool -a arm64 -j 8 base/rpi/working
+# sudo systemd-nspawn -D base/rpi/working /debootstrap/debootstrap --second-stage
+
+import concurrent.futures
+import getopt
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+planfile = ""
+
+pooldir = ""
+
+architecture = ""
+
+script = ""
+
+suite = "kali-rolling"
+
+mirror = ""
+
+components = "main,contrib,non-free,non-free-firmware"
+
+jobs = os.cpu_count() or 1
+
+merged_usr = True
+
+target = ""
+
+DEBOOTSTRAP = "/usr/sbin/debootstrap"
+
+DEBOOTSTRAP_DIR = "/usr/share/debootstrap"
+
+ARCHIVES = "var/cache/apt/archives"
+
+CHUNK_SIZE = 1 << 20
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} -p <plan.json> -D <pool dir> -a <architecture> [-b <build-script>] [-s <suite>] [-u <mirror URL>]"
+        outstr += "\n       [-c <components>] [-j <jobs>] [-S] <target dir>"
+        outstr += f"\nE.g. : {prog} -p local/packages.json -D local/pool -a arm64 -j 8 base/rpi/working\n"
+
+    print(outstr, file=sys.stderr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global planfile, pooldir, architecture, script, suite, mirror, components, jobs, merged_usr, target
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hp:D:a:b:s:u:c:j:S",
+            [
+                "plan=",
+                "pool=",
+                "arch=",
+                "build-script=",
+                "suite=",
+                "mirror=",
+                "components=",
+                "jobs=",
+                "split-usr"
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-p", "--plan"):
+                planfile = arg
+
+            elif opt in ("-D", "--pool"):
+                pooldir = arg
+
+            elif opt in ("-a", "--arch"):
+                architecture = arg
+
+            elif opt in ("-b", "--build-script"):
+                script = os.path.basename(arg)
+
+            elif opt in ("-s", "--suite"):
+                suite = arg
+
+            elif opt in ("-u", "--mirror"):
+                mirror = arg.rstrip("/")
+
+            elif opt in ("-c", "--components"):
+                components = arg
+
+            elif opt in ("-j", "--jobs"):
+                jobs = int(arg)
+
+            elif opt in ("-S", "--split-usr"):
+                merged_usr = False
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    except ValueError as e:
+        bail(f"Invalid value: {e}")
+
+    if not planfile or not pooldir or not architecture:
+        bail("Missing required arguments: -p/--plan, -D/--pool and -a/--arch")
+
+    if len(args) != 1:
+        bail("Missing target dir")
+
+    if jobs < 1:
+        bail("Jobs must be positive")
+
+    target = os.path.abspath(args[0])
+
+    return 0
+
+
+def load_plan():
+    # (required, base, {name: deb}) of the build-script on architecture, else of the first build on it
+    try:
+        with open(planfile) as f:
+            plan = json.load(f)
+
+    except (OSError, ValueError) as e:
+        bail(f"Cannot read {planfile}", str(e))
+
+    builds = [entry for entry in plan.get("builds", []) if entry["architecture"] == architecture]
+    chosen = [entry for entry in builds if entry["script"] == script] or builds
+
+    if not chosen:
+        bail(f"No {architecture} build in {planfile}")
+
+    if "bootstrap" not in chosen[0]:
+        bail(f"No first stage packages in {planfile}", "Make it again with ./bin/resolve-packages.py -o")
+
+    if script and chosen[0]["script"] != script:
+        print(f"[i] No {script} in {planfile}, using the packages of {chosen[0]['script']}", file=sys.stderr)
+
+    debs = {deb["package"]: deb for deb in plan.get("debs", {}).get(architecture, [])}
+    required = chosen[0]["required"]
+    base = [name for name in chosen[0]["bootstrap"] if name not in set(required)]
+    absent = [name for name in required + base if name not in debs]
+
+    if absent:
+        bail("Packages without a .deb in the plan", ", ".join(absent))
+
+    return required, base, debs, plan.get("mirror", "")
+
+
+def check(deb):
+    # Size and SHA256 of the pool file against the index
+    path = os.path.join(pooldir, deb["filename"])
+    h = hashlib.sha256()
+
+    if os.path.getsize(path) != deb["size"]:
+        raise OSError(f"{path}: {os.path.getsize(path)} bytes, {deb['size']} expected")
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+
+    if deb["sha256"] and h.hexdigest() != deb["sha256"]:
+        raise OSError(f"{path}: SHA256 mismatch")
+
+    return path
+
+
+def install_deb(deb, extract):
+    # Check, copy to the archives and maybe extract one .deb; its path in the target
+    path = check(deb)
+    name = os.path.basename(deb["filename"])
+    dest = os.path.join(target, ARCHIVES, name)
+
+    if os.path.exists(dest):
+        os.unlink(dest)
+
+    try:
+        os.link(path, dest)
+
+    except OSError:
+        shutil.copyfile(path, dest)
+
+    if extract:
+        # As debootstrap's extract_dpkg_deb_data(), keeping the merged /usr symlinks
+        unpack = subprocess.Popen(["dpkg-deb", "--fsys-tarfile", dest], stdout=subprocess.PIPE)
+        untar = subprocess.run(["tar", "--numeric-owner", "--keep-directory-symlink", "-C", target, "-xpf", "-"],
+                               stdin=unpack.stdout)
+        unpack.stdout.close()
+
+        if unpack.wait() != 0 or untar.returncode != 0:
+            raise OSError(f"Cannot extract {name}")
+
+    return f"/{ARCHIVES}/{name}"
+
+
+def prepare():
+    # Target layout before the packages go in
+    for directory in (ARCHIVES + "/partial", "var/lib/dpkg", "etc/apt", "debootstrap", "dev", "proc", "sys"):
+        os.makedirs(os.path.join(target, directory), exist_ok=True)
+
+    if merged_usr:
+        # debootstrap's setup_merged_usr(), the same for the arm architectures
+        for directory in ("bin", "sbin", "lib"):
+            os.makedirs(os.path.join(target, "usr", directory), exist_ok=True)
+
+            if not os.path.lexists(os.path.join(target, directory)):
+                os.symlink(f"usr/{directory}", os.path.join(target, directory))
+
+
+def finish(required, base, debpaths, source):
+    # What `debootstrap --foreign` leaves for the second stage
+    suite_script = os.path.realpath(os.path.join(DEBOOTSTRAP_DIR, "scripts", suite))
+
+    for path in (DEBOOTSTRAP, os.path.join(DEBOOTSTRAP_DIR, "functions"), suite_script):
+        if not os.path.isfile(path):
+            raise OSError(f"No {path}, is debootstrap installed?")
+
+    directory = os.path.join(target, "debootstrap")
+    shutil.copy(DEBOOTSTRAP, os.path.join(directory, "debootstrap"))
+    shutil.copy(os.path.join(DEBOOTSTRAP_DIR, "functions"), os.path.join(directory, "functions"))
+    shutil.copy(suite_script, os.path.join(directory, "suite-script"))
+    os.chmod(os.path.join(directory, "debootstrap"), 0o755)
+
+    for name, value in (("arch", architecture), ("suite", suite), ("codename", suite), ("mirror", source),
+                        ("required", " ".join(required)), ("base", " ".join(base))):
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(f"{value}\n")
+
+    with open(os.path.join(directory, "debpaths"), "w") as f:
+        for name in required + base:
+            f.write(f"{name} {debpaths[name]}\n")
+
+    for name in ("status", "available"):
+        open(os.path.join(target, "var/lib/dpkg", name), "a").close()
+
+    if not os.path.exists(os.path.join(target, "etc/fstab")):
+        with open(os.path.join(target, "etc/fstab"), "w") as f:
+            f.write("# UNCONFIGURED FSTAB FOR BASE SYSTEM\n")
+
+    with open(os.path.join(target, "etc/apt/sources.list"), "w") as f:
+        f.write(f"deb {source} {suite} {components.replace(',', ' ')}\n")
+
+    for name in ("resolv.conf", "hostname"):
+        if os.path.isfile(os.path.join("/etc", name)) and not os.path.exists(os.path.join(target, "etc", name)):
+            shutil.copyfile(os.path.join("/etc", name), os.path.join(target, "etc", name))
+
+
+def main(argv):
+    getargs(argv)
+
+    required, base, debs, plan_mirror = load_plan()
+    source = mirror or plan_mirror or "http://http.kali.org/kali"
+
+    try:
+        prepare()
+
+    except OSError as e:
+        bail(f"Cannot prepare {target}", str(e))
+
+    debpaths = {}
+    failed = []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(install_deb, debs[name], name in required): name for name in required + base}
+
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+
+            try:
+                debpaths[name] = future.result()
+
+            except OSError as e:
+                failed.append(name)
+                print(f"[-] {name}: {e}", file=sys.stderr)
+
+    if failed:
+        bail(f"{len(failed)} package(s) failed", ", ".join(sorted(failed)))
+
+    try:
+        finish(required, base, debpaths, source)
+
+    except OSError as e:
+        bail("Cannot write /debootstrap", str(e))
+
+    print(f"[+] First stage: {len(required)} required package(s) extracted, {len(base)} more for the second stage, in {target}")
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+
+###############################################
+# Where the build time goes, from the timing events of many builds
+#
+# Every build appends its events to "logs/events.jsonl" (events_file in
+# ./common.d/variables.sh), one JSON object per line:
+# - scope "step"  : from one status line to the next
+# - scope "stage3": from one status_stage3 line to the next, inside the container
+# - scope "build" : the whole build, with its result (ok/failed)
+# - scope "cgroup": a command run by limit_cpu, with the CPU time, peak
+#   memory and bytes read/written it used (see ./bin/cgroup-run.py)
+# All of them carry the build id, release, image, architecture and host.
+#
+# The steps are grouped into stages (debootstrap, third-stage, rsync,
+# mkfs, fsck, compress, ...) by name, see STAGES. The .img and .img.xz
+# sha256sums are computed while compressing (./bin/compress-image.py), so
+# they are part of the compress stage.
+#
+# Reports:
+# - per stage: number of builds, p50/p90/p99/max, and share of the build time
+# - per step run in a cgroup: p50/max of the CPU time, peak memory and I/O
+# - the critical path of a release: the build that finished last, and
+#   where its time went
+# - with -b/-B: the p50 of every stage against a baseline (a previous
+#   release in the same files, or other event files)
+#
+# Dependencies:
+# sudo apt -y install python3 python3-yaml
+#
+# Usage:
+# ./bin/build-stats.py [-r <release>] [-b <baseline release>] [-B <baseline events file>]... [-s] [-o <output.json>] <events file or directory>...
+#
+# E.g.:
+# ./bin/build-stats.py logs/events.jsonl
+# ./bin/build-stats.py -r 2022.3 -b 2022.2 farm-logs/
+
+import collections
+import getopt
+import json
+import os
+import re
+import sys
+
+import build
+
+release = ""
+
+baseline_release = ""
+
+baseline_files = []
+
+steps = False  # Report every step (-s) instead of the stages
+
+outputfile = ""
+
+inputs = []
+
+# Stage of a step, first match wins; other steps are "other"
+STAGES = [
+    ("debootstrap", re.compile(r"debootstrap", re.I)),
+    ("rootfs-cache", re.compile(r"rootfs snapshot", re.I)),
+    ("third-stage", re.compile(r"third stage", re.I)),
+    ("partitions", re.compile(r"disk partitions|loop device|create the dirs", re.I)),
+    ("mkfs", re.compile(r"^formatting partitions", re.I)),
+    ("rsync", re.compile(r"^rsyncing", re.I)),
+    ("fsck", re.compile(r"^check filesystem", re.I)),
+    ("compress", re.compile(r"^compressing|sha256sum", re.I)),
+    ("clean-up", re.compile(r"^clean up", re.I))
+]
+
+PERCENTILES = [50, 90, 99]
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} [-r <release>] [-b <baseline release>] [-B <baseline events file>]... [-s] [-o <output.json>] <events file or directory>..."
+        outstr += f"\nE.g. : {prog} -r 2022.3 -b 2022.2 logs/events.jsonl\n"
+
+    print(outstr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global release, baseline_release, baseline_files, steps, outputfile, inputs
+
+    try:
+        opts, inputs = getopt.getopt(
+            argv,
+            "hr:b:B:so:",
+            [
+                "release=",
+                "baseline=",
+                "baseline-file=",
+                "steps",
+                "output="
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    for opt, arg in opts:
+        if opt == "-h":
+            bail()
+
+        elif opt in ("-r", "--release"):
+            release = arg
+
+        elif opt in ("-b", "--baseline"):
+            baseline_release = arg
+
+        elif opt in ("-B", "--baseline-file"):
+            baseline_files.append(arg)
+
+        elif opt in ("-s", "--steps"):
+            steps = True
+
+        elif opt in ("-o", "--output"):
+            outputfile = arg
+
+        else:
+            bail(f"Unrecognised argument: {opt}")
+
+    if not inputs:
+        bail("Missing events file")
+
+    if baseline_release and baseline_files:
+        bail("Use either -b or -B")
+
+    return 0
+
+
+def stage(step):
+    for name, pattern in STAGES:
+        if pattern.search(step):
+            return name
+
+    return "other"
+
+
+def read_events(paths):
+    # Events of every file (directories: their *.jsonl files), bad lines skipped
+    events = []
+    files = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".jsonl"))
+
+        else:
+            files.append(path)
+
+    for file in files:
+        try:
+            with open(file) as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                        event["seconds"] = float(event["end"]) - float(event["start"])
+                        events.append(event)
+
+                    except (ValueError, KeyError, TypeError):
+                        continue
+
+        except OSError as e:
+            bail(f"Cannot read events file: {file}", str(e))
+
+    return events
+
+
+class Builds:
+    # Events grouped by build
+    def __init__(self, events, release=""):
+        self.builds = collections.OrderedDict()
+
+        for event in events:
+            if release and event.get("release") != release:
+                continue
+
+            entry = self.builds.setdefault(event["build"], {"build": None, "steps": [], "cgroups": []})
+
+            if event.get("scope") == "build":
+                entry["build"] = event
+
+            elif event.get("scope") == "cgroup":
+                entry["cgroups"].append(event)
+
+            else:
+                entry["steps"].append(event)
+
+    def finished(self):
+        # Builds that got to clean_build
+        return [entry for entry in self.builds.values() if entry["build"]]
+
+    def durations(self):
+        # {stage or step: [seconds per build]}, a stage seen twice in a build is summed
+        found = collections.defaultdict(list)
+
+        for entry in self.finished():
+            totals = collections.OrderedDict()
+
+            for event in entry["steps"]:
+                if steps:
+                    name = f"{'  ' if event['scope'] == 'stage3' else ''}{event['step'].strip()}"
+
+                elif event["scope"] == "stage3":
+                    # Already counted in the third-stage step around it
+                    continue
+
+                else:
+                    name = stage(event["step"])
+
+                totals[name] = totals.get(name, 0) + event["seconds"]
+
+            for name, seconds in totals.items():
+                found[name].append(seconds)
+
+        return found
+
+
+def percentile(values, p):
+    # Linear interpolation between the closest ranks
+    values = sorted(values)
+
+    if not values:
+        return 0
+
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+def stage_stats(builds):
+    # [(name, stats)] in first seen order
+    total = sum(entry["build"]["seconds"] for entry in builds.finished())
+    stats = []
+
+    for name, values in builds.durations().items():
+        row = {"builds": len(values), "max": max(values), "share": sum(values) / total if total else 0}
+
+        for p in PERCENTILES:
+            row[f"p{p}"] = percentile(values, p)
+
+        stats.append((name, row))
+
+    return stats
+
+
+def resource_stats(builds):
+    # [(step, stats)] of the commands run in a cgroup
+    found = collections.OrderedDict()
+
+    for entry in builds.finished():
+        for event in entry["cgroups"]:
+            found.setdefault(event.get("step") or event.get("command", ""), []).append(event)
+
+    stats = []
+
+    for name, events in found.items():
+        row = {"runs": len(events)}
+
+        for key in ("cpu_seconds", "memory_peak", "read_bytes", "written_bytes"):
+            values = [float(event.get(key, 0)) for event in events]
+            row[key] = {"p50": percentile(values, 50), "max": max(values)}
+
+        row["oom_kills"] = sum(int(event.get("oom_kills", 0)) for event in events)
+        stats.append((name, row))
+
+    return stats
+
+
+def critical_path(builds):
+    # The build that finished last decides when a release run is done
+    finished = builds.finished()
+
+    if not finished:
+        return None
+
+    start = min(entry["build"]["start"] for entry in finished)
+    last = max(finished, key=lambda entry: entry["build"]["end"])
+    breakdown = collections.OrderedDict()
+
+    for event in last["steps"]:
+        if event["scope"] == "step":
+            name = stage(event["step"])
+            breakdown[name] = breakdown.get(name, 0) + event["seconds"]
+
+    return {
+        "build": last["build"]["build"],
+        "image": last["build"]["image"],
+        "arch": last["build"]["arch"],
+        "host": last["build"]["host"],
+        "queued": last["build"]["start"] - start,
+        "seconds": last["build"]["seconds"],
+        "makespan": last["build"]["end"] - start,
+        "stages": breakdown
+    }
+
+
+def fmt(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+
+    return build.duration(seconds)
+
+
+def size(value):
+    return f"{value / (1 << 20):.0f} MiB"
+
+
+def report(builds, baseline):
+    finished = builds.finished()
+    results = collections.Counter(entry["build"].get("result", "ok") for entry in finished)
+    totals = [entry["build"]["seconds"] for entry in finished]
+    stats = stage_stats(builds)
+
+    print(f"[i] Builds: {len(finished)} ({', '.join(f'{n} {result}' for result, n in results.items()) or 'none'}), {len(builds.builds) - len(finished)} unfinished")
+
+    if totals:
+        print(f"[i] Build time: p50 {fmt(percentile(totals, 50))}, p90 {fmt(percentile(totals, 90))}, max {fmt(max(totals))}")
+
+    rows = [("Step" if steps else "Stage", "Builds") + tuple(f"p{p}" for p in PERCENTILES) + ("Max", "Share")]
+
+    for name, row in stats:
+        rows.append((name, str(row["builds"])) + tuple(fmt(row[f"p{p}"]) for p in PERCENTILES) + (fmt(row["max"]), f"{row['share'] * 100:.1f}%"))
+
+    print("")
+
+    for line in build.table(rows):
+        print(line)
+
+    resources = resource_stats(builds)
+
+    if resources:
+        rows = [("Command step", "Runs", "CPU p50", "CPU max", "Memory max", "Read max", "Written max", "OOM kills")]
+
+        for name, row in resources:
+            rows.append((name.strip(), str(row["runs"]), fmt(row["cpu_seconds"]["p50"]), fmt(row["cpu_seconds"]["max"]),
+                         size(row["memory_peak"]["max"]), size(row["read_bytes"]["max"]), size(row["written_bytes"]["max"]), str(row["oom_kills"])))
+
+        print("")
+
+        for line in build.table(rows):
+            print(line)
+
+    path = critical_path(builds)
+
+    if path:
+        print(f"\nCritical path: {path['image']} ({path['arch']}) on {path['host']}, started at +{fmt(path['queued'])}, finished at +{fmt(path['makespan'])}")
+
+        for name, seconds in sorted(path["stages"].items(), key=lambda item: -item[1]):
+            share = seconds / path["seconds"] if path["seconds"] else 0
+            print(f"  - {name:<14}: {fmt(seconds):>9} ({share * 100:.1f}%)")
+
+    comparison = []
+
+    if baseline:
+        before = dict(stage_stats(baseline))
+        rows = [("Step" if steps else "Stage", "Baseline p50", "p50", "Change")]
+
+        for name, row in stats:
+            if name not in before:
+                continue
+
+            old = before[name]["p50"]
+            change = (row["p50"] - old) / old * 100 if old else 0
+            comparison.append({"name": name, "baseline_p50": old, "p50": row["p50"], "change": change})
+            rows.append((name, fmt(old), fmt(row["p50"]), f"{change:+.1f}%"))
+
+        old_totals = [entry["build"]["seconds"] for entry in baseline.finished()]
+
+        if old_totals and totals:
+            old = percentile(old_totals, 50)
+            change = (percentile(totals, 50) - old) / old * 100 if old else 0
+            rows.append(("(build)", fmt(old), fmt(percentile(totals, 50)), f"{change:+.1f}%"))
+
+        print("")
+
+        for line in build.table(rows):
+            print(line)
+
+    return {"stages": dict(stats), "resources": dict(resources), "critical_path": path, "comparison": comparison}
+
+
+def main(argv):
+    getargs(argv)
+
+    events = read_events(inputs)
+    builds = Builds(events, release)
+
+    if not builds.builds:
+        bail(f"No events{' for release ' + release if release else ''} in: {', '.join(inputs)}", "Is events_file set for the builds?")
+
+    baseline = None
+
+    if baseline_release:
+        baseline = Builds(events, baseline_release)
+
+    elif baseline_files:
+        baseline = Builds(read_events(baseline_files))
+
+    result = report(builds, baseline)
+
+    if outputfile:
+        with open(outputfile, "w") as f:
+            json.dump(result, f, indent=2)
+
+        print(f"\nStats file created\t: {outputfile}")
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
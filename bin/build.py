@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+
+# ARM Devices ~ https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/devices.yml
+
+###############################################
+# Build the images listed in devices.yml, several at a time
+#
+# Selects the images by support level, architecture and vendor, and runs
+# their build-script (once per build-script and architecture). Builds run
+# at the same time as long as the host has room for one more:
+# - CPU cores   : each build gets -c cores, passed as cpu_cores with
+#                 cpu_limit=100, so compression stays within its share
+# - RAM         : --ram GiB per build, out of MemAvailable
+# - disk        : --base-disk GiB free in base/ and --image-disk GiB free
+#                 in images/ per build (counted once if they share a filesystem)
+# - loop devices: one free loop device per build (make_loop())
+# The resources are reserved, out of what was free at the start, when a
+# build starts and released when it ends. The free RAM, disk and loop
+# devices are also checked live before starting the next one, as other
+# processes use them too.
+#
+# Every attempt is logged to "<logdir>/<build-script>-<architecture>.log".
+# A failed build is retried (-R), and a summary table is printed at the end.
+#
+# Build scripts run from the repository directory (-d), so a directory
+# with a devices.yml and stub build scripts can be used to test this.
+#
+# Dependencies:
+# sudo apt -y install python3 python3-yaml
+#
+# Usage:
+# ./bin/build.py [-i <input file>] [-s <support>] [-a <architecture>] [-V <vendor>]
+#                [-j <jobs>] [-c <cores per job>] [-R <retries>] [-l <log dir>] [-d <repo dir>]
+#                [--ram <GiB>] [--base-disk <GiB>] [--image-disk <GiB>] [-n] [-- <build script options>]
+#
+# E.g.:
+# ./bin/build.py -s kali -a arm64,armhf -j 8 -c 8
+# ./bin/build.py -V raspberrypi -n
+# ./bin/build.py -s kali -- --minimal
+
+import collections
+import datetime
+import getopt
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import catalog
+
+repodir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+inputfile = ""
+
+logdir = ""
+
+supports = ["kali"]
+
+architectures = []
+
+vendors = []
+
+jobs = 0  # Builds at the same time, 0 = as many as the resources allow
+
+cores_per_job = 4
+
+retries = 1
+
+ram_per_job = 4  # GiB
+
+base_disk_per_job = 16  # GiB
+
+image_disk_per_job = 8  # GiB
+
+dry_run = False
+
+script_args = ["--no-colour"]
+
+poll_interval = 1.0
+
+GiB = 1 << 30
+
+Job = collections.namedtuple("Job", ["script", "architecture", "vendors", "images"])
+
+Result = collections.namedtuple("Result", ["job", "status", "attempts", "seconds", "log"])
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} [-i <input file>] [-s <support>] [-a <architecture>] [-V <vendor>]"
+        outstr += "\n         [-j <jobs>] [-c <cores per job>] [-R <retries>] [-l <log dir>] [-d <repo dir>]"
+        outstr += "\n         [--ram <GiB>] [--base-disk <GiB>] [--image-disk <GiB>] [-n] [-- <build script options>]"
+        outstr += f"\nE.g. : {prog} -s kali -a arm64,armhf -j 8 -c 8\n"
+
+    print(outstr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global inputfile, logdir, supports, architectures, vendors, jobs, cores_per_job, retries
+    global ram_per_job, base_disk_per_job, image_disk_per_job, dry_run, repodir
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hi:s:a:V:j:c:R:l:d:n",
+            [
+                "inputfile=",
+                "support=",
+                "arch=",
+                "vendor=",
+                "jobs=",
+                "cores=",
+                "retries=",
+                "logdir=",
+                "repodir=",
+                "ram=",
+                "base-disk=",
+                "image-disk=",
+                "dry-run"
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-i", "--inputfile"):
+                inputfile = arg
+
+            elif opt in ("-s", "--support"):
+                supports = arg.split(",")
+
+            elif opt in ("-a", "--arch"):
+                architectures = arg.split(",")
+
+            elif opt in ("-V", "--vendor"):
+                vendors = arg.split(",")
+
+            elif opt in ("-j", "--jobs"):
+                jobs = int(arg)
+
+            elif opt in ("-c", "--cores"):
+                cores_per_job = int(arg)
+
+            elif opt in ("-R", "--retries"):
+                retries = int(arg)
+
+            elif opt in ("-l", "--logdir"):
+                logdir = arg
+
+            elif opt in ("-d", "--repodir"):
+                repodir = os.path.abspath(arg)
+
+            elif opt == "--ram":
+                ram_per_job = float(arg)
+
+            elif opt == "--base-disk":
+                base_disk_per_job = float(arg)
+
+            elif opt == "--image-disk":
+                image_disk_per_job = float(arg)
+
+            elif opt in ("-n", "--dry-run"):
+                dry_run = True
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    except ValueError as e:
+        bail(f"Invalid value: {e}")
+
+    if jobs < 0 or cores_per_job < 1 or retries < 0:
+        bail("Jobs and retries must be positive, and each job needs at least one core")
+
+    # Anything after "--" goes to every build script, e.g. --minimal or --desktop=kde
+    script_args.extend(args)
+
+    if not inputfile:
+        inputfile = os.path.join(repodir, "devices.yml")
+
+    if not logdir:
+        logdir = os.path.join(repodir, "logs")
+
+    return 0
+
+
+class Selection:
+    # catalog.walk() visitor: one job per build-script and architecture
+    def __init__(self, supports, architectures=None, vendors=None):
+        self.supports = supports
+        self.architectures = architectures
+        self.vendors = vendors
+        self.jobs = collections.OrderedDict()
+
+    def vendor(self, vendor):
+        pass
+
+    def board(self, vendor, board):
+        pass
+
+    def image(self, vendor, board, image):
+        script = image.get("build-script", "")
+        arch = image.get("architecture", "")
+
+        if not script or image.get("support") not in self.supports:
+            return
+
+        if self.architectures and arch not in self.architectures:
+            return
+
+        if self.vendors and vendor not in self.vendors:
+            return
+
+        job = self.jobs.setdefault((script, arch), Job(script, arch, [], []))
+
+        if vendor not in job.vendors:
+            job.vendors.append(vendor)
+
+        if image.get("image") not in job.images:
+            job.images.append(image.get("image"))
+
+
+def mem_available():
+    # Bytes, from /proc/meminfo
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return 0
+
+
+def disk_free(path):
+    # (device, free bytes) of the filesystem holding path, or its closest parent
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+
+    return os.stat(path).st_dev, shutil.disk_usage(path).free
+
+
+def free_loops():
+    # Unused loop devices, plus the ones the kernel can still create on demand
+    devices = glob.glob("/sys/block/loop*")
+    free = sum(1 for device in devices if not os.path.exists(os.path.join(device, "loop", "backing_file")))
+
+    if os.path.exists("/dev/loop-control"):
+        try:
+            with open("/sys/module/loop/parameters/max_loop") as f:
+                max_loop = int(f.read())
+
+        except (OSError, ValueError):
+            max_loop = 0
+
+        # 0 means no limit
+        free += max(0, max_loop - len(devices)) if max_loop else 256
+
+    return free
+
+
+class Scheduler:
+    # Reserves cores, RAM, disk and loop devices for each running build
+    def __init__(self):
+        self.cores = os.cpu_count() or 1
+        self.cores_per_job = min(cores_per_job, self.cores)
+        self.base = os.path.join(repodir, "base")
+        self.images = os.path.join(repodir, "images")
+        self.reserved = collections.Counter()
+        self.running = 0
+        self.initial = self.available()
+
+    def need(self):
+        # What one build takes, disk keyed by filesystem
+        need = collections.Counter({
+            "cores": self.cores_per_job,
+            "ram": int(ram_per_job * GiB),
+            "loops": 1
+        })
+
+        need[("disk", disk_free(self.base)[0])] += int(base_disk_per_job * GiB)
+        need[("disk", disk_free(self.images)[0])] += int(image_disk_per_job * GiB)
+
+        return need
+
+    def available(self):
+        free = collections.Counter({
+            "cores": self.cores,
+            "ram": mem_available(),
+            "loops": free_loops()
+        })
+
+        for path in (self.base, self.images):
+            dev, size = disk_free(path)
+            free[("disk", dev)] = size
+
+        return free
+
+    def shortage(self, need):
+        # The resources a new build would lack, [] if it can start now
+        if jobs and self.running >= jobs:
+            return ["jobs"]
+
+        live = self.available()
+        short = []
+
+        for key, amount in need.items():
+            # Within what was free at the start, and what is free right now
+            left = min(self.initial[key] - self.reserved[key], live[key])
+
+            if left < amount:
+                short.append(key if isinstance(key, str) else "disk")
+
+        return short
+
+    def start(self, need):
+        self.reserved.update(need)
+        self.running += 1
+
+    def stop(self, need):
+        self.reserved.subtract(need)
+        self.running -= 1
+
+
+def log_name(job):
+    return os.path.join(logdir, f"{os.path.splitext(job.script)[0]}-{job.architecture}.log")
+
+
+def job_env(scheduler):
+    env = dict(os.environ)
+    env["cpu_cores"] = str(scheduler.cores_per_job)
+    env["cpu_limit"] = "100"
+    env["colour_output"] = "no"
+    env["TERM"] = env.get("TERM", "dumb")
+
+    return env
+
+
+def launch(job, attempt, scheduler):
+    log = open(log_name(job), "a")
+    log.write(f"\n### {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} attempt {attempt}: ./{job.script} --arch {job.architecture} {' '.join(script_args)}\n")
+    log.flush()
+
+    proc = subprocess.Popen(
+        ["bash", f"./{job.script}", "--arch", job.architecture] + script_args,
+        cwd=repodir,
+        env=job_env(scheduler),
+        stdin=subprocess.DEVNULL,
+        stdout=log,
+        stderr=subprocess.STDOUT
+    )
+
+    return proc, log
+
+
+def run_jobs(selected):
+    # Jobs are referred to by their index in selected
+    scheduler = Scheduler()
+    need = scheduler.need()
+    queue = collections.deque((i, 1) for i in range(len(selected)))
+    running = {}
+    results = {}
+    started = {}
+    waiting = ""
+
+    print(f"[i] {len(selected)} build(s), {scheduler.cores_per_job} core(s) each on {scheduler.cores}, {retries} retry(ies)")
+
+    while queue or running:
+        # Start as many builds as the host has room for, in catalog order
+        while queue:
+            i, attempt = queue[0]
+            job = selected[i]
+            short = scheduler.shortage(need)
+
+            if short and running:
+                if waiting != ",".join(short):
+                    waiting = ",".join(short)
+                    print(f"[i] Waiting for: {waiting}")
+
+                break
+
+            queue.popleft()
+
+            if short:
+                # Nothing running that could free it up
+                results[i] = Result(job, f"skipped ({', '.join(short)})", attempt - 1, 0, "")
+                print(f"[-] {job.script} ({job.architecture}): not enough {', '.join(short)}")
+
+                continue
+
+            waiting = ""
+
+            if attempt == 1:
+                started[i] = time.monotonic()
+
+            scheduler.start(need)
+            running[i] = launch(job, attempt, scheduler) + (attempt,)
+            print(f"[+] Started: {job.script} ({job.architecture}), attempt {attempt}")
+
+        time.sleep(poll_interval)
+
+        for i, (proc, log, attempt) in list(running.items()):
+            if proc.poll() is None:
+                continue
+
+            job = selected[i]
+
+            del running[i]
+            log.close()
+            scheduler.stop(need)
+
+            if proc.returncode == 0:
+                results[i] = Result(job, "ok", attempt, time.monotonic() - started[i], log_name(job))
+                print(f"[+] Done: {job.script} ({job.architecture})")
+
+            elif attempt <= retries:
+                print(f"[-] Failed: {job.script} ({job.architecture}), exit code {proc.returncode}, retrying")
+                queue.append((i, attempt + 1))
+
+            else:
+                results[i] = Result(job, f"failed ({proc.returncode})", attempt, time.monotonic() - started[i], log_name(job))
+                print(f"[-] Failed: {job.script} ({job.architecture}), exit code {proc.returncode}")
+
+    return [results[i] for i in range(len(selected))]
+
+
+def duration(seconds):
+    return f"{int(seconds) // 3600}h{int(seconds) % 3600 // 60:02d}m{int(seconds) % 60:02d}s"
+
+
+def table(rows):
+    # Plain text table, the first row is the header
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = []
+
+    for n, row in enumerate(rows):
+        lines.append("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+        if n == 0:
+            lines.append("  ".join("-" * width for width in widths))
+
+    return lines
+
+
+def print_summary(results):
+    rows = [("Build script", "Arch", "Status", "Attempts", "Time", "Log")]
+
+    for result in results:
+        rows.append((
+            result.job.script,
+            result.job.architecture,
+            result.status,
+            str(result.attempts),
+            duration(result.seconds),
+            os.path.relpath(result.log, repodir) if result.log else "-"
+        ))
+
+    print("")
+
+    for line in table(rows):
+        print(line)
+
+    ok = sum(1 for result in results if result.status == "ok")
+    print(f"\nBuilt: {ok}/{len(results)}")
+
+    return 0
+
+
+def main(argv):
+    getargs(argv)
+
+    try:
+        data = catalog.load(inputfile)
+
+    except OSError as e:
+        bail(f"Cannot open input file: {inputfile}", str(e))
+
+    selection = Selection(supports, architectures, vendors)
+    catalog.walk(data, [selection])
+    selected = list(selection.jobs.values())
+
+    missing = [job for job in selected if not os.path.isfile(os.path.join(repodir, job.script))]
+
+    for job in missing:
+        print(f"[-] Missing build script: {job.script}")
+
+    selected = [job for job in selected if job not in missing]
+
+    if not selected:
+        bail("No build script matches the selection")
+
+    if dry_run:
+        for job in selected:
+            print(f"[i] ./{job.script} --arch {job.architecture} {' '.join(script_args)}\t({', '.join(job.images)})")
+
+        exit(0)
+
+    os.makedirs(logdir, exist_ok=True)
+
+    results = run_jobs(selected)
+    print_summary(results)
+
+    exit(0 if all(result.status == "ok" for result in results) and not missing else 1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
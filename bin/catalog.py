@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+# ARM Devices ~ https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/devices.yml
+
+###############################################
+# Shared loader for the devices.yml catalog
+#
+# Every script in ./bin/ reads devices.yml. This module parses it once,
+# using the libyaml (C) loader when PyYAML was built with it, and keeps
+# the parsed model in an on-disk cache keyed by the SHA-256 of the file
+# content. Any later run against an unchanged devices.yml unpickles the
+# cached model instead of parsing the YAML again.
+#
+# The cache directory defaults to "${XDG_CACHE_HOME:-~/.cache}/kali-arm/"
+# and can be moved with KALI_ARM_CACHE_DIR. Set KALI_ARM_CACHE_DIR to an
+# empty string to disable the cache.
+#
+# Dependencies:
+# sudo apt -y install python3 python3-yaml
+#
+# walk() makes a single pass over devices -> vendor -> board -> images and
+# hands every node to a list of visitors (see ./bin/reports.py), so several
+# reports can be produced from one traversal.
+#
+# Usage (from another script in ./bin/):
+# import catalog
+# data = catalog.load("devices.yml")
+# catalog.walk(data, [visitor, ...])
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import yaml  # python3 -m pip install pyyaml --user
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+
+except ImportError:
+    from yaml import SafeLoader
+
+# Bump when the shape of the cached model changes
+CACHE_VERSION = 1
+
+
+def cache_dir():
+    path = os.environ.get("KALI_ARM_CACHE_DIR")
+
+    if path is None:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        path = os.path.join(base, "kali-arm")
+
+    return path
+
+
+def strip_comments(content):
+    # Same filtering as the old per-script yaml_parse(), in a single join
+    return "\n".join(
+        line for line in content.split("\n")
+        if line.strip() and not line.strip().startswith("#")
+    ) + "\n"
+
+
+def cache_file(content):
+    path = cache_dir()
+
+    if not path:
+        return ""
+
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    return os.path.join(path, f"devices-{CACHE_VERSION}-{digest}.pickle")
+
+
+def read_cache(file):
+    try:
+        with open(file, "rb") as f:
+            return pickle.load(f)
+
+    except Exception:
+        return None
+
+
+def write_cache(data, file):
+    # Write to a temporary file and rename, so concurrent runs never see a partial cache
+    tmp = ""
+
+    try:
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(file), prefix=".devices-")
+
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp, file)
+
+    except Exception:
+        # The cache is only an optimisation, never fail a run because of it
+        if tmp and os.path.exists(tmp):
+            os.unlink(tmp)
+
+    return 0
+
+
+def parse(content):
+    file = cache_file(content)
+
+    if file:
+        data = read_cache(file)
+
+        if data is not None:
+            return data
+
+    data = yaml.load(strip_comments(content), Loader=SafeLoader)
+
+    if file:
+        write_cache(data, file)
+
+    return data
+
+
+def load(inputfile):
+    with open(inputfile) as f:
+        return parse(f.read())
+
+
+def walk(data, visitors, warn=False):
+    # One traversal of devices -> vendor -> board -> images, feeding every visitor
+    for entry in data["devices"]:
+        for vendor in entry.keys():
+            for visitor in visitors:
+                visitor.vendor(vendor)
+
+            for board in entry[vendor]:
+                for visitor in visitors:
+                    visitor.board(vendor, board)
+
+                for key in board.keys():
+                    # Check if there is an image for the board
+                    if "images" in key:
+                        for image in board[key]:
+                            for visitor in visitors:
+                                visitor.image(vendor, board, image)
+
+                if warn and "images" not in board.keys():
+                    print(f"[i] Possible issue with: {board.get('board', '')} (no images)")
+
+    return visitors
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+
+###############################################
+# Run a build step in its own cgroup (v2), with limits and accounting
+#
+# limit_cpu() in ./common.d/functions.sh used the cgroup v1 tools
+# (cgcreate/cgset/cgexec), which do nothing on cgroup v2 hosts. This
+# creates "<cgroup mount>/kali-arm/<name>-<pid>", sets:
+# - cpu.max   : <cores> x <cpu %> of the CPU time (-n, -c)
+# - memory.max: -m, e.g. 8G
+# - io.max    : read/write bytes per second (-r, -w) on the disk holding -d
+# runs the command in it, then reports what the step used:
+# - CPU seconds (user/system) and throttled time, from cpu.stat
+# - peak memory, from memory.peak (sampled memory.current on kernels
+#   without it) and OOM kills, from memory.events
+# - bytes read and written, from io.stat
+# The exit status is the one of the command.
+#
+# A limit whose controller is not available is skipped with a warning; the
+# accounting works with whatever the kernel provides. Without cgroup v2, or
+# without the rights to create a cgroup, the command just runs.
+#
+# With -o, the report is appended to a JSON lines file (the events_file of
+# the build, see ./bin/build-stats.py), with -l key=value labels added.
+#
+# Dependencies:
+# sudo apt -y install python3
+#
+# Usage:
+# ./bin/cgroup-run.py [-c <cpu %>] [-n <cores>] [-m <memory>] [-r <read bytes/s>] [-w <write bytes/s>] [-d <path>]
+#                     [-N <name>] [-o <output.jsonl>] [-l <key=value>]... [-C <cgroup mount>] -- <command> [<args>]
+#
+# E.g.:
+# sudo ./bin/cgroup-run.py -c 75 -n 4 -m 8G -- pixz -p 4 images/kali.img
+# sudo ./bin/cgroup-run.py -w 200M -d images/ -o logs/events.jsonl -l step=compress -- xz -T4 images/kali.img
+
+import getopt
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+cpu_limit = 0  # Percentage of the cores, 0 = no limit
+
+cores = os.cpu_count() or 1
+
+memory_limit = 0  # Bytes
+
+read_limit = 0  # Bytes per second
+
+write_limit = 0  # Bytes per second
+
+io_path = "."
+
+name = "step"
+
+outputfile = ""
+
+labels = {}
+
+cgroup_mount = "/sys/fs/cgroup"
+
+command = []
+
+CPU_PERIOD = 100000  # Microseconds
+
+SUFFIXES = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} [-c <cpu %>] [-n <cores>] [-m <memory>] [-r <read bytes/s>] [-w <write bytes/s>] [-d <path>]"
+        outstr += "\n         [-N <name>] [-o <output.jsonl>] [-l <key=value>]... [-C <cgroup mount>] -- <command> [<args>]"
+        outstr += f"\nE.g. : {prog} -c 75 -n 4 -m 8G -- pixz -p 4 images/kali.img\n"
+
+    print(outstr, file=sys.stderr)
+
+    sys.exit(2)
+
+
+def size(value):
+    # "512M", "8G", "1048576"
+    value = value.strip().upper().rstrip("B")
+
+    if value and value[-1] in SUFFIXES:
+        return int(float(value[:-1]) * SUFFIXES[value[-1]])
+
+    return int(value)
+
+
+def getargs(argv):
+    global cpu_limit, cores, memory_limit, read_limit, write_limit, io_path, name, outputfile, cgroup_mount, command
+
+    try:
+        opts, command = getopt.getopt(
+            argv,
+            "hc:n:m:r:w:d:N:o:l:C:",
+            [
+                "cpu-limit=",
+                "cores=",
+                "memory=",
+                "read-bps=",
+                "write-bps=",
+                "device-path=",
+                "name=",
+                "output=",
+                "label=",
+                "cgroup-mount="
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-c", "--cpu-limit"):
+                cpu_limit = int(arg)
+
+            elif opt in ("-n", "--cores"):
+                cores = int(arg)
+
+            elif opt in ("-m", "--memory"):
+                memory_limit = size(arg)
+
+            elif opt in ("-r", "--read-bps"):
+                read_limit = size(arg)
+
+            elif opt in ("-w", "--write-bps"):
+                write_limit = size(arg)
+
+            elif opt in ("-d", "--device-path"):
+                io_path = arg
+
+            elif opt in ("-N", "--name"):
+                name = arg
+
+            elif opt in ("-o", "--output"):
+                outputfile = arg
+
+            elif opt in ("-l", "--label"):
+                key, _, value = arg.partition("=")
+                labels[key] = value
+
+            elif opt in ("-C", "--cgroup-mount"):
+                cgroup_mount = arg
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    except ValueError as e:
+        bail(f"Invalid value: {e}")
+
+    if not command:
+        bail("Missing command")
+
+    if cores < 1 or not 0 <= cpu_limit <= 100:
+        bail("Cores must be positive, the CPU limit between 0 and 100")
+
+    return 0
+
+
+def warn(message):
+    print(f"[-] cgroup: {message}", file=sys.stderr)
+
+
+def read_keys(file):
+    # "key value" lines (cpu.stat, memory.events) as {key: int}
+    values = {}
+
+    try:
+        with open(file) as f:
+            for line in f:
+                key, _, value = line.partition(" ")
+
+                if value.strip().isdigit():
+                    values[key] = int(value)
+
+    except OSError:
+        pass
+
+    return values
+
+
+def block_device(path):
+    # "major:minor" of the whole disk holding path; io.max does not take partitions
+    st = os.stat(path)
+    dev = f"{os.major(st.st_dev)}:{os.minor(st.st_dev)}"
+    sysfs = f"/sys/dev/block/{dev}"
+
+    if os.path.exists(f"{sysfs}/partition"):
+        with open(f"{os.path.realpath(sysfs)}/../dev") as f:
+            dev = f.read().strip()
+
+    return dev
+
+
+class Cgroup:
+    def __init__(self, mount, name):
+        self.parent = os.path.join(mount, "kali-arm")
+        self.path = os.path.join(self.parent, f"{name}-{os.getpid()}")
+        self.peak = 0
+        self.sampling = False
+
+        os.makedirs(self.path)
+
+        # Controllers for the children of the mount and of kali-arm (neither has processes of its own)
+        for directory in (mount, self.parent):
+            try:
+                with open(os.path.join(directory, "cgroup.controllers")) as f:
+                    available = f.read().split()
+
+                with open(os.path.join(directory, "cgroup.subtree_control"), "w") as f:
+                    f.write(" ".join(f"+{controller}" for controller in available if controller in ("cpu", "memory", "io")))
+
+            except OSError:
+                pass
+
+        with open(os.path.join(self.path, "cgroup.controllers")) as f:
+            self.controllers = set(f.read().split())
+
+    def write(self, file, value):
+        with open(os.path.join(self.path, file), "w") as f:
+            f.write(value)
+
+    def limit(self):
+        # Returns the limits that were set
+        limits = {}
+
+        if cpu_limit:
+            if "cpu" in self.controllers:
+                quota = CPU_PERIOD * cores * cpu_limit // 100
+                self.write("cpu.max", f"{quota} {CPU_PERIOD}")
+                limits["cpu_max"] = f"{quota} {CPU_PERIOD}"
+
+            else:
+                warn("no cpu controller, CPU not limited")
+
+        if memory_limit:
+            if "memory" in self.controllers:
+                self.write("memory.max", str(memory_limit))
+                limits["memory_max"] = memory_limit
+
+            else:
+                warn("no memory controller, memory not limited")
+
+        if read_limit or write_limit:
+            if "io" in self.controllers:
+                dev = block_device(io_path)
+                rules = [f"rbps={read_limit}" if read_limit else "", f"wbps={write_limit}" if write_limit else ""]
+                self.write("io.max", f"{dev} {' '.join(rule for rule in rules if rule)}")
+                limits["io_max"] = f"{dev} {' '.join(rule for rule in rules if rule)}"
+
+            else:
+                warn("no io controller, I/O not limited")
+
+        return limits
+
+    def sample(self):
+        # memory.peak is 5.19+, sample memory.current instead
+        while self.sampling:
+            try:
+                with open(os.path.join(self.path, "memory.current")) as f:
+                    self.peak = max(self.peak, int(f.read()))
+
+            except (OSError, ValueError):
+                return
+
+            time.sleep(0.5)
+
+    def accounting(self):
+        cpu = read_keys(os.path.join(self.path, "cpu.stat"))
+        memory_events = read_keys(os.path.join(self.path, "memory.events"))
+        peak = self.peak
+
+        try:
+            with open(os.path.join(self.path, "memory.peak")) as f:
+                peak = int(f.read())
+
+        except (OSError, ValueError):
+            pass
+
+        read_bytes = written_bytes = 0
+
+        try:
+            with open(os.path.join(self.path, "io.stat")) as f:
+                for line in f:
+                    for field in line.split()[1:]:
+                        key, _, value = field.partition("=")
+
+                        if key == "rbytes":
+                            read_bytes += int(value)
+
+                        elif key == "wbytes":
+                            written_bytes += int(value)
+
+        except (OSError, ValueError):
+            pass
+
+        return {
+            "cpu_seconds": cpu.get("usage_usec", 0) / 1e6,
+            "user_seconds": cpu.get("user_usec", 0) / 1e6,
+            "system_seconds": cpu.get("system_usec", 0) / 1e6,
+            "throttled_seconds": cpu.get("throttled_usec", 0) / 1e6,
+            "memory_peak": peak,
+            "oom_kills": memory_events.get("oom_kill", 0),
+            "read_bytes": read_bytes,
+            "written_bytes": written_bytes
+        }
+
+    def remove(self):
+        # Leftover processes (daemons started by the step) go with it
+        try:
+            self.write("cgroup.kill", "1")
+
+        except OSError:
+            pass
+
+        for attempt in range(50):
+            try:
+                os.rmdir(self.path)
+
+                return True
+
+            except OSError:
+                time.sleep(0.1)
+
+        warn(f"cannot remove {self.path}")
+
+        return False
+
+
+def human(value):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if value < 1024 or unit == "GiB":
+            return f"{value:.1f} {unit}" if unit != "B" else f"{value} B"
+
+        value /= 1024
+
+
+def run(cgroup):
+    # Exit status of the command (128 + signal when killed)
+    join = None
+
+    if cgroup:
+        procs = os.path.join(cgroup.path, "cgroup.procs")
+
+        # In the child, between fork and exec: everything it starts is accounted
+        def join():
+            with open(procs, "w") as f:
+                f.write(str(os.getpid()))
+
+    try:
+        proc = subprocess.Popen(command, preexec_fn=join)
+
+    except OSError as e:
+        bail(f"Cannot run {command[0]}", str(e))
+
+    # Signals for the build go to the step
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: proc.send_signal(signum))
+
+    ret = proc.wait()
+
+    return 128 - ret if ret < 0 else ret
+
+
+def main(argv):
+    getargs(argv)
+
+    cgroup = None
+    limits = {}
+
+    if not os.path.exists(os.path.join(cgroup_mount, "cgroup.controllers")):
+        warn(f"{cgroup_mount} is not cgroup v2, running without limits")
+
+    else:
+        try:
+            cgroup = Cgroup(cgroup_mount, name)
+            limits = cgroup.limit()
+
+        except OSError as e:
+            warn(f"cannot set up the cgroup, running without limits: {e}")
+
+            if cgroup:
+                cgroup.remove()
+                cgroup = None
+
+    started = time.time()
+    sampler = None
+
+    if cgroup and not os.path.exists(os.path.join(cgroup.path, "memory.peak")) and "memory" in cgroup.controllers:
+        cgroup.sampling = True
+        sampler = threading.Thread(target=cgroup.sample, daemon=True)
+        sampler.start()
+
+    ret = run(cgroup)
+    ended = time.time()
+
+    if not cgroup:
+        exit(ret)
+
+    cgroup.sampling = False
+    usage = cgroup.accounting()
+    cgroup.remove()
+
+    print(f"[i] cgroup {name}: {ended - started:.1f}s, CPU {usage['cpu_seconds']:.1f}s (user {usage['user_seconds']:.1f}s, system {usage['system_seconds']:.1f}s, throttled {usage['throttled_seconds']:.1f}s), "
+          f"peak memory {human(usage['memory_peak'])}{', OOM kills: ' + str(usage['oom_kills']) if usage['oom_kills'] else ''}, "
+          f"read {human(usage['read_bytes'])}, written {human(usage['written_bytes'])}", file=sys.stderr)
+
+    if outputfile:
+        event = dict(labels, scope="cgroup", command=" ".join(command), start=started, end=ended, exit_code=ret, limits=limits, **usage)
+
+        try:
+            with open(outputfile, "a") as f:
+                f.write(json.dumps(event) + "\n")
+
+        except OSError as e:
+            warn(f"cannot write {outputfile}: {e}")
+
+    exit(ret)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+
+###############################################
+# Verify release images against their .sha256sum sidecars
+#
+# For every <image>.img.xz it checks:
+# - <image>.img.xz.sha256sum: the SHA-256 of the compressed file
+# - <image>.img.sha256sum   : the SHA-256 of the image after decompression
+#
+# Both digests come from a single read of the .xz: the compressed bytes
+# are hashed as they are read, and decompressed in memory and hashed as
+# they come out. The uncompressed image is never written to disk.
+#
+# Several files are verified at the same time (-j/--jobs). hashlib and
+# lzma release the GIL on large buffers, so the threads run on separate
+# cores.
+#
+# Computed digests are stored in a cache ("<imagedir>/.sha256-cache.json"
+# by default) keyed by (device, inode, size, mtime_ns). An unchanged file is
+# only compared against its sidecars, without being read again. Entries not
+# looked up during a run that updates the cache are dropped, and a cache
+# that cannot be written is only a warning.
+#
+# Dependencies:
+# sudo apt -y install python3
+#
+# Usage:
+# ./bin/checksums.py [-j <jobs>] [-c <cache file>] [-n] <image directory | file.img.xz> [...]
+#
+# E.g.:
+# ./bin/checksums.py -j 4 images/
+# ./bin/checksums.py images/kali-linux-2022.3-raspberry-pi-arm64.img.xz
+#
+# From another script in ./bin/:
+# import checksums
+# cache = checksums.DigestCache("images/.sha256-cache.json")
+# result = checksums.verify("images/kali-linux-2022.3-raspberry-pi-arm64.img.xz", cache)
+
+import collections
+import concurrent.futures
+import getopt
+import glob
+import hashlib
+import json
+import lzma
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import sparse
+
+# Read size: large and a multiple of the page size
+CHUNK_SIZE = 8 << 20
+
+CACHE_FILE = ".sha256-cache.json"
+
+jobs = os.cpu_count() or 1
+
+cachefile = ""
+
+use_cache = True
+
+Result = collections.namedtuple("Result", [
+    "file",
+    "errors",
+    "sha256",
+    "extract_sha256",
+    "extract_size",
+    "seconds",
+    "cached"
+])
+
+
+class DigestCache:
+    # Digests keyed by "device:inode:size:mtime_ns", stored as JSON
+    def __init__(self, file):
+        self.file = file
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.used = set()
+
+        try:
+            with open(file) as f:
+                self.entries = json.load(f)
+
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def key(st):
+        return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+    def get(self, st):
+        with self.lock:
+            self.used.add(self.key(st))
+
+            return self.entries.get(self.key(st))
+
+    def put(self, st, entry):
+        with self.lock:
+            self.used.add(self.key(st))
+            self.entries[self.key(st)] = entry
+            self.dirty = True
+
+    def save(self):
+        # Temporary file and rename, a crash never leaves a truncated cache
+        if not self.dirty:
+            return 0
+
+        with self.lock:
+            # Deleted or changed files are not looked up any more
+            self.entries = {key: entry for key, entry in self.entries.items() if key in self.used}
+            tmp = ""
+
+            try:
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.file)), prefix=".sha256-cache-")
+
+                with os.fdopen(fd, "w") as f:
+                    json.dump(self.entries, f, indent=2, sort_keys=True)
+
+                os.replace(tmp, self.file)
+
+            except OSError as e:
+                # Only an optimisation, the digests were checked
+                print(f"[-] Cannot save the digest cache {self.file}: {e.strerror or e}")
+
+                return 1
+
+            finally:
+                if tmp and os.path.exists(tmp):
+                    os.unlink(tmp)
+
+            self.dirty = False
+
+        return 0
+
+
+def read_chunks(file):
+    # Sequential reads of CHUNK_SIZE into one reused buffer. Holes in sparse
+    # files are yielded as zeros without reading them, the bytes are the same
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    zeros = memoryview(bytes(CHUNK_SIZE))
+
+    with open(file, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+        for offset, length, is_data in sparse.extents(f.fileno()):
+            if not is_data:
+                while length > 0:
+                    n = min(length, CHUNK_SIZE)
+                    length -= n
+
+                    yield zeros[:n]
+
+                continue
+
+            f.seek(offset)
+
+            while length > 0:
+                n = f.readinto(view[:min(length, CHUNK_SIZE)])
+
+                if not n:
+                    # Truncated while reading, same as a short dense read
+                    return
+
+                length -= n
+
+                yield view[:n]
+
+
+def sha256_file(file):
+    h = hashlib.sha256()
+
+    for chunk in read_chunks(file):
+        h.update(chunk)
+
+    return h.hexdigest()
+
+
+def sha256_xz(file):
+    # Returns (compressed sha256, uncompressed sha256, uncompressed size) from one read
+    h_xz = hashlib.sha256()
+    h_img = hashlib.sha256()
+    size = 0
+
+    decomp = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+
+    for chunk in read_chunks(file):
+        h_xz.update(chunk)
+        data = bytes(chunk)
+
+        while data:
+            if decomp.eof:
+                # Concatenated stream, after optional null stream padding
+                data = data.lstrip(b"\0")
+
+                if not data:
+                    break
+
+                decomp = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+
+            # max_length bounds memory, even for long runs of compressed zeros
+            out = decomp.decompress(data, max_length=CHUNK_SIZE)
+            h_img.update(out)
+            size += len(out)
+
+            while not decomp.eof and not decomp.needs_input:
+                out = decomp.decompress(b"", max_length=CHUNK_SIZE)
+                h_img.update(out)
+                size += len(out)
+
+            data = decomp.unused_data if decomp.eof else b""
+
+    if not decomp.eof:
+        raise lzma.LZMAError("Compressed data ended before the end of the stream")
+
+    return h_xz.hexdigest(), h_img.hexdigest(), size
+
+
+def read_sidecar(file):
+    # shasum format: "<hex digest>  <filename>"
+    with open(file) as f:
+        return f.read().split()[0].lower()
+
+
+def verify(file, cache=None):
+    # Verify one <image>.img.xz against both sidecars
+    start = time.perf_counter()
+    errors = []
+    cached = False
+
+    image = file[:-len(".xz")]
+
+    try:
+        expected_xz = read_sidecar(f"{file}.sha256sum")
+        expected_img = read_sidecar(f"{image}.sha256sum")
+
+    except (OSError, IndexError) as e:
+        return Result(file, [f"Cannot read sidecar: {e}"], "", "", 0, 0, False)
+
+    try:
+        st = os.stat(file)
+        entry = cache.get(st) if cache else None
+
+        if entry:
+            cached = True
+
+        else:
+            sha256, extract_sha256, extract_size = sha256_xz(file)
+            entry = {
+                "sha256": sha256,
+                "extract_sha256": extract_sha256,
+                "extract_size": extract_size
+            }
+
+            # Only cache digests of a file that did not change while it was read
+            if cache and os.stat(file).st_mtime_ns == st.st_mtime_ns:
+                cache.put(st, entry)
+
+    except (OSError, lzma.LZMAError, EOFError) as e:
+        return Result(file, [f"Cannot read: {e}"], "", "", 0, time.perf_counter() - start, False)
+
+    if entry["sha256"] != expected_xz:
+        errors.append(f"Compressed SHA-256 mismatch: {entry['sha256']} != {expected_xz} ({file}.sha256sum)")
+
+    if entry["extract_sha256"] != expected_img:
+        errors.append(f"Uncompressed SHA-256 mismatch: {entry['extract_sha256']} != {expected_img} ({image}.sha256sum)")
+
+    return Result(
+        file,
+        errors,
+        entry["sha256"],
+        entry["extract_sha256"],
+        entry["extract_size"],
+        time.perf_counter() - start,
+        cached
+    )
+
+
+def throughput(result):
+    if result.cached:
+        return "cached"
+
+    size = os.path.getsize(result.file)
+    seconds = max(result.seconds, 1e-6)
+
+    return f"{size / seconds / 1e6:.1f} MB/s, {result.extract_size / seconds / 1e6:.1f} MB/s uncompressed"
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} [-j <jobs>] [-c <cache file>] [-n] <image directory | file.img.xz> [...]"
+        outstr += f"\nE.g. : {prog} -j 4 images/\n"
+
+    print(outstr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global jobs, cachefile, use_cache
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hj:c:n",
+            [
+                "jobs=",
+                "cache=",
+                "no-cache"
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    for opt, arg in opts:
+        if opt == "-h":
+            bail()
+
+        elif opt in ("-j", "--jobs"):
+            try:
+                jobs = int(arg)
+
+            except ValueError:
+                jobs = 0
+
+            if jobs < 1:
+                bail(f"Invalid number of jobs: {arg}")
+
+        elif opt in ("-c", "--cache"):
+            cachefile = arg
+
+        elif opt in ("-n", "--no-cache"):
+            use_cache = False
+
+        else:
+            bail(f"Unrecognised argument: {opt}")
+
+    if not args:
+        bail("Missing image directory or files")
+
+    return args
+
+
+def main(argv):
+    global cachefile
+
+    files = []
+
+    for arg in getargs(argv):
+        if os.path.isdir(arg):
+            files += sorted(glob.glob(os.path.join(arg, "*.img.xz")))
+
+        else:
+            files.append(arg)
+
+    if not files:
+        bail("No *.img.xz files found")
+
+    cache = None
+
+    if use_cache:
+        if not cachefile:
+            cachefile = os.path.join(os.path.dirname(os.path.abspath(files[0])), CACHE_FILE)
+
+        cache = DigestCache(cachefile)
+
+    failed = 0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        for result in pool.map(lambda file: verify(file, cache), files):
+            if result.errors:
+                failed += 1
+                print(f"[-] FAILED: {result.file}")
+
+                for error in result.errors:
+                    print(f"    {error}")
+
+            else:
+                print(f"[+] OK: {result.file} ({throughput(result)})")
+
+    if cache:
+        cache.save()
+
+    print(f"\nVerified: {len(files) - failed}/{len(files)}")
+
+    exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+###############################################
+# Compress and checksum a finished image in a single read
+#
+# Used by compress_img() in ./common.d/functions.sh at the end of every
+# build. The image is read once; each chunk is hashed (uncompressed
+# SHA-256) and fed to a multi-threaded xz encoder (pixz, xz, or the
+# block-parallel encoder in ./bin/xzblock.py), and the encoder output is
+# hashed (compressed SHA-256) as it is written. It creates, next to the
+# image:
+# - "<image>.img.sha256sum"   : same format as `shasum -a 256 <image>.img`
+# - "<image>.img.xz"          : the compressed image (unless -c none)
+# - "<image>.img.xz.sha256sum": same format as `shasum -a 256 <image>.img.xz`
+# - "<image>.img.bmap"        : block map for `bmaptool copy` (unless -n)
+#
+# The bmap ranges come from the partition table and filesystem bitmaps
+# (./bin/bmap.py), read before the image; their SHA-256 are computed in the
+# same single read.
+#
+# The unwritten headroom make_image() fallocates is skipped with
+# SEEK_DATA/SEEK_HOLE (./bin/sparse.py) and fed in as zeros, without I/O.
+#
+# Like xz and pixz, the uncompressed image is removed once the .xz is
+# complete, unless -k is given.
+#
+# pixz falls back to the builtin encoder when it is not installed. Both
+# write multi-block .xz files that can be decompressed in parallel. With
+# -l <cpu limit> (percent, as $cpu_limit in ./builder.txt) the builtin
+# encoder only uses that share of the threads.
+#
+# Dependencies:
+# sudo apt -y install python3 pixz xz-utils
+#
+# Usage:
+# ./bin/compress-image.py [-c xz|none] [-e pixz|xz|builtin] [-T <threads>] [-l <cpu limit>] [-k] [-n] <image.img>
+#
+# E.g.:
+# ./bin/compress-image.py -e pixz -T 4 images/kali-linux-2022.3-raspberry-pi-arm64.img
+
+import getopt
+import hashlib
+import lzma
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+import bmap
+import checksums
+import xzblock
+
+compress = "xz"
+
+encoder = "pixz"
+
+threads = os.cpu_count() or 1
+
+cpu_limit = -1
+
+keep = False
+
+with_bmap = True
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} [-c xz|none] [-e pixz|xz|builtin] [-T <threads>] [-l <cpu limit>] [-k] [-n] <image.img>"
+        outstr += f"\nE.g. : {prog} -e pixz -T 4 images/kali-linux-2022.3-raspberry-pi-arm64.img\n"
+
+    print(outstr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global compress, encoder, threads, cpu_limit, keep, with_bmap
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hc:e:T:l:kn",
+            [
+                "compress=",
+                "encoder=",
+                "threads=",
+                "cpu-limit=",
+                "keep",
+                "no-bmap"
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    for opt, arg in opts:
+        if opt == "-h":
+            bail()
+
+        elif opt in ("-c", "--compress"):
+            compress = arg
+
+        elif opt in ("-e", "--encoder"):
+            encoder = arg
+
+        elif opt in ("-T", "--threads"):
+            try:
+                threads = max(1, int(arg))
+
+            except ValueError:
+                bail(f"Invalid number of threads: {arg}")
+
+        elif opt in ("-l", "--cpu-limit"):
+            try:
+                cpu_limit = int(arg)
+
+            except ValueError:
+                bail(f"Invalid CPU limit: {arg}")
+
+        elif opt in ("-k", "--keep"):
+            keep = True
+
+        elif opt in ("-n", "--no-bmap"):
+            with_bmap = False
+
+        else:
+            bail(f"Unrecognised argument: {opt}")
+
+    if compress not in ("xz", "none"):
+        bail(f"Unknown compression: {compress}")
+
+    if encoder not in ("pixz", "xz", "builtin"):
+        bail(f"Unknown encoder: {encoder}")
+
+    if len(args) != 1:
+        bail("Expected exactly one image file")
+
+    return args[0]
+
+
+def workers():
+    # Same rule as limit_cpu(): a limit outside 1-100 means no limit
+    if 1 <= cpu_limit <= 100:
+        return max(1, threads * cpu_limit // 100)
+
+    return threads
+
+
+def encoder_cmd():
+    # pixz is only used where it is installed, otherwise the builtin encoder
+    if encoder == "pixz" and shutil.which("pixz"):
+        return ["pixz", "-p", str(threads)]
+
+    if encoder == "xz":
+        return ["xz", "--memlimit-compress=50%", "-T", str(threads), "-c"]
+
+    return []
+
+
+class HashWriter:
+    # File-like wrapper, hashes everything written to the .xz file
+    def __init__(self, f, h):
+        self.f = f
+        self.h = h
+
+    def write(self, data):
+        self.h.update(data)
+
+        return self.f.write(data)
+
+
+def write_sidecar(file, digest):
+    # Same layout as `shasum -a 256 <file>` run from the image directory
+    with open(f"{file}.sha256sum", "w") as f:
+        f.write(f"{digest}  {os.path.basename(file)}\n")
+
+    return 0
+
+
+def drain(src, dst, h, errors):
+    # Copy the encoder output to the .xz file, hashing it on the way
+    try:
+        while True:
+            chunk = src.read(checksums.CHUNK_SIZE)
+
+            if not chunk:
+                break
+
+            h.update(chunk)
+            dst.write(chunk)
+
+    except Exception as e:
+        errors.append(e)
+
+    return 0
+
+
+def image_chunks(image, hashers):
+    # Reads the image once, every hasher sees every chunk
+    for chunk in checksums.read_chunks(image):
+        for h in hashers:
+            h.update(chunk)
+
+        yield chunk
+
+
+def encode_builtin(chunks, out, h_xz):
+    block_encoder = xzblock.BlockEncoder(HashWriter(out, h_xz), workers=workers())
+
+    for chunk in chunks:
+        block_encoder.write(chunk)
+
+    block_encoder.close()
+
+    return 0
+
+
+def encode_external(chunks, out, h_xz):
+    errors = []
+
+    proc = subprocess.Popen(encoder_cmd(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+
+    reader = threading.Thread(target=drain, args=(proc.stdout, out, h_xz, errors))
+    reader.start()
+
+    try:
+        for chunk in chunks:
+            proc.stdin.write(chunk)
+
+    finally:
+        proc.stdin.close()
+        reader.join()
+
+    if proc.wait() != 0:
+        raise OSError(f"{proc.args[0]} exited with code {proc.returncode}")
+
+    if errors:
+        raise errors[0]
+
+    return 0
+
+
+def compress_image(image, hashers):
+    # Returns the compressed sha256, or "" with -c none
+    chunks = image_chunks(image, hashers)
+
+    if compress == "none":
+        for chunk in chunks:
+            pass
+
+        return ""
+
+    h_xz = hashlib.sha256()
+    tmp = f"{image}.xz.part"
+
+    try:
+        with open(tmp, "wb") as out:
+            if encoder_cmd():
+                encode_external(chunks, out, h_xz)
+
+            else:
+                encode_builtin(chunks, out, h_xz)
+
+            out.flush()
+            os.fsync(out.fileno())
+
+        os.replace(tmp, f"{image}.xz")
+
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+    return h_xz.hexdigest()
+
+
+def main(argv):
+    image = getargs(argv)
+
+    if not os.path.isfile(image):
+        bail(f"Missing image: {image}", "Please create the image before running")
+
+    h_img = hashlib.sha256()
+    hashers = [h_img]
+
+    try:
+        if with_bmap:
+            size = os.path.getsize(image)
+            ranges = bmap.mapped_ranges(image)
+            hashers.append(bmap.RangeHasher(ranges, size))
+
+        sha256 = compress_image(image, hashers)
+
+    except (OSError, subprocess.SubprocessError, lzma.LZMAError, xzblock.xzindex.XZError) as e:
+        bail(f"Cannot compress: {image}", str(e))
+
+    extract_sha256 = h_img.hexdigest()
+
+    write_sidecar(image, extract_sha256)
+    print(f"[+] {extract_sha256}  {os.path.basename(image)}")
+
+    if with_bmap:
+        bmap.write_bmap(bmap.render(size, ranges, hashers[1].hexdigests()), f"{image}.bmap")
+        print(f"[+] {sum(last - first + 1 for first, last in ranges)} mapped blocks  {os.path.basename(image)}.bmap")
+
+    if sha256:
+        write_sidecar(f"{image}.xz", sha256)
+        print(f"[+] {sha256}  {os.path.basename(image)}.xz")
+
+        if not keep:
+            os.unlink(image)
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,961 @@
+#!/usr/bin/env python3
+
+# ARM Devices ~ https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/devices.yml
+
+###############################################
+# Spread the image builds of ./bin/build.py over several hosts
+#
+# coordinator: selects the jobs from devices.yml (same filters as
+#   ./bin/build.py, one job per build-script and architecture) and hands
+#   them out over HTTP. Artifacts uploaded by the workers are checked
+#   against their SHA-256 and written to the image directory.
+# worker: registers with its cores and architectures, leases as many jobs
+#   as it has slots (cores / cores per job), runs the build scripts, and
+#   uploads "<image>.img.xz", its .sha256sum sidecars and the .bmap.
+#
+# Scheduling: a worker gets the first queued job it can build natively
+# (e.g. arm64 on an arm64 server, no qemu). It only gets a job it would
+# build under qemu when no native worker for that architecture has a free
+# slot.
+#
+# Leases: workers send a heartbeat every <lease>/3 seconds. A worker that
+# misses its lease is lost, and its jobs go back to the queue (they count
+# as an attempt, see -R). A failed build, or one whose artifacts do not
+# match, is requeued the same way.
+#
+# Protocol (JSON over HTTP, "X-Farm-Token" header when -t is set):
+#   POST /register  {name, cores, slots, architectures, native} -> {worker, lease}
+#   POST /lease     {worker}                                   -> {job} or {job: null, done}
+#   POST /heartbeat {worker}                                   -> {cancel: [job ids]} (410: lost)
+#   PUT  /artifacts/<job id>/<file name>  (X-Worker, X-SHA256) -> {sha256}
+#   POST /complete  {worker, job, exit_code, log}              -> {status}
+#   GET  /status                                               -> {jobs, workers}
+#
+# Everything runs as local processes too (-d on the worker, a stub build
+# script directory), which is how the protocol can be tested.
+#
+# Dependencies:
+# sudo apt -y install python3 python3-yaml
+#
+# Usage:
+# ./bin/farm.py coordinator -r <release> [-i <input file>] [-s <support>] [-a <architecture>] [-V <vendor>]
+#                           [-o <image directory>] [-b <address:port>] [-L <lease seconds>] [-R <retries>] [-t <token>]
+#                           [-- <build script options>]
+# ./bin/farm.py worker -u <coordinator URL> [-n <name>] [-c <cores per job>] [-A <architectures>]
+#                      [-N <native architectures>] [-d <repo dir>] [-t <token>]
+#
+# E.g.:
+# ./bin/farm.py coordinator -r 2022.3 -b 0.0.0.0:8642 -t secret
+# ./bin/farm.py worker -u http://builder.local:8642 -c 8 -t secret
+
+import collections
+import getopt
+import hashlib
+import hmac
+import http.server
+import json
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import artifacts
+import build
+import catalog
+import checksums
+
+mode = ""
+
+release = ""
+
+inputfile = ""
+
+imagedir = ""
+
+supports = ["kali"]
+
+architectures = []  # Coordinator: job filter. Worker: what it can build (-A)
+
+native = []  # Worker: what it builds without qemu (-N)
+
+native_set = False  # -N given, else native is guessed from the host
+
+vendors = []
+
+bind = "127.0.0.1:8642"
+
+url = ""
+
+name = socket.gethostname()
+
+cores_per_job = 4
+
+lease = 120  # Seconds without a heartbeat before a worker is lost
+
+retries = 1
+
+token = ""
+
+repodir = build.repodir
+
+script_args = ["--no-colour"]
+
+poll_interval = 2.0
+
+# Files uploaded per image, the .bmap is optional
+upload_ext = artifacts.file_ext + ["bmap"]
+
+# Architectures a host runs without qemu
+NATIVE = {
+    "aarch64": ["arm64", "armhf", "armel"],
+    "armv8l": ["armhf", "armel"],
+    "armv7l": ["armhf", "armel"]
+}
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} coordinator -r <release> [-i <input file>] [-s <support>] [-a <architecture>] [-V <vendor>]"
+        outstr += "\n         [-o <image directory>] [-b <address:port>] [-L <lease seconds>] [-R <retries>] [-t <token>] [-- <build script options>]"
+        outstr += f"\n       {prog} worker -u <coordinator URL> [-n <name>] [-c <cores per job>] [-A <architectures>]"
+        outstr += "\n         [-N <native architectures>] [-d <repo dir>] [-t <token>]"
+        outstr += f"\nE.g. : {prog} coordinator -r 2022.3 -b 0.0.0.0:8642 -t secret"
+        outstr += f"\n       {prog} worker -u http://builder.local:8642 -c 8 -t secret\n"
+
+    print(outstr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global mode, release, inputfile, imagedir, supports, architectures, native, native_set, vendors, bind, url
+    global name, cores_per_job, lease, retries, token, repodir
+
+    if not argv or argv[0] not in ("coordinator", "worker"):
+        bail("Expected a mode: coordinator or worker")
+
+    mode = argv[0]
+
+    try:
+        opts, args = getopt.getopt(
+            argv[1:],
+            "hr:i:s:a:V:o:b:L:R:t:u:n:c:A:N:d:",
+            [
+                "release=",
+                "inputfile=",
+                "support=",
+                "arch=",
+                "vendor=",
+                "imagedir=",
+                "bind=",
+                "lease=",
+                "retries=",
+                "token=",
+                "url=",
+                "name=",
+                "cores=",
+                "architectures=",
+                "native=",
+                "repodir="
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-r", "--release"):
+                release = arg
+
+            elif opt in ("-i", "--inputfile"):
+                inputfile = arg
+
+            elif opt in ("-s", "--support"):
+                supports = arg.split(",")
+
+            elif opt in ("-a", "--arch", "-A", "--architectures"):
+                architectures = arg.split(",")
+
+            elif opt in ("-N", "--native"):
+                native = arg.split(",") if arg else []
+                native_set = True
+
+            elif opt in ("-V", "--vendor"):
+                vendors = arg.split(",")
+
+            elif opt in ("-o", "--imagedir"):
+                imagedir = arg
+
+            elif opt in ("-b", "--bind"):
+                bind = arg
+
+            elif opt in ("-L", "--lease"):
+                lease = float(arg)
+
+            elif opt in ("-R", "--retries"):
+                retries = int(arg)
+
+            elif opt in ("-t", "--token"):
+                token = arg
+
+            elif opt in ("-u", "--url"):
+                url = arg.rstrip("/")
+
+            elif opt in ("-n", "--name"):
+                name = arg
+
+            elif opt in ("-c", "--cores"):
+                cores_per_job = int(arg)
+
+            elif opt in ("-d", "--repodir"):
+                repodir = os.path.abspath(arg)
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    except ValueError as e:
+        bail(f"Invalid value: {e}")
+
+    if mode == "coordinator" and not release:
+        bail("Missing required argument: -r/--release")
+
+    if mode == "worker" and not url:
+        bail("Missing required argument: -u/--url")
+
+    if lease <= 0 or retries < 0 or cores_per_job < 1:
+        bail("Lease, retries and cores must be positive")
+
+    script_args.extend(args)
+
+    if not inputfile:
+        inputfile = os.path.join(repodir, "devices.yml")
+
+    if not imagedir:
+        imagedir = os.path.join(repodir, "images")
+
+    return 0
+
+
+# Coordinator
+# ------------------------------------------------------------
+
+class Coordinator:
+    def __init__(self, selected):
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.workers = {}
+        self.queue = collections.deque()
+        self.next_worker = 1
+
+        for i, job in enumerate(selected):
+            self.jobs.append({
+                "id": i,
+                "script": job.script,
+                "architecture": job.architecture,
+                "images": job.images,
+                "state": "queued",
+                "attempts": 0,
+                "worker": None,
+                "uploads": {},
+                "status": "",
+                "seconds": 0,
+                "started": 0,
+                "log": ""
+            })
+            self.queue.append(i)
+
+    def finished(self):
+        return all(job["state"] in ("ok", "failed") for job in self.jobs)
+
+    def register(self, request):
+        with self.lock:
+            worker_id = f"{request.get('name', 'worker')}-{self.next_worker}"
+            self.next_worker += 1
+
+            self.workers[worker_id] = {
+                "name": request.get("name", ""),
+                "cores": int(request.get("cores", 1)),
+                "slots": max(1, int(request.get("slots", 1))),
+                "architectures": list(request.get("architectures", [])),
+                "native": list(request.get("native", [])),
+                "deadline": time.monotonic() + lease,
+                "running": set(),
+                "lost": False
+            }
+
+        print(f"[+] Worker registered: {worker_id} ({self.workers[worker_id]['slots']} slot(s), native: {','.join(self.workers[worker_id]['native']) or 'none'})")
+
+        return 200, {"worker": worker_id, "lease": lease}
+
+    def live(self, worker_id):
+        worker = self.workers.get(worker_id)
+
+        if not worker or worker["lost"]:
+            return None
+
+        worker["deadline"] = time.monotonic() + lease
+
+        return worker
+
+    def native_slot(self, arch, other):
+        # Is a live native worker for arch, other than this one, idle enough to take it?
+        for worker_id, worker in self.workers.items():
+            if worker_id == other or worker["lost"]:
+                continue
+
+            if arch in worker["native"] and len(worker["running"]) < worker["slots"]:
+                return True
+
+        return False
+
+    def lease_job(self, request):
+        worker_id = request.get("worker")
+
+        with self.lock:
+            worker = self.live(worker_id)
+
+            if not worker:
+                return 410, {"error": "unknown or lost worker"}
+
+            if len(worker["running"]) >= worker["slots"]:
+                return 200, {"job": None, "done": False}
+
+            candidates = [i for i in self.queue if self.jobs[i]["architecture"] in worker["architectures"]]
+            picked = None
+
+            for i in candidates:
+                if self.jobs[i]["architecture"] in worker["native"]:
+                    picked = i
+
+                    break
+
+            if picked is None:
+                for i in candidates:
+                    if not self.native_slot(self.jobs[i]["architecture"], worker_id):
+                        picked = i
+
+                        break
+
+            if picked is None:
+                return 200, {"job": None, "done": self.finished()}
+
+            self.queue.remove(picked)
+            job = self.jobs[picked]
+            job["state"] = "running"
+            job["worker"] = worker_id
+            job["attempts"] += 1
+            job["uploads"] = {}
+            job["started"] = job["started"] or time.monotonic()
+            worker["running"].add(picked)
+
+        print(f"[+] Leased: {job['script']} ({job['architecture']}) to {worker_id}, attempt {job['attempts']}")
+
+        return 200, {"job": {
+            "id": picked,
+            "script": job["script"],
+            "architecture": job["architecture"],
+            "images": job["images"],
+            "release": release,
+            "args": script_args
+        }}
+
+    def heartbeat(self, request):
+        with self.lock:
+            worker = self.live(request.get("worker"))
+
+            if not worker:
+                return 410, {"error": "unknown or lost worker"}
+
+            # Jobs the worker still runs but no longer owns
+            cancel = [i for i in request.get("jobs", []) if i not in worker["running"]]
+
+        return 200, {"cancel": cancel}
+
+    def requeue(self, i, status):
+        # Lock held by the caller
+        job = self.jobs[i]
+
+        if job["attempts"] <= retries:
+            job["state"] = "queued"
+            job["worker"] = None
+            self.queue.append(i)
+            print(f"[-] {job['script']} ({job['architecture']}): {status}, requeued")
+
+        else:
+            job["state"] = "failed"
+            job["status"] = status
+            job["seconds"] = time.monotonic() - job["started"]
+            print(f"[-] {job['script']} ({job['architecture']}): {status}")
+
+    def reap(self):
+        # Requeue the jobs of the workers that missed their lease
+        now = time.monotonic()
+
+        with self.lock:
+            for worker_id, worker in self.workers.items():
+                if worker["lost"] or worker["deadline"] > now:
+                    continue
+
+                worker["lost"] = True
+                print(f"[-] Worker lost: {worker_id}")
+
+                for i in sorted(worker["running"]):
+                    self.requeue(i, f"worker {worker_id} lost")
+
+                worker["running"] = set()
+
+    def owned(self, worker_id, job_id):
+        # The job, if it is running on this worker (lock held by the caller)
+        worker = self.live(worker_id)
+
+        if not worker or not isinstance(job_id, int) or job_id not in worker["running"]:
+            return None
+
+        return self.jobs[job_id]
+
+    def upload(self, worker_id, job_id, filename, expected, size, rfile):
+        with self.lock:
+            job = self.owned(worker_id, job_id)
+
+        if not job:
+            return 409, {"error": "job not leased to this worker"}
+
+        # Only plain file names of this release's images
+        allowed = [f"kali-linux-{release}-{image}.{ext}" for image in job["images"] for ext in upload_ext]
+
+        if filename not in allowed:
+            return 400, {"error": f"unexpected file: {filename}"}
+
+        os.makedirs(imagedir, exist_ok=True)
+        tmp = os.path.join(imagedir, f".{filename}.{job_id}.part")
+        h = hashlib.sha256()
+
+        try:
+            with open(tmp, "wb") as f:
+                left = size
+
+                while left > 0:
+                    chunk = rfile.read(min(left, checksums.CHUNK_SIZE))
+
+                    if not chunk:
+                        raise OSError("Upload ended early")
+
+                    h.update(chunk)
+                    f.write(chunk)
+                    left -= len(chunk)
+
+            if h.hexdigest() != expected:
+                return 422, {"error": f"SHA-256 mismatch: {h.hexdigest()} != {expected}"}
+
+            with self.lock:
+                # Still ours after the upload?
+                if not self.owned(worker_id, job_id):
+                    return 409, {"error": "job not leased to this worker"}
+
+                os.replace(tmp, os.path.join(imagedir, filename))
+                job["uploads"][filename] = expected
+
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+        return 200, {"sha256": expected}
+
+    def check_uploads(self, job):
+        # Every image needs its .xz and both sidecars, and the .xz must match its sidecar
+        errors = []
+
+        for image in job["images"]:
+            filename = f"kali-linux-{release}-{image}"
+
+            for ext in artifacts.file_ext:
+                if f"{filename}.{ext}" not in job["uploads"]:
+                    errors.append(f"missing {filename}.{ext}")
+
+            if f"{filename}.xz" in job["uploads"] and f"{filename}.xz.sha256sum" in job["uploads"]:
+                try:
+                    sidecar = checksums.read_sidecar(os.path.join(imagedir, f"{filename}.xz.sha256sum"))
+
+                except (OSError, IndexError):
+                    sidecar = ""
+
+                if sidecar != job["uploads"][f"{filename}.xz"]:
+                    errors.append(f"{filename}.xz does not match its sha256sum")
+
+        return errors
+
+    def complete(self, request):
+        worker_id = request.get("worker")
+
+        with self.lock:
+            job = self.owned(worker_id, request.get("job"))
+
+            if not job:
+                return 409, {"error": "job not leased to this worker"}
+
+            self.workers[worker_id]["running"].discard(job["id"])
+            job["log"] = f"{self.workers[worker_id]['name']}:{request.get('log', '')}"
+            exit_code = request.get("exit_code", 1)
+
+            if exit_code != 0:
+                self.requeue(job["id"], f"failed ({exit_code}) on {worker_id}")
+
+                return 200, {"status": "failed"}
+
+            errors = self.check_uploads(job)
+
+            if errors:
+                self.requeue(job["id"], f"bad artifacts from {worker_id}: {', '.join(errors)}")
+
+                return 200, {"status": "rejected", "errors": errors}
+
+            job["state"] = "ok"
+            job["status"] = "ok"
+            job["worker"] = worker_id
+            job["seconds"] = time.monotonic() - job["started"]
+
+        print(f"[+] Done: {job['script']} ({job['architecture']}) on {worker_id}")
+
+        return 200, {"status": "ok"}
+
+    def status(self):
+        with self.lock:
+            jobs = [{key: job[key] for key in ("id", "script", "architecture", "state", "attempts", "worker", "status")} for job in self.jobs]
+            workers = {worker_id: {
+                "slots": worker["slots"],
+                "native": worker["native"],
+                "running": sorted(worker["running"]),
+                "lost": worker["lost"]
+            } for worker_id, worker in self.workers.items()}
+
+        return 200, {"jobs": jobs, "workers": workers}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    coordinator = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode()
+
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def authorised(self):
+        if token and not hmac.compare_digest(self.headers.get("X-Farm-Token", ""), token):
+            self.reply(403, {"error": "bad token"})
+
+            return False
+
+        return True
+
+    def do_GET(self):
+        if not self.authorised():
+            return
+
+        if self.path == "/status":
+            self.reply(*self.coordinator.status())
+
+        else:
+            self.reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self.authorised():
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        except ValueError:
+            self.reply(400, {"error": "invalid JSON"})
+
+            return
+
+        routes = {
+            "/register": self.coordinator.register,
+            "/lease": self.coordinator.lease_job,
+            "/heartbeat": self.coordinator.heartbeat,
+            "/complete": self.coordinator.complete
+        }
+
+        if self.path in routes:
+            self.reply(*routes[self.path](request))
+
+        else:
+            self.reply(404, {"error": "not found"})
+
+    def do_PUT(self):
+        if not self.authorised():
+            return
+
+        parts = self.path.split("/")
+
+        # /artifacts/<job id>/<file name>
+        if len(parts) != 4 or parts[1] != "artifacts" or not parts[2].isdigit():
+            self.reply(404, {"error": "not found"})
+
+            return
+
+        try:
+            size = int(self.headers.get("Content-Length", ""))
+
+        except ValueError:
+            self.reply(411, {"error": "Content-Length required"})
+
+            return
+
+        try:
+            self.reply(*self.coordinator.upload(
+                self.headers.get("X-Worker", ""),
+                int(parts[2]),
+                parts[3],
+                self.headers.get("X-SHA256", "").lower(),
+                size,
+                self.rfile
+            ))
+
+        except OSError as e:
+            self.reply(500, {"error": str(e)})
+
+
+def print_summary(coordinator):
+    rows = [("Build script", "Arch", "Status", "Attempts", "Time", "Worker", "Log")]
+
+    for job in coordinator.jobs:
+        rows.append((
+            job["script"],
+            job["architecture"],
+            job["status"],
+            str(job["attempts"]),
+            build.duration(job["seconds"]),
+            job["worker"] or "-",
+            job["log"] or "-"
+        ))
+
+    print("")
+
+    for line in build.table(rows):
+        print(line)
+
+    ok = sum(1 for job in coordinator.jobs if job["state"] == "ok")
+    print(f"\nBuilt: {ok}/{len(coordinator.jobs)}")
+
+    return ok == len(coordinator.jobs)
+
+
+def run_coordinator():
+    try:
+        data = catalog.load(inputfile)
+
+    except OSError as e:
+        bail(f"Cannot open input file: {inputfile}", str(e))
+
+    selection = build.Selection(supports, architectures, vendors)
+    catalog.walk(data, [selection])
+    selected = list(selection.jobs.values())
+
+    if not selected:
+        bail("No build script matches the selection")
+
+    host, _, port = bind.rpartition(":")
+
+    coordinator = Coordinator(selected)
+    Handler.coordinator = coordinator
+
+    try:
+        server = http.server.ThreadingHTTPServer((host or "0.0.0.0", int(port)), Handler)
+
+    except (OSError, ValueError) as e:
+        bail(f"Cannot listen on {bind}", str(e))
+
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print(f"[i] {len(selected)} job(s), listening on {bind}, images in {imagedir}")
+
+    while not coordinator.finished():
+        time.sleep(1)
+        coordinator.reap()
+
+    # Give the idle workers a poll to hear that there is nothing left
+    time.sleep(poll_interval * 2)
+    server.shutdown()
+
+    exit(0 if print_summary(coordinator) else 1)
+
+
+# Worker
+# ------------------------------------------------------------
+
+class Lost(Exception):
+    pass
+
+
+def call(method, path, body=None, data=None, headers=None):
+    # JSON request to the coordinator, retried while it is unreachable
+    headers = dict(headers or {})
+
+    if token:
+        headers["X-Farm-Token"] = token
+
+    if body is not None:
+        data = json.dumps(body).encode()
+        headers["Content-Type"] = "application/json"
+
+    for attempt in range(5):
+        if hasattr(data, "seek"):
+            data.seek(0)
+
+        request = urllib.request.Request(f"{url}{path}", data=data, method=method, headers=headers)
+
+        try:
+            with urllib.request.urlopen(request, timeout=max(lease, 30)) as response:
+                return json.loads(response.read())
+
+        except urllib.error.HTTPError as e:
+            if e.code == 410:
+                raise Lost()
+
+            return json.loads(e.read() or b"{}") or {"error": f"HTTP {e.code}"}
+
+        except (urllib.error.URLError, OSError) as e:
+            error = e
+            time.sleep(min(2 ** attempt, 10))
+
+    raise OSError(f"Cannot reach the coordinator at {url}: {error}")
+
+
+class Worker:
+    def __init__(self):
+        self.cores = os.cpu_count() or 1
+        self.cores_per_job = min(cores_per_job, self.cores)
+        self.slots = max(1, self.cores // self.cores_per_job)
+        self.architectures = architectures or ["arm64", "armhf", "armel"]
+        self.native = native if native is not None else []
+        self.worker_id = ""
+        self.lease = lease
+        self.running = {}
+        self.cancelled = set()  # Leased jobs revoked before their build started
+        self.lock = threading.Lock()
+
+    def register(self):
+        response = call("POST", "/register", {
+            "name": name,
+            "cores": self.cores,
+            "slots": self.slots,
+            "architectures": self.architectures,
+            "native": self.native
+        })
+
+        self.worker_id = response["worker"]
+        self.lease = response["lease"]
+
+        print(f"[+] Registered as {self.worker_id}: {self.slots} slot(s) of {self.cores_per_job} core(s)")
+
+        return 0
+
+    def run(self, job):
+        # Build, upload the artifacts, report; runs in its own thread
+        os.makedirs(os.path.join(repodir, "logs"), exist_ok=True)
+        log_file = os.path.join(repodir, "logs", f"{os.path.splitext(job['script'])[0]}-{job['architecture']}.log")
+
+        env = dict(os.environ)
+        env["cpu_cores"] = str(self.cores_per_job)
+        env["cpu_limit"] = "100"
+        env["version"] = job["release"]
+        env["colour_output"] = "no"
+        env["TERM"] = env.get("TERM", "dumb")
+
+        # The catalog image name, so the artifacts match the release manifests
+        if job["images"]:
+            env["image_name"] = f"kali-linux-{job['release']}-{os.path.splitext(job['images'][0])[0]}"
+
+        with open(log_file, "a") as log:
+            log.write(f"\n### {time.strftime('%Y-%m-%d %H:%M:%S')} job {job['id']}: ./{job['script']} --arch {job['architecture']} {' '.join(job['args'])}\n")
+            log.flush()
+
+            # Artifacts older than this are from an earlier build
+            started = time.time()
+
+            with self.lock:
+                if job["id"] in self.cancelled:
+                    self.cancelled.discard(job["id"])
+                    del self.running[job["id"]]
+
+                    return 0
+
+                # A session of its own: cancel() stops debootstrap, nspawn, make, ... not just bash
+                self.running[job["id"]] = subprocess.Popen(
+                    ["bash", f"./{job['script']}", "--arch", job["architecture"]] + job["args"],
+                    cwd=repodir,
+                    env=env,
+                    stdin=subprocess.DEVNULL,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    start_new_session=True
+                )
+
+            exit_code = self.running[job["id"]].wait()
+
+        try:
+            if exit_code == 0:
+                self.upload(job, started)
+
+            response = call("POST", "/complete", {
+                "worker": self.worker_id,
+                "job": job["id"],
+                "exit_code": exit_code,
+                "log": log_file
+            })
+
+            print(f"[{'+' if response.get('status') == 'ok' else '-'}] {job['script']} ({job['architecture']}): {response.get('status', response.get('error'))}")
+
+        except (OSError, Lost) as e:
+            print(f"[-] {job['script']} ({job['architecture']}): cannot report: {e}")
+
+        finally:
+            with self.lock:
+                del self.running[job["id"]]
+
+        return 0
+
+    def upload(self, job, started):
+        # The artifacts this build wrote, not those left by an earlier one
+        for image in job["images"]:
+            for ext in upload_ext:
+                filename = f"kali-linux-{job['release']}-{image}.{ext}"
+                path = os.path.join(repodir, "images", filename)
+
+                if not os.path.isfile(path) or os.path.getmtime(path) < started:
+                    continue
+
+                with open(path, "rb") as f:
+                    response = call("PUT", f"/artifacts/{job['id']}/{filename}", data=f, headers={
+                        "X-Worker": self.worker_id,
+                        "X-SHA256": checksums.sha256_file(path),
+                        "Content-Length": str(os.path.getsize(path))
+                    })
+
+                if "error" in response:
+                    raise OSError(f"Upload of {filename} failed: {response['error']}")
+
+                print(f"[+] Uploaded: {filename}")
+
+        return 0
+
+    def cancel(self, job_ids):
+        with self.lock:
+            for job_id in job_ids:
+                if job_id not in self.running:
+                    continue
+
+                print(f"[-] Job {job_id} no longer leased to us, stopping it")
+
+                if self.running[job_id] is None:
+                    # Not started yet, run() will not start it
+                    self.cancelled.add(job_id)
+
+                    continue
+
+                try:
+                    os.killpg(self.running[job_id].pid, signal.SIGTERM)
+
+                except ProcessLookupError:
+                    pass
+
+    def loop(self):
+        self.register()
+        last_beat = time.monotonic()
+
+        while True:
+            try:
+                # Fill the free slots
+                while len(self.running) < self.slots:
+                    response = call("POST", "/lease", {"worker": self.worker_id})
+                    job = response.get("job")
+
+                    if not job:
+                        break
+
+                    print(f"[+] Building: {job['script']} ({job['architecture']})")
+
+                    with self.lock:
+                        self.running[job["id"]] = None
+
+                    threading.Thread(target=self.run, args=(job,), daemon=True).start()
+
+                with self.lock:
+                    idle = not self.running
+
+                if idle and response.get("done"):
+                    print("[i] No jobs left")
+
+                    return 0
+
+                if time.monotonic() - last_beat >= self.lease / 3:
+                    with self.lock:
+                        jobs = list(self.running)
+
+                    self.cancel(call("POST", "/heartbeat", {"worker": self.worker_id, "jobs": jobs}).get("cancel", []))
+                    last_beat = time.monotonic()
+
+            except Lost:
+                # The coordinator gave our jobs away; stop them and start over
+                print("[-] Lost our lease, registering again")
+
+                with self.lock:
+                    jobs = list(self.running)
+
+                self.cancel(jobs)
+                self.register()
+
+            time.sleep(poll_interval)
+
+
+def main(argv):
+    global native
+
+    getargs(argv)
+
+    if mode == "coordinator":
+        run_coordinator()
+
+    if not native_set:
+        native = NATIVE.get(platform.machine(), [])
+
+    try:
+        ret = Worker().loop()
+
+    except OSError as e:
+        bail("Worker stopped", str(e))
+
+    exit(ret)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,57 +1,20 @@
 #!/usr/bin/env python3
 
 import sys
-from datetime import datetime
 
-import yaml  # python3 -m pip install pyyaml --user
+import catalog
+import reports
 
 OUTPUT_FILE = "./device-stats.md"
-INPUT_FILE = "./devices.yml"
-
-repo_msg = f"""
-_This table was [generated automatically](https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/devices.yml) on {datetime.now().strftime('%Y-%B-%d %H:%M:%S')} from the [Kali ARM GitLab repository](https://gitlab.com/kalilinux/build-scripts/kali-arm)_
-"""
 
-qty_devices = 0
-qty_images = 0
+INPUT_FILE = "./devices.yml"
 
 # Input:
 # ------------------------------------------------------------
 # See: ./devices.yml
 # https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/devices.yml
-
-
-def yaml_parse(content):
-    result = ""
-    lines = content.split("\n")
-
-    for line in lines:
-        if line.strip() and not line.strip().startswith("#"):
-            result += line + "\n"
-
-    return yaml.safe_load(result)
-
-
-def generate_table(data):
-    global qty_devices, qty_images
-
-    default = ""
-
-    table = "| Vendor | [Board](devices.html) | [Images](images.html) |\n"
-    table += "|--------|-----------------------|-----------------------|\n"
-
-    # Iterate over per input (depth 1)
-    for yaml in data["devices"]:
-        # Iterate over vendors
-        for vendor in yaml.keys():
-            # Iterate over board (depth 2)
-            for board in yaml[vendor]:
-                qty_devices += 1
-                qty_images += len(board.get("images", default))
-
-                table += f"| {vendor} | {board.get('name', default)} | {len(board.get('images', default))} |\n"
-
-    return table
+#
+# The table itself is built by reports.DeviceStats (see ./bin/reports.py)
 
 
 def read_file(file):
@@ -68,17 +31,7 @@ def read_file(file):
 def write_file(data, file):
     try:
         with open(file, "w") as f:
-            meta = "---\n"
-            meta += "title: Kali ARM Device Statistics\n"
-            meta += "---\n\n"
-
-            stats = f"- The official [Kali ARM repository](https://gitlab.com/kalilinux/build-scripts/kali-arm) contains [build-scripts]((https://gitlab.com/kalilinux/build-scripts/kali-arm)) to support [**{qty_devices}** Kali ARM devices](devices.html)\n"
-            stats += "- [Kali ARM Statistics](index.html)\n\n"
-
-            f.write(str(meta))
-            f.write(str(stats))
             f.write(str(data))
-            f.write(str(repo_msg))
 
             print(f"[+] File: {OUTPUT_FILE} successfully written")
 
@@ -88,9 +41,9 @@ def write_file(data, file):
     return 0
 
 
-def print_summary():
-    print(f"Devices: {qty_devices}")
-    print(f"Images : {qty_images}")
+def print_summary(report):
+    for line in report.summary():
+        print(line)
 
 
 def main(argv):
@@ -98,14 +51,15 @@ def main(argv):
     data = read_file(INPUT_FILE)
 
     # Get data
-    res = yaml_parse(data)
-    generated_markdown = generate_table(res)
+    res = catalog.parse(data)
+    report = reports.DeviceStats()
+    catalog.walk(res, [report])
 
     # Create markdown file
-    write_file(generated_markdown, OUTPUT_FILE)
+    write_file(report.render(), OUTPUT_FILE)
 
     # Print result
-    print_summary()
+    print_summary(report)
 
     # Exit
     exit(0)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+# ARM Devices ~ https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/devices.yml
+
+###############################################
+# Script to generate every devices.yml report in a single pass
+#
+# It parses devices.yml once, walks it once, and feeds every report
+# (see ./bin/reports.py) from that walk. It creates:
+# - "<outputdir>/device-stats.md"
+# - "<outputdir>/devices.md"
+# - "<outputdir>/image-overview.md"
+# - "<outputdir>/image-stats.md"
+# - "<outputdir>/images.md"
+# - "<outputdir>/kernel-stats.md"
+# - "<outputdir>/manifest.json" (only when a release is given, same as ./bin/pre-release.py)
+#
+# Dependencies:
+# sudo apt -y install python3 python3-yaml
+#
+# Usage:
+# ./bin/generate_reports.py [-i <input file>] [-o <output directory>] [-r <release>]
+#
+# E.g.:
+# ./bin/generate_reports.py
+# ./bin/generate_reports.py -i devices.yml -o public/ -r 2022.3
+
+import datetime
+import getopt
+import os
+import sys
+
+import catalog
+import reports
+
+release = ""
+
+outputdir = "."
+
+inputfile = "./devices.yml"
+
+# Input:
+# ------------------------------------------------------------
+# See: ./devices.yml
+# https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/devices.yml
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} [-i <input file>] [-o <output directory>] [-r <release>]"
+        outstr += f"\nE.g. : {prog} -i devices.yml -o public/ -r {datetime.datetime.now().year}.1\n"
+
+    print(outstr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global inputfile, outputdir, release
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hi:o:r:",
+            [
+                "inputfile=",
+                "outputdir=",
+                "release="
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    for opt, arg in opts:
+        if opt == "-h":
+            bail()
+
+        elif opt in ("-i", "--inputfile"):
+            inputfile = arg
+
+        elif opt in ("-r", "--release"):
+            release = arg
+
+        elif opt in ("-o", "--outputdir"):
+            outputdir = arg.rstrip("/") or "/"
+
+        else:
+            bail(f"Unrecognised argument: {opt}")
+
+    return 0
+
+
+def createdir(dir):
+    try:
+        if not os.path.exists(dir):
+            os.makedirs(dir)
+
+    except:
+        bail(f"Directory {dir} does not exist and cannot be created")
+
+    return 0
+
+
+def readfile(file):
+    try:
+        with open(file) as f:
+            data = f.read()
+
+    except:
+        bail(f"Cannot open input file: {file}")
+
+    return data
+
+
+def writefile(data, file):
+    try:
+        with open(file, "w") as f:
+            f.write(str(data))
+
+    except:
+        bail(f"Cannot write to output file: {file}")
+
+    print(f"[+] File: {file} successfully written")
+
+    return 0
+
+
+def main(argv):
+    getargs(argv)
+
+    visitors = [
+        reports.DeviceStats(),
+        reports.DevicesTable(),
+        reports.ImageOverview(),
+        reports.ImageStats(),
+        reports.ImagesTable(),
+        reports.KernelStats()
+    ]
+
+    if release:
+        visitors.append(reports.Manifest(release))
+
+    # Get data, a single walk feeds every report
+    res = catalog.parse(readfile(inputfile))
+    catalog.walk(res, visitors, warn=True)
+
+    # Create output directory if required
+    createdir(outputdir)
+
+    for report in visitors:
+        writefile(report.render(), os.path.join(outputdir, report.output_file))
+
+    # Print result and exit
+    for report in visitors:
+        print(f"\n{report.output_file}:")
+
+        for line in report.summary():
+            print(line)
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
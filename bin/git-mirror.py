@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+
+###############################################
+# Local mirror of the git repositories the build-scripts clone
+#
+# Build-scripts clone kernel trees, u-boot, sunxi-tools, toolchains, ... for
+# every image. This keeps a bare mirror of each repository under one store
+# dir (-m) and serves clones from it:
+# - "clone" takes the `git clone` arguments the build-scripts use
+#   (--depth, -b/--branch, --single-branch, <url> [<dir>]). The mirror is
+#   created on first use, and fetched again when the branch or tag is not
+#   in it or it was last fetched more than -r seconds ago
+# - full clones hardlink the mirror objects (a copy across file systems),
+#   --depth clones are packed from the mirror over file://
+# - the clone's origin is the upstream url, not the mirror
+# - "rev" prints the commit of a branch or tag (default HEAD) from the
+#   mirror, updated as for a clone, e.g. for the kernel cache keys
+# - with -O (offline) nothing is fetched: the mirrors must be seeded, e.g.
+#   with "fetch" or an earlier online build. A failed fetch of a ref that
+#   is already in the mirror is a warning, the mirror is used as it is
+#
+# Concurrent builds share the store: creating and fetching a mirror takes an
+# exclusive lock on it, cloning from it a shared one.
+#
+# Dependencies:
+# sudo apt -y install python3 git
+#
+# Usage:
+# ./bin/git-mirror.py clone -m <mirror dir> [-O] [-r <seconds>] [--depth <n>] [-b <branch or tag>] [--single-branch] <url> [<dir>]
+# ./bin/git-mirror.py rev -m <mirror dir> [-O] [-r <seconds>] <url> [<branch or tag>]
+# ./bin/git-mirror.py fetch -m <mirror dir> <url>...
+# ./bin/git-mirror.py list -m <mirror dir>
+#
+# E.g.:
+# ./bin/git-mirror.py clone -m local/git-mirror --depth 1 -b 4.14 https://github.com/beagleboard/linux base/beaglebone-black/working/usr/src/kernel
+# ./bin/git-mirror.py fetch -m local/git-mirror https://github.com/linux-sunxi/u-boot-sunxi https://github.com/linux-sunxi/sunxi-tools
+
+import fcntl
+import getopt
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+command = ""
+
+mirrordir = ""
+
+offline = False
+
+refresh = 3600  # Seconds
+
+depth = 0
+
+branch = ""
+
+single_branch = False
+
+quiet = False
+
+args = []
+
+# Touched after every successful fetch, "list" and the refresh age read it
+FETCHED_FILE = "kali-arm-fetched"
+
+UNSAFE = re.compile(r"[^\w.-]+")
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} clone -m <mirror dir> [-O] [-r <seconds>] [--depth <n>] [-b <branch or tag>] [--single-branch] <url> [<dir>]"
+        outstr += f"\n       {prog} rev -m <mirror dir> [-O] [-r <seconds>] <url> [<branch or tag>]"
+        outstr += f"\n       {prog} fetch -m <mirror dir> <url>..."
+        outstr += f"\n       {prog} list -m <mirror dir>"
+        outstr += f"\nE.g. : {prog} clone -m local/git-mirror --depth 1 -b 4.14 https://github.com/beagleboard/linux linux\n"
+
+    print(outstr, file=sys.stderr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global command, mirrordir, offline, refresh, depth, branch, single_branch, quiet, args
+
+    commands = {"clone": 1, "rev": 1, "fetch": 1, "list": 0}
+
+    if not argv or argv[0] not in commands:
+        bail("Expected a command: " + ", ".join(commands))
+
+    command = argv[0]
+
+    # Options anywhere, as `git clone` takes them
+    try:
+        opts, args = getopt.gnu_getopt(
+            argv[1:],
+            "hm:Or:b:q",
+            [
+                "mirror-dir=",
+                "offline",
+                "refresh=",
+                "depth=",
+                "branch=",
+                "single-branch",
+                "quiet"
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-m", "--mirror-dir"):
+                mirrordir = arg
+
+            elif opt in ("-O", "--offline"):
+                offline = True
+
+            elif opt in ("-r", "--refresh"):
+                refresh = int(arg)
+
+            elif opt == "--depth":
+                depth = int(arg)
+
+            elif opt in ("-b", "--branch"):
+                branch = arg
+
+            elif opt == "--single-branch":
+                single_branch = True
+
+            elif opt in ("-q", "--quiet"):
+                quiet = True
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    except ValueError as e:
+        bail(f"Invalid value: {e}")
+
+    if not mirrordir:
+        bail("Missing required argument: -m/--mirror-dir")
+
+    if len(args) < commands[command] or (command in ("clone", "rev") and len(args) > 2):
+        bail(f"Missing arguments for {command}")
+
+    return 0
+
+
+def git(*cmd, cwd=None, capture=False):
+    proc = subprocess.run(["git"] + list(cmd), cwd=cwd, stdout=subprocess.PIPE if capture else None, universal_newlines=True)
+
+    if proc.returncode != 0:
+        raise OSError(f"git {' '.join(cmd)} failed ({proc.returncode})")
+
+    return proc.stdout
+
+
+def mirror_name(url):
+    # <store>/<host>/<path>.git, the same for "https://host/x/y", "https://host/x/y.git/" and "git@host:x/y"
+    parts = urllib.parse.urlsplit(url)
+
+    if parts.scheme and parts.netloc:
+        host, path = parts.hostname, parts.path
+
+    elif parts.scheme == "file":
+        host, path = "localhost", parts.path
+
+    elif re.match(r"^[^/:]+:", url) and not os.path.exists(url):
+        host, _, path = url.partition(":")
+        host = host.rpartition("@")[2]
+
+    else:
+        host, path = "localhost", os.path.abspath(url)
+
+    path = path.strip("/")
+
+    if path.endswith(".git"):
+        path = path[:-4]
+
+    components = [UNSAFE.sub("_", c) for c in [host] + path.split("/") if c and c not in (".", "..")]
+
+    return os.path.join(*components) + ".git"
+
+
+def upstream(url):
+    # Local paths as absolute paths, the clones' origin is then valid from anywhere
+    if "://" in url or (re.match(r"^[^/:]+:", url) and not os.path.exists(url)):
+        return url
+
+    return os.path.abspath(url)
+
+
+class Mirror:
+    def __init__(self, url):
+        self.url = upstream(url)
+        self.path = os.path.join(os.path.abspath(mirrordir), mirror_name(url))
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock_fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+
+    def lock(self, exclusive):
+        fcntl.flock(self.lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def unlock(self):
+        fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+    def exists(self):
+        return os.path.isfile(os.path.join(self.path, "HEAD"))
+
+    def fetched(self):
+        # Seconds since the last fetch
+        try:
+            return time.time() - os.stat(os.path.join(self.path, FETCHED_FILE)).st_mtime
+
+        except OSError:
+            return float("inf")
+
+    def has(self, ref):
+        # Branch or tag (or HEAD) in the mirror
+        for name in (f"refs/heads/{ref}", f"refs/tags/{ref}", ref):
+            if subprocess.run(["git", "--git-dir", self.path, "rev-parse", "-q", "--verify", f"{name}^{{commit}}"],
+                              stdout=subprocess.DEVNULL).returncode == 0:
+                return True
+
+        return False
+
+    def revision(self, ref):
+        # Commit of ref in the mirror, tags over branches as `git ls-remote` peels them
+        for name in (f"refs/tags/{ref}", f"refs/heads/{ref}", ref):
+            proc = subprocess.run(["git", "--git-dir", self.path, "rev-parse", "-q", "--verify", f"{name}^{{commit}}"],
+                                  stdout=subprocess.PIPE, universal_newlines=True)
+
+            if proc.returncode == 0:
+                return proc.stdout.strip()
+
+        raise OSError(f"No {ref} in the mirror of {self.url}")
+
+    def create(self):
+        # Clone into a temporary dir next to the mirror, a failed clone leaves nothing behind
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(self.path))
+
+        try:
+            git("clone", "--mirror", "--quiet", self.url, tmp)
+
+            # A detached auto gc would outlive the lock
+            git("--git-dir", tmp, "config", "gc.autoDetach", "false")
+            os.rename(tmp, self.path)
+
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+            raise
+
+        self.touch()
+
+    def fetch(self):
+        git("--git-dir", self.path, "remote", "update", "--prune")
+        self.touch()
+
+    def touch(self):
+        with open(os.path.join(self.path, FETCHED_FILE), "w") as f:
+            f.write(f"{self.url}\n")
+
+    def update(self, ref):
+        # Exclusive lock held: create or fetch the mirror as needed for ref
+        if not self.exists():
+            if offline:
+                raise OSError(f"No mirror of {self.url} (offline)")
+
+            print(f"[i] Mirroring {self.url}", file=sys.stderr)
+            self.create()
+
+            return
+
+        present = self.has(ref)
+
+        if offline and not present:
+            raise OSError(f"No {ref} in the mirror of {self.url} (offline)")
+
+        if offline or (present and self.fetched() < refresh):
+            return
+
+        print(f"[i] Fetching {self.url}", file=sys.stderr)
+
+        try:
+            self.fetch()
+
+        except OSError as e:
+            if not present:
+                raise
+
+            print(f"[-] {e}, using the mirror as it is", file=sys.stderr)
+
+    def clone(self, target):
+        # Shared lock held: `git clone` from the mirror, with the upstream as origin
+        source = self.path
+        cmd = ["clone"]
+
+        if depth:
+            # Shallow clones are not made from a local path
+            source = f"file://{self.path}"
+            cmd += ["--depth", str(depth)]
+
+        if branch:
+            cmd += ["--branch", branch]
+
+        if single_branch:
+            cmd += ["--single-branch"]
+
+        if quiet:
+            cmd += ["--quiet"]
+
+        git(*cmd, source, target)
+        git("-C", target, "remote", "set-url", "origin", self.url)
+
+
+def clone():
+    url = args[0]
+
+    # Where `git clone` puts it
+    target = args[1] if len(args) > 1 else os.path.basename(url.rstrip("/"))
+
+    if len(args) == 1 and target.endswith(".git"):
+        target = target[:-4]
+
+    mirror = Mirror(url)
+    mirror.lock(True)
+
+    try:
+        mirror.update(branch or "HEAD")
+
+        # Fetches wait for the clones to finish
+        mirror.lock(False)
+        mirror.clone(target)
+
+    finally:
+        mirror.unlock()
+
+
+def revision():
+    url = args[0]
+    ref = args[1] if len(args) > 1 else "HEAD"
+
+    mirror = Mirror(url)
+    mirror.lock(True)
+
+    try:
+        mirror.update(ref)
+        mirror.lock(False)
+
+        return mirror.revision(ref)
+
+    finally:
+        mirror.unlock()
+
+
+def fetch(url):
+    mirror = Mirror(url)
+    mirror.lock(True)
+
+    try:
+        if mirror.exists():
+            mirror.fetch()
+
+        else:
+            mirror.create()
+
+    finally:
+        mirror.unlock()
+
+    print(f"[+] {mirror.url}: {mirror.path}", file=sys.stderr)
+
+
+def mirrors():
+    # [(path, url, seconds since the last fetch)]
+    found = []
+
+    for root, dirs, names in os.walk(os.path.abspath(mirrordir)):
+        dirs.sort()
+
+        for name in list(dirs):
+            if name.endswith(".git") and os.path.isfile(os.path.join(root, name, "HEAD")):
+                dirs.remove(name)
+                mirror = os.path.join(root, name)
+
+                try:
+                    with open(os.path.join(mirror, FETCHED_FILE)) as f:
+                        url = f.read().strip()
+
+                    age = time.time() - os.stat(os.path.join(mirror, FETCHED_FILE)).st_mtime
+
+                except OSError:
+                    url, age = "?", float("inf")
+
+                found.append((mirror, url, age))
+
+    return found
+
+
+def size(path):
+    total = 0
+
+    for root, dirs, names in os.walk(path):
+        total += sum(os.lstat(os.path.join(root, name)).st_blocks * 512 for name in names)
+
+    return total
+
+
+def main(argv):
+    getargs(argv)
+
+    if command == "clone":
+        try:
+            clone()
+
+        except OSError as e:
+            bail(f"Cannot clone {args[0]}", str(e))
+
+    elif command == "rev":
+        try:
+            print(revision())
+
+        except OSError as e:
+            bail(f"Cannot resolve {' '.join(args)}", str(e))
+
+    elif command == "fetch":
+        try:
+            for url in args:
+                fetch(url)
+
+        except OSError as e:
+            bail("Cannot fetch", str(e))
+
+    elif command == "list":
+        for path, url, age in mirrors():
+            fetched = time.strftime("%Y-%m-%d %H:%M", time.localtime(time.time() - age)) if age != float("inf") else "never"
+            print(f"{url}  {size(path) / (1 << 20):>8.0f} MiB  {fetched}  {os.path.relpath(path, mirrordir)}")
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+
+###############################################
+# Cache of kernel and bootloader builds, keyed by what goes into them
+#
+# Device scripts with a custom kernel (beaglebone-black.sh, cubox.sh,
+# gateworks-*.sh, ...) clone, patch and compile it for every image. The
+# result only depends on:
+# - the source revision: -g <git url>#<branch, tag or HEAD>, resolved with
+#   `git ls-remote` (no clone), or #<commit> as it is (kernel_cache_restore()
+#   passes the commit from the local git mirror when git_mirror=yes)
+# - the config and patches: files, hashed by content
+# - the toolchain: -t <compiler>, its `--version`
+# - the architecture and the build recipe (defconfig, make targets): -e
+# so the built kernel image, modules, dtbs, the cleaned source tree, or the
+# bootloader binaries, are stored under a hash of those
+# (kernel_cache_restore()/kernel_cache_save() in ./common.d/functions.sh).
+#
+# What a build adds can be given as paths, or found by recording the
+# target dir before the build ("mark") and storing what is new or changed
+# after it (modules_install, headers_install, out-of-tree modules, ...).
+#
+# Entries are compressed tarballs (zstd, else pigz, else gzip) with
+# ownership, xattrs and ACLs. After each save, least recently used entries
+# are removed until the cache fits in -s GiB, and entries older than -m
+# days are misses. Concurrent builds share the cache: restores take a
+# shared lock, saves and evictions an exclusive one.
+#
+# Dependencies:
+# sudo apt -y install python3 git tar zstd
+#
+# Usage:
+# ./bin/kernel-cache.py key [-e <value>]... [-g <git url>#<ref>]... [-t <compiler>]... [<file or directory>]...
+# ./bin/kernel-cache.py mark <target dir> <manifest>
+# ./bin/kernel-cache.py restore -c <cache dir> [-m <max age days>] <key> <target dir>
+# ./bin/kernel-cache.py save -c <cache dir> [-s <max size GiB>] [-M <manifest>] <key> <target dir> [<path>]...
+# ./bin/kernel-cache.py list -c <cache dir>
+# ./bin/kernel-cache.py prune -c <cache dir> [-s <max size GiB>] [-m <max age days>]
+#
+# E.g.:
+# ./bin/kernel-cache.py key -e armhf -e bb.org_defconfig -g "https://github.com/beagleboard/linux#4.14" -t arm-linux-gnueabihf-gcc patches/kali-wifi-injection-4.14.patch
+# ./bin/kernel-cache.py save -c local/kernel-cache -M base/kernel-cache.manifest 5b1e...9a base/beaglebone-black/working
+
+import fcntl
+import getopt
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+command = ""
+
+cachedir = ""
+
+max_size = 16  # GiB
+
+max_age = 30  # Days
+
+manifest = ""
+
+values = []
+
+sources = []
+
+compilers = []
+
+args = []
+
+repodir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+META_FILE = "meta.json"
+
+ARCHIVE = "build.tar"
+
+TAR_OPTIONS = ["--numeric-owner", "--xattrs", "--xattrs-include=*", "--acls"]
+
+SHA1 = re.compile(r"^[0-9a-f]{40}$")
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} key [-e <value>]... [-g <git url>#<ref>]... [-t <compiler>]... [<file or directory>]..."
+        outstr += f"\n       {prog} mark <target dir> <manifest>"
+        outstr += f"\n       {prog} restore -c <cache dir> [-m <max age days>] <key> <target dir>"
+        outstr += f"\n       {prog} save -c <cache dir> [-s <max size GiB>] [-M <manifest>] <key> <target dir> [<path>]..."
+        outstr += f"\n       {prog} list -c <cache dir>"
+        outstr += f"\n       {prog} prune -c <cache dir> [-s <max size GiB>] [-m <max age days>]"
+        outstr += f"\nE.g. : {prog} key -e armhf -g \"https://github.com/beagleboard/linux#4.14\" -t arm-linux-gnueabihf-gcc patches/kali-wifi-injection-4.14.patch\n"
+
+    print(outstr, file=sys.stderr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global command, cachedir, max_size, max_age, manifest, values, sources, compilers, args
+
+    # Minimum number of arguments
+    commands = {"key": 0, "mark": 2, "restore": 2, "save": 2, "list": 0, "prune": 0}
+
+    if not argv or argv[0] not in commands:
+        bail("Expected a command: " + ", ".join(commands))
+
+    command = argv[0]
+
+    try:
+        opts, args = getopt.getopt(
+            argv[1:],
+            "hc:e:g:t:m:s:M:",
+            [
+                "cachedir=",
+                "value=",
+                "git=",
+                "toolchain=",
+                "max-age=",
+                "max-size=",
+                "manifest="
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-c", "--cachedir"):
+                cachedir = arg
+
+            elif opt in ("-e", "--value"):
+                values.append(arg)
+
+            elif opt in ("-g", "--git"):
+                sources.append(arg)
+
+            elif opt in ("-t", "--toolchain"):
+                compilers.append(arg)
+
+            elif opt in ("-m", "--max-age"):
+                max_age = float(arg)
+
+            elif opt in ("-s", "--max-size"):
+                max_size = float(arg)
+
+            elif opt in ("-M", "--manifest"):
+                manifest = arg
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    except ValueError as e:
+        bail(f"Invalid value: {e}")
+
+    if command not in ("key", "mark") and not cachedir:
+        bail("Missing required argument: -c/--cachedir")
+
+    if len(args) < commands[command] or (command in ("mark", "restore") and len(args) != 2):
+        bail(f"Missing arguments for {command}")
+
+    return 0
+
+
+def git_revision(source):
+    # Commit of <url>#<ref> on the remote
+    url, _, ref = source.partition("#")
+    ref = ref or "HEAD"
+
+    if SHA1.match(ref):
+        return ref
+
+    proc = subprocess.run(["git", "ls-remote", url, ref, f"{ref}^{{}}"], stdout=subprocess.PIPE, universal_newlines=True)
+
+    if proc.returncode != 0:
+        raise OSError(f"git ls-remote failed: {url}")
+
+    found = {}
+
+    for line in proc.stdout.splitlines():
+        commit, _, name = line.partition("\t")
+        found[name] = commit
+
+    # A peeled annotated tag is the commit, then branches over tags
+    for name in (f"refs/tags/{ref}^{{}}", f"refs/heads/{ref}", f"refs/tags/{ref}", ref):
+        if name in found:
+            return found[name]
+
+    raise OSError(f"No such ref: {ref} in {url}")
+
+
+def toolchain(compiler):
+    try:
+        proc = subprocess.run([compiler, "--version"], stdout=subprocess.PIPE, universal_newlines=True)
+
+    except OSError as e:
+        raise OSError(f"Cannot run {compiler}: {e.strerror}")
+
+    return proc.stdout.split("\n", 1)[0]
+
+
+def cache_key():
+    # SHA-256 over the values, the source revisions, the toolchains, then every file (name, content)
+    h = hashlib.sha256()
+
+    for kind, value in [("value", v) for v in values] + \
+                       [("git", f"{s.partition('#')[0]}#{git_revision(s)}") for s in sources] + \
+                       [("toolchain", toolchain(c)) for c in compilers]:
+        h.update(f"{kind}:{len(value)}:{value}\n".encode())
+
+    for path in args:
+        files = [path]
+
+        if os.path.isdir(path):
+            files = []
+
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+
+                files += [os.path.join(root, name) for name in sorted(names)]
+
+        elif not os.path.exists(path):
+            raise OSError(f"No such file or directory: {path}")
+
+        for file in files:
+            # The same key wherever the repository is
+            name = os.path.relpath(os.path.abspath(file), repodir)
+            h.update(f"file:{name}\n".encode())
+
+            with open(file, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+
+    return h.hexdigest()
+
+
+def scan(target):
+    # {relative path: [inode, mtime ns, size]} of everything under target
+    found = {}
+
+    for root, dirs, names in os.walk(target):
+        for name in dirs + names:
+            path = os.path.join(root, name)
+            st = os.lstat(path)
+            found[os.path.relpath(path, target)] = [st.st_ino, st.st_mtime_ns, st.st_size]
+
+    return found
+
+
+def changed(target, before):
+    # Paths new or modified since the mark, parents first
+    return sorted(path for path, state in scan(target).items() if before.get(path) != state)
+
+
+def compressor():
+    # tar -I program, fastest available
+    for program in (["zstd", "-T0", "-3"], ["pigz"], ["gzip", "-1"]):
+        if shutil.which(program[0]):
+            return program
+
+    return ["gzip"]
+
+
+class Cache:
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock_fd = os.open(os.path.join(self.directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+
+    def lock(self, exclusive):
+        fcntl.flock(self.lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def unlock(self):
+        fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+    def entries(self):
+        # [(key, meta, last used)], least recently used first
+        found = []
+
+        for key in os.listdir(self.directory):
+            meta_file = os.path.join(self.directory, key, META_FILE)
+
+            try:
+                with open(meta_file) as f:
+                    meta = json.load(f)
+
+                found.append((key, meta, os.stat(meta_file).st_mtime))
+
+            except (OSError, ValueError):
+                continue
+
+        return sorted(found, key=lambda entry: entry[2])
+
+    def expired(self, meta):
+        return max_age > 0 and time.time() - meta.get("created", 0) > max_age * 86400
+
+    def restore(self, key, target):
+        # True on a hit, the build is then extracted over target
+        entry = os.path.join(self.directory, key)
+        self.lock(False)
+
+        try:
+            try:
+                with open(os.path.join(entry, META_FILE)) as f:
+                    meta = json.load(f)
+
+            except (OSError, ValueError):
+                return False
+
+            if self.expired(meta):
+                print(f"[i] Build {key[:12]} is older than {max_age:g} day(s)", file=sys.stderr)
+
+                return False
+
+            os.makedirs(target, exist_ok=True)
+            cmd = ["tar"] + TAR_OPTIONS + ["-I", " ".join(meta["compressor"]), "-C", target, "-xpf", os.path.join(entry, ARCHIVE)]
+
+            if subprocess.run(cmd).returncode != 0:
+                raise OSError(f"Cannot extract build {key[:12]} into {target}")
+
+            # Last used, for the LRU eviction
+            os.utime(os.path.join(entry, META_FILE))
+
+        finally:
+            self.unlock()
+
+        return True
+
+    def save(self, key, target, paths):
+        # Store paths (relative to target), then evict down to max_size
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix=f".{key[:12]}-")
+        meta = {"key": key, "created": time.time(), "compressor": compressor(), "paths": len(paths)}
+
+        try:
+            cmd = ["tar"] + TAR_OPTIONS + ["-I", " ".join(meta["compressor"]), "-C", target, "--no-recursion", "--null", "-T", "-",
+                                           "-cf", os.path.join(tmp, ARCHIVE)]
+            proc = subprocess.run(cmd, input="\0".join(paths).encode())
+
+            if proc.returncode != 0:
+                raise OSError(f"Cannot archive the build in {target}")
+
+            meta["size"] = os.path.getsize(os.path.join(tmp, ARCHIVE))
+
+            with open(os.path.join(tmp, META_FILE), "w") as f:
+                json.dump(meta, f, indent=2)
+
+            self.lock(True)
+
+            try:
+                # Another build may have saved the same key meanwhile
+                shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+                os.rename(tmp, os.path.join(self.directory, key))
+                self.evict(keep=key)
+
+            finally:
+                self.unlock()
+
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        return meta
+
+    def evict(self, keep=None):
+        # Lock held by the caller. Expired first, then least recently used
+        entries = self.entries()
+        total = sum(meta.get("size", 0) for key, meta, last_used in entries)
+        removed = []
+
+        for key, meta, last_used in entries:
+            if key == keep:
+                continue
+
+            if self.expired(meta) or total > max_size * (1 << 30):
+                shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+                total -= meta.get("size", 0)
+                removed.append(key)
+
+        return removed
+
+
+def save_paths(target):
+    # Explicit paths (directories with their contents), else what changed since the mark
+    if len(args) > 2:
+        paths = []
+
+        for path in args[2:]:
+            paths.append(os.path.normpath(path))
+
+            if os.path.isdir(os.path.join(target, path)):
+                paths += [os.path.join(path, name) for name in sorted(scan(os.path.join(target, path)))]
+
+        return paths
+
+    if not manifest:
+        bail("save needs paths or -M <manifest>")
+
+    with open(manifest) as f:
+        before = json.load(f)
+
+    return changed(target, before)
+
+
+def main(argv):
+    getargs(argv)
+
+    if command == "key":
+        try:
+            print(cache_key())
+
+        except OSError as e:
+            bail("Cannot compute the key", str(e))
+
+        exit(0)
+
+    if command == "mark":
+        try:
+            with open(args[1], "w") as f:
+                json.dump(scan(args[0]), f)
+
+        except OSError as e:
+            bail(f"Cannot record {args[0]}", str(e))
+
+        exit(0)
+
+    cache = Cache(cachedir)
+
+    if command == "restore":
+        try:
+            hit = cache.restore(args[0], args[1])
+
+        except OSError as e:
+            bail("Cannot restore", str(e))
+
+        print(f"[{'+' if hit else 'i'}] Kernel build {args[0][:12]}: {'hit' if hit else 'miss'}", file=sys.stderr)
+
+        exit(0 if hit else 1)
+
+    elif command == "save":
+        try:
+            paths = save_paths(args[1])
+
+            if not paths:
+                bail("Nothing to save", f"No new or changed files in {args[1]}")
+
+            meta = cache.save(args[0], args[1], paths)
+
+        except OSError as e:
+            bail("Cannot save", str(e))
+
+        print(f"[+] Kernel build {args[0][:12]} saved ({len(paths)} paths, {meta['size'] / (1 << 20):.0f} MiB)", file=sys.stderr)
+
+    elif command == "list":
+        for key, meta, last_used in cache.entries():
+            print(f"{key}  {meta.get('size', 0) / (1 << 20):>8.0f} MiB  {meta.get('paths', 0):>7} paths  {time.strftime('%Y-%m-%d %H:%M', time.localtime(last_used))}")
+
+    elif command == "prune":
+        cache.lock(True)
+
+        try:
+            removed = cache.evict()
+
+        finally:
+            cache.unlock()
+
+        print(f"[+] Removed {len(removed)} build(s)", file=sys.stderr)
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
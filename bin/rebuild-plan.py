@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+
+###############################################
+# Which images a change needs rebuilt
+#
+# Every image in devices.yml is built by its build-script. This follows,
+# from the build-script:
+# - the build-script it runs ("./raspberry-pi.sh --arch arm64 "$@"")
+# - the common.d/ files it sources or `include`s, and theirs
+# - the ./bin/ scripts they run, and the ./bin/ modules those import or run
+#   (comments are left out)
+# - the bsp/, kernel-configs/ and patches/ paths they reference, as files,
+#   directories or globs ("/bsp/services/all/*.service" inside the
+#   container is bsp/services/all/*.service here). A variable in a path
+#   matches anything ("${repo_dir}/kernel-configs/${config}" depends on
+#   every kernel config)
+# and maps the files changed in a git diff range to the images to rebuild.
+# An image whose entry changed in devices.yml (compared with the start of
+# the range) is rebuilt too.
+#
+# The dependencies are read from the files on disk, so the range should end
+# at the checked out tree (the default: "<rev>" compares <rev> with it).
+#
+# Output, one build per build-script and architecture as ./bin/build.py
+# runs them:
+# - a table of the builds and the changed files that caused them
+# - with -m: a GitLab child pipeline, one build job per build (the
+#   trigger job in .gitlab-ci.yml runs it), tagged with -t. Without
+#   builds, one job that says so: a pipeline cannot be empty
+# - with -o: the plan as JSON (builds, reasons, changed files that no image
+#   depends on)
+#
+# Dependencies:
+# sudo apt -y install python3 python3-yaml git
+#
+# Usage:
+# ./bin/rebuild-plan.py [-i <input file>] [-s <support>] [-a <architecture>] [-m] [-t <runner tag>] [-o <output.json>] [-v] <git diff range>
+#
+# E.g.:
+# ./bin/rebuild-plan.py origin/master...HEAD
+# ./bin/rebuild-plan.py -m -s kali,community HEAD~5
+# ./bin/rebuild-plan.py -m -t privileged "${CI_MERGE_REQUEST_DIFF_BASE_SHA}...HEAD" > rebuild-pipeline.yml
+
+import collections
+import fnmatch
+import getopt
+import json
+import os
+import re
+import subprocess
+import sys
+
+import yaml
+
+import build
+import catalog
+
+inputfile = ""
+
+supports = ["kali"]
+
+architectures = []
+
+matrix = False
+
+tags = []
+
+outputfile = ""
+
+verbose = False
+
+diff_range = ""
+
+# include <name>, source ./common.d/<name>.sh
+INCLUDE = re.compile(r"^\s*include\s+([\w-]+)", re.M)
+SOURCE = re.compile(r"^\s*(?:source|\.)\s+[\"']?(?:\./)?(common\.d/[\w.-]+\.sh)", re.M)
+
+# ./<build-script>.sh, another build-script run by this one
+WRAPPER = re.compile(r"^\s*(?:exec\s+)?\./([\w.-]+\.sh)\b", re.M)
+
+# ./bin/<script>, ${repo_dir}/bin/<script>, "${repo_dir}"/bin/<script>, import <module>
+BIN = re.compile(r"(?:\./|\$\{repo_dir\}\"?/|\$repo_dir\"?/)bin/([\w.-]+\.py)")
+IMPORT = re.compile(r"^(?:import|from)\s+(\w+)", re.M)
+
+# A script path as a whole string, as a subprocess command has it: "./bin/<script>", os.path.join(..., "bin", "<script>")
+RUN = re.compile(r"[\"'](?:\./)?bin/([\w.-]+\.py)[\"']|[\"']bin[\"']\s*,\s*[\"']([\w.-]+\.py)[\"']")
+
+# Comments, whole lines and after code ("${#var}" and "#!" are not)
+COMMENT = re.compile(r"(?:^|(?<=\s))#(?!!).*$", re.M)
+
+# bsp/, kernel-configs/ and patches/ paths, checked by reference()
+TREE = re.compile(r"\b(bsp|kernel-configs|patches)\b(/[^\s\"';|)<>`]*)?")
+
+# Build jobs of the child pipeline run on Kali, as common.d/build_deps.sh expects
+IMAGE = "docker.io/kalilinux/kali-rolling"
+
+VARIABLE = re.compile(r"\$\{[^}]*\}|\$\w+")
+BRACES = re.compile(r"\{([^{}]*,[^{}]*)\}")
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} [-i <input file>] [-s <support>] [-a <architecture>] [-m] [-t <runner tag>] [-o <output.json>] [-v] <git diff range>"
+        outstr += f"\nE.g. : {prog} -m origin/master...HEAD\n"
+
+    print(outstr, file=sys.stderr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global inputfile, supports, architectures, matrix, tags, outputfile, verbose, diff_range
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hi:s:a:mt:o:v",
+            [
+                "input=",
+                "support=",
+                "arch=",
+                "matrix",
+                "tag=",
+                "output=",
+                "verbose"
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    for opt, arg in opts:
+        if opt == "-h":
+            bail()
+
+        elif opt in ("-i", "--input"):
+            inputfile = arg
+
+        elif opt in ("-s", "--support"):
+            supports = arg.split(",")
+
+        elif opt in ("-a", "--arch"):
+            architectures = arg.split(",")
+
+        elif opt in ("-m", "--matrix"):
+            matrix = True
+
+        elif opt in ("-t", "--tag"):
+            tags = arg.split(",")
+
+        elif opt in ("-o", "--output"):
+            outputfile = arg
+
+        elif opt in ("-v", "--verbose"):
+            verbose = True
+
+        else:
+            bail(f"Unrecognised argument: {opt}")
+
+    if len(args) != 1:
+        bail("Missing git diff range")
+
+    diff_range = args[0]
+
+    if not inputfile:
+        inputfile = os.path.join(build.repodir, "devices.yml")
+
+    return 0
+
+
+def reference(text, match):
+    # Pattern of a bsp/kernel-configs/patches match, None when it is part of another path or just a word
+    start = match.start()
+    path = match.group(0)
+    line = text[text.rfind("\n", 0, start) + 1:start]
+
+    # Removing it is not using it ("rm -rf /bsp")
+    if re.match(r"\s*rm\s", line):
+        return None
+
+    if text[:start].endswith(("${repo_dir}/", "$repo_dir/")):
+        pass
+
+    elif start and text[start - 1] == "/":
+        # "/bsp/..." in the container or "./bsp/...", not "/usr/share/bsp/..."
+        if start > 1 and text[start - 2] not in " \t\n\"'=(.":
+            return None
+
+    elif not match.group(2) or (start and text[start - 1] not in " \t\n\"'=("):
+        return None
+
+    return VARIABLE.sub("*", path.rstrip("/."))
+
+
+def expand(pattern):
+    # Brace expansion, "scripts/{monstart,monstop}"
+    found = BRACES.search(pattern)
+
+    if not found:
+        return [pattern]
+
+    return [p for alternative in found.group(1).split(",") for p in expand(pattern[:found.start()] + alternative + pattern[found.end():])]
+
+
+class Graph:
+    # Files and path patterns every file depends on, read from the tree
+    def __init__(self, root):
+        self.root = root
+        self.direct = {}
+
+    def read(self, file):
+        # (files, patterns) used directly by file
+        if file in self.direct:
+            return self.direct[file]
+
+        files = set()
+        patterns = set()
+
+        try:
+            with open(os.path.join(self.root, file), errors="replace") as f:
+                text = f.read()
+
+        except OSError:
+            self.direct[file] = (files, patterns)
+
+            return self.direct[file]
+
+        # Scripts named in comments are not run
+        text = COMMENT.sub("", text)
+
+        if file.endswith(".py"):
+            for module in IMPORT.findall(text):
+                if os.path.isfile(os.path.join(self.root, "bin", f"{module}.py")):
+                    files.add(f"bin/{module}.py")
+
+            for script in RUN.findall(text):
+                files.add(f"bin/{''.join(script)}")
+
+        else:
+            for name in INCLUDE.findall(text):
+                if os.path.isfile(os.path.join(self.root, "common.d", f"{name}.sh")):
+                    files.add(f"common.d/{name}.sh")
+
+            files.update(SOURCE.findall(text))
+
+            for script in WRAPPER.findall(text):
+                if os.path.isfile(os.path.join(self.root, script)):
+                    files.add(script)
+
+            for match in TREE.finditer(text):
+                pattern = reference(text, match)
+
+                if pattern:
+                    patterns.update(expand(pattern))
+
+            for script in BIN.findall(text):
+                files.add(f"bin/{script}")
+
+        files.discard(file)
+        self.direct[file] = (files, patterns)
+
+        return self.direct[file]
+
+    def closure(self, file):
+        # {file: how it is reached} and the patterns, from file
+        reached = collections.OrderedDict([(file, [file])])
+        patterns = collections.OrderedDict()
+        queue = [file]
+
+        while queue:
+            current = queue.pop(0)
+            files, found = self.read(current)
+
+            for pattern in sorted(found):
+                patterns.setdefault(pattern, reached[current])
+
+            for dependency in sorted(files):
+                if dependency not in reached:
+                    reached[dependency] = reached[current] + [dependency]
+                    queue.append(dependency)
+
+        return reached, patterns
+
+
+def matches(file, pattern):
+    return fnmatch.fnmatchcase(file, pattern) or file.startswith(f"{pattern}/") or fnmatch.fnmatchcase(file, f"{pattern}/*")
+
+
+def git(*args):
+    try:
+        return subprocess.run(["git", "-C", build.repodir] + list(args), check=True, stdout=subprocess.PIPE).stdout
+
+    except (OSError, subprocess.CalledProcessError) as e:
+        bail(f"git {' '.join(args)} failed", str(e))
+
+
+def changed_files():
+    # Paths changed in the range, both sides of a rename
+    fields = git("diff", "--name-status", "-M", "-z", diff_range).decode().split("\0")
+    files = []
+    i = 0
+
+    while i < len(fields) and fields[i]:
+        count = 2 if fields[i][0] in "RC" else 1
+        files += fields[i + 1:i + 1 + count]
+        i += 1 + count
+
+    return files
+
+
+def start_revision():
+    # Left side of the range, to compare devices.yml with
+    if "..." in diff_range:
+        left, right = diff_range.split("...", 1)
+
+        return git("merge-base", left or "HEAD", right or "HEAD").decode().strip()
+
+    return diff_range.split("..", 1)[0] or "HEAD"
+
+
+class Entries:
+    # catalog.walk() visitor: {(build-script, architecture): [(board, devices.yml entry)]}
+    def __init__(self):
+        self.images = collections.defaultdict(list)
+
+    def vendor(self, vendor):
+        pass
+
+    def board(self, vendor, board):
+        pass
+
+    def image(self, vendor, board, image):
+        self.images[(image.get("build-script", ""), image.get("architecture", ""))].append((board.get("board"), image))
+
+
+def changed_images():
+    # (build-script, architecture) of the images whose devices.yml entry is new or different
+    # at the start of the range, None when there was no devices.yml then
+    proc = subprocess.run(["git", "-C", build.repodir, "show", f"{start_revision()}:{os.path.relpath(inputfile, build.repodir)}"],
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    if proc.returncode != 0:
+        return None
+
+    before = catalog.walk(catalog.parse(proc.stdout.decode()), [Entries()])[0].images
+    after = catalog.walk(catalog.load(inputfile), [Entries()])[0].images
+
+    return {key for key, entries in after.items() if before.get(key) != entries}
+
+
+def plan():
+    selection = build.Selection(supports, architectures)
+    catalog.walk(catalog.load(inputfile), [selection])
+
+    changed = changed_files()
+    graph = Graph(build.repodir)
+    builds = collections.OrderedDict()
+    used = set()
+    catalog_file = os.path.relpath(inputfile, build.repodir)
+    images = set()
+
+    if catalog_file in changed:
+        images = changed_images()
+
+    for (script, arch), job in selection.jobs.items():
+        reached, patterns = graph.closure(script)
+        reasons = collections.OrderedDict()
+
+        for file in changed:
+            if file in reached:
+                reasons[file] = reached[file]
+
+            else:
+                for pattern, via in patterns.items():
+                    if matches(file, pattern):
+                        reasons[file] = via + [pattern]
+
+                        break
+
+        # No devices.yml to compare with: every image is new
+        if images is None or (script, arch) in images:
+            reasons[catalog_file] = [catalog_file]
+
+        if reasons:
+            builds[(script, arch)] = {"job": job, "reasons": reasons}
+            used.update(reasons)
+
+    unused = [file for file in changed if file not in used and file != catalog_file]
+
+    return changed, builds, unused
+
+
+def pipeline(include):
+    # GitLab child pipeline: a build job per build, or one that says there is none
+    jobs = collections.OrderedDict()
+
+    for job in include:
+        entry = {
+            "stage": "build",
+            "before_script": ["./common.d/build_deps.sh"],
+            "script": [f"./{job['script']} --arch {job['architecture']}"],
+            "artifacts": {"when": "always", "paths": ["images/", "logs/"], "expire_in": "1 week"}
+        }
+
+        if tags:
+            entry["tags"] = list(tags)
+
+        jobs[f"build {job['script']} {job['architecture']}"] = entry
+
+    if not jobs:
+        jobs["no rebuild"] = {"stage": "build", "script": ["echo 'No image depends on the changed files'"]}
+
+    return dict({"stages": ["build"], "default": {"image": IMAGE}}, **jobs)
+
+
+def main(argv):
+    getargs(argv)
+
+    changed, builds, unused = plan()
+    include = [{"script": key[0], "architecture": key[1], "images": entry["job"].images} for key, entry in builds.items()]
+
+    if outputfile:
+        with open(outputfile, "w") as f:
+            json.dump({
+                "range": diff_range,
+                "changed": changed,
+                "builds": [dict(job, reasons=builds[(job["script"], job["architecture"])]["reasons"]) for job in include],
+                "unused": unused
+            }, f, indent=2)
+
+    if matrix:
+        print(yaml.safe_dump(pipeline(include), default_flow_style=False, sort_keys=False), end="")
+
+        exit(0)
+
+    print(f"[i] {len(changed)} changed file(s) in {diff_range}: {len(builds)} build(s), {sum(len(job['images']) for job in include)} image(s) to rebuild")
+
+    if builds:
+        rows = [("Build script", "Architecture", "Images", "Because of")]
+
+        for (script, arch), entry in builds.items():
+            reasons = list(entry["reasons"].items())
+
+            if verbose:
+                # file <- pattern <- ... <- build-script
+                because = [" <- ".join(([file] if via[-1] != file else []) + list(reversed(via))) for file, via in reasons]
+
+            else:
+                because = [file for file, via in reasons[:3]] + ([f"(+{len(reasons) - 3})"] if len(reasons) > 3 else [])
+
+            rows.append((script, arch, str(len(entry["job"].images)), ", ".join(because)))
+
+        print("")
+
+        for line in build.table(rows):
+            print(line)
+
+    if unused:
+        print(f"\n[i] No image depends on: {', '.join(unused)}")
+
+    if outputfile:
+        print(f"\nPlan file created\t: {outputfile}")
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+# ARM Devices ~ https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/devices.yml
+
+###############################################
+# Script to prepare the manifests for Kali ARM quarterly releases
+#
+# Makes a single pass over devices.yml and reads every release artifact
+# once. It creates, in the image directory:
+# - "manifest.json"         : manifest file mapping image name to display name (pre)
+# - "rpi-imager.json"       : rpi-imager list of the Raspberry Pi images (post)
+# - "<vendor>-imager.json"  : same format, for every other vendor with images (post)
+#
+# A release image is every "support: kali" image, once per vendor and name.
+#
+# Stages (-s/--stage):
+# - pre : only manifest.json, can be run before the images are created
+# - post: only the imager lists, after the images are created
+# - all : both (default)
+# ./bin/pre-release.py and ./bin/post-release.py run the pre and post stages.
+#
+# The images are checked on a pool of -j/--jobs threads (default: 4); the
+# output does not depend on the number of jobs.
+#
+# With -v/--verify, every .xz is first checked against both .sha256sum
+# files (see ./bin/checksums.py), using the digest cache in the image
+# directory so unchanged files are not read again.
+#
+# The artifact metadata is kept in "<imagedir>/.release-state.json" (see
+# ./bin/artifacts.py): re-runs only read the images that were rebuilt
+# since. -f/--force reads them all again.
+#
+# Dependencies:
+# sudo apt -y install python3 python3-yaml
+#
+# Usage:
+# ./bin/release.py -i <input file> -r <release> -o <image directory> [-s pre|post|all] [-j <jobs>] [-v] [-f]
+#
+# E.g.:
+# ./bin/release.py -i devices.yml -r 2022.3 -o images/
+
+import datetime
+import getopt
+import json
+import os
+import sys
+
+import artifacts
+import catalog
+import checksums
+import reports
+
+release = ""
+
+imagedir = ""
+
+inputfile = ""
+
+stage = "all"
+
+jobs = 4  # Images processed at the same time (-j/--jobs)
+
+verify = False  # Check the artifacts against their sha256sum files first (-v/--verify)
+
+force = False  # Ignore the state of the previous runs (-f/--force)
+
+# Input:
+# ------------------------------------------------------------
+# See: ./devices.yml
+# https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/devices.yml
+#
+# See:  ./images/*.img.sha256sum (uncompressed image sha256sum - to get the sha256sum
+#       ./images/*.img.xz.sha256sum (compressed image sha256sum - to get the sha256sum
+#       ./images/*.img.xz (compressed image; we read the xz index to get compressed/uncompressed size)
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} -i <input file> -o <output directory> -r <release> [-s pre|post|all] [-j <jobs>] [-v] [-f]"
+        outstr += f"\nE.g. : {prog} -i devices.yml -o images/ -r {datetime.datetime.now().year}.1 -j 8\n"
+
+    print(outstr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global inputfile, imagedir, release, stage, jobs, verify, force
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hi:o:r:s:j:vf",
+            [
+                "inputfile=",
+                "imagedir=",
+                "outputdir=",
+                "release=",
+                "stage=",
+                "jobs=",
+                "verify",
+                "force"
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    if opts:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-i", "--inputfile"):
+                inputfile = arg
+
+            elif opt in ("-r", "--release"):
+                release = arg
+
+            elif opt in ("-o", "--imagedir", "--outputdir"):
+                imagedir = arg.rstrip("/")
+
+            elif opt in ("-s", "--stage"):
+                stage = arg
+
+            elif opt in ("-j", "--jobs"):
+                try:
+                    jobs = int(arg)
+
+                except ValueError:
+                    jobs = 0
+
+                if jobs < 1:
+                    bail(f"Invalid number of jobs: {arg}")
+
+            elif opt in ("-v", "--verify"):
+                verify = True
+
+            elif opt in ("-f", "--force"):
+                force = True
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    else:
+        bail("Failed to read arguments")
+
+    if not release:
+        bail("Missing required argument: -r/--release")
+
+    if stage not in ("pre", "post", "all"):
+        bail(f"Unknown stage: {stage}")
+
+    return 0
+
+
+def imager_file(vendor):
+    # rpi-imager.json keeps its name, rpi-imager and the website read it
+    if vendor == "raspberrypi":
+        return "rpi-imager.json"
+
+    return f"{vendor}-imager.json"
+
+
+def imager_list(images, found):
+    # rpi-imager "os_list" format
+    os_list = []
+
+    for image in images:
+        artifact = found[image["filename"]]
+
+        os_list.append({
+            "name": image["name"],
+            "description": f"Kali Linux ARM image for the {image['name']}",
+            "url": artifact.url,
+            "icon": "https://www.kali.org/images/kali-linux-logo.svg",
+            "website": "https://www.kali.org/",
+            "release_date": datetime.datetime.today().strftime("%Y-%m-%d"),
+            "extract_size": artifact.extract_size,
+            "extract_sha256": artifact.extract_sha256,
+            "image_download_size": artifact.image_download_size,
+            "image_download_sha256": artifact.image_download_sha256
+        })
+
+    return json.dumps({"os_list": os_list}, indent=2)
+
+
+def generate_imagers(manifest):
+    # {output file: json}, every artifact is read once for all the vendors
+    filenames = [image["filename"] for images in manifest.devices.values() for image in images]
+    cache = None
+
+    if verify:
+        cache = checksums.DigestCache(f"{imagedir}/{checksums.CACHE_FILE}")
+
+    state = artifacts.State(f"{imagedir}/{artifacts.STATE_FILE}", force)
+    found, errors = artifacts.collect(imagedir, release, filenames, jobs, verify, cache, state)
+
+    if cache:
+        cache.save()
+
+    state.save()
+
+    if errors:
+        bail(
+            f"{len(errors)} problem(s) with the release images! Please check the images before running",
+            "\n".join(errors)
+            )
+
+    for filename, artifact in found.items():
+        if artifact.verified:
+            print(f"[+] Verified: {imagedir}/{filename}.xz ({artifact.verified})")
+
+    outputs = {}
+
+    for vendor, images in manifest.devices.items():
+        outputs[imager_file(vendor)] = imager_list(images, found)
+
+    serial = [f"{filename}.xz" for filename, artifact in found.items() if not artifact.parallel]
+
+    print(f"[i] Artifacts unchanged since the last run: {state.hits}/{len(found)}")
+
+    return outputs, serial
+
+
+def createdir(dir):
+    try:
+        if not os.path.exists(dir):
+            os.makedirs(dir)
+
+    except:
+        bail(f"Directory {dir} does not exist and cannot be created")
+
+    return 0
+
+
+def readfile(file):
+    try:
+        with open(file) as f:
+            data = f.read()
+
+    except:
+        bail(f"Cannot open input file: {file}")
+
+    return data
+
+
+def writefile(data, file):
+    try:
+        with open(file, "w") as f:
+            f.write(str(data))
+
+    except:
+        bail(f"Cannot write to output file: {file}")
+
+    return 0
+
+
+def main(argv):
+    # Parse command-line arguments
+    if argv:
+        getargs(argv)
+
+    else:
+        bail("Missing arguments")
+
+    data = readfile(inputfile)
+
+    # Get data, one walk for every output
+    res = catalog.parse(data)
+    manifest = reports.Manifest(release)
+    catalog.walk(res, [manifest])
+
+    outputs = {}
+    serial = []
+
+    if stage in ("pre", "all"):
+        outputs[manifest.output_file] = manifest.render()
+
+    if stage in ("post", "all"):
+        imagers, serial = generate_imagers(manifest)
+        outputs.update(imagers)
+
+    # Create output directory if required
+    createdir(imagedir)
+
+    for file, content in outputs.items():
+        writefile(content, f"{imagedir}/{file}")
+
+    # Print result and exit
+    print("\nStats:")
+
+    for line in manifest.summary():
+        print(line)
+
+    for vendor, images in manifest.devices.items():
+        print(f"  - {release} {vendor} images\t: {len(images)}")
+
+    for image in serial:
+        print(f"  - No parallel xz decompression (one block or no sizes in block headers)\t: {image}")
+
+    print("\n")
+
+    for file in outputs:
+        print(f"Manifest file created\t: {imagedir}/{file}")
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
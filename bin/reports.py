@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+
+# ARM Devices ~ https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/devices.yml
+
+###############################################
+# Reports generated from the devices.yml catalog
+#
+# Each report is a visitor for catalog.walk(): it gets called once per
+# vendor, board and image, and builds its output as it goes. This lets
+# ./bin/generate_reports.py feed every report from a single traversal,
+# while the ./bin/generate_*.py scripts each drive one of them.
+#
+# Usage (from another script in ./bin/):
+# import catalog, reports
+# report = reports.ImageStats()
+# catalog.walk(catalog.load("devices.yml"), [report])
+# print(report.render())
+
+import json
+import re
+from datetime import datetime
+
+repo_msg = f"""
+_This table was [generated automatically](https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/devices.yml) on {datetime.now().strftime('%Y-%B-%d %H:%M:%S')} from the [Kali ARM GitLab repository](https://gitlab.com/kalilinux/build-scripts/kali-arm)_
+"""
+
+repo_url = "https://gitlab.com/kalilinux/build-scripts/kali-arm"
+
+default = ""
+
+
+# https://stackoverflow.com/a/11150413
+def natural_sort(l):
+    def convert(text): return int(text) if text.isdigit() else text.lower()
+
+    def alphanum_key(key): return [convert(c)
+                                   for c in re.split('([0-9]+)', key)]
+
+    return sorted(l, key=alphanum_key)
+
+
+class Report:
+    output_file = ""
+    title = ""
+
+    def vendor(self, vendor):
+        pass
+
+    def board(self, vendor, board):
+        pass
+
+    def image(self, vendor, board, image):
+        pass
+
+    def stats(self):
+        return ""
+
+    def table(self):
+        return ""
+
+    def render(self):
+        meta = "---\n"
+        meta += f"title: {self.title}\n"
+        meta += "---\n\n"
+
+        return meta + self.stats() + self.table() + repo_msg
+
+    def summary(self):
+        return []
+
+
+class DeviceStats(Report):
+    output_file = "device-stats.md"
+    title = "Kali ARM Device Statistics"
+
+    def __init__(self):
+        self.qty_devices = 0
+        self.qty_images = 0
+        self.rows = [
+            "| Vendor | [Board](devices.html) | [Images](images.html) |\n",
+            "|--------|-----------------------|-----------------------|\n"
+        ]
+
+    def board(self, vendor, board):
+        self.qty_devices += 1
+        self.qty_images += len(board.get("images", default))
+
+        self.rows.append(f"| {vendor} | {board.get('name', default)} | {len(board.get('images', default))} |\n")
+
+    def stats(self):
+        stats = f"- The official [Kali ARM repository]({repo_url}) contains [build-scripts](({repo_url})) to support [**{self.qty_devices}** Kali ARM devices](devices.html)\n"
+        stats += "- [Kali ARM Statistics](index.html)\n\n"
+
+        return stats
+
+    def table(self):
+        return "".join(self.rows)
+
+    def summary(self):
+        return [
+            f"Devices: {self.qty_devices}",
+            f"Images : {self.qty_images}"
+        ]
+
+
+class DevicesTable(Report):
+    output_file = "devices.md"
+    title = "Kali ARM Devices"
+
+    def __init__(self):
+        self.qty_devices = 0
+        self.rows = [
+            "| Vendor | Board | CPU | CPU Cores | GPU | RAM | RAM Size (MB) | Ethernet | Ethernet Speed (MB) | Wi-Fi | Bluetooth | USB2 | USB3 | Storage |        Notes        |\n",
+            "|--------|-------|-----|-----------|-----|-----|---------------|----------|---------------------|-------|-----------|------|------|---------|---------------------|\n"
+        ]
+
+    def board(self, vendor, board):
+        self.qty_devices += 1
+
+        ram_size = ", ".join(natural_sort(board.get("ram-size", default)))
+        storage = ", ".join(natural_sort(board.get("storage", default)))
+
+        self.rows.append(f"| {vendor} | {board.get('name', default)} | {board.get('cpu', default)} | {board.get('cpu-cores', default)} | {board.get('gpu', default)} | {board.get('ram', default)} | {ram_size} | {board.get('ethernet', default)} | {board.get('ethernet-speed', default)} | {board.get('wifi', default)} | {board.get('bluetooth', default)} | {board.get('usb2', default)} | {board.get('usb3', default)} | {storage} | {board.get('notes', default)} |\n")
+
+    def stats(self):
+        stats = f"- The official [Kali ARM repository]({repo_url}) contains build-scripts to support [**{self.qty_devices}** Kali ARM devices](device-stats.html)\n"
+        stats += "- [Kali ARM Statistics](index.html)\n\n"
+
+        return stats
+
+    def table(self):
+        return "".join(self.rows)
+
+    def summary(self):
+        return [f"Devices: {self.qty_devices}"]
+
+
+class ImageOverview(Report):
+    output_file = "image-overview.md"
+    title = "Kali ARM Image Overview"
+
+    def __init__(self):
+        self.images = set()
+        self.qty_devices = 0
+        self.qty_images = 0
+        self.qty_image_kali = 0
+        self.qty_image_community = 0
+        self.qty_image_eol = 0
+        self.qty_image_unknown = 0
+        self.rows = [
+            "| [Device Name](https://www.kali.org/docs/arm/) | [Build-Script](https://gitlab.com/kalilinux/build-scripts/kali-arm/) | [Official Image](https://www.kali.org/get-kali/#kali-arm) | Community Image | EOL/Retired Image |\n",
+            "|---------------|--------------|----------------|-----------------|---------------|\n"
+        ]
+
+    def board(self, vendor, board):
+        self.qty_devices += 1
+
+    def image(self, vendor, board, image):
+        # ALT: image["image"]
+        if image["name"] in self.images:
+            return
+
+        self.images.add(image["name"])
+        self.qty_images += 1
+
+        build_script = image.get("build-script", default)
+
+        if build_script:
+            build_script = f"[{build_script}](https://gitlab.com/kalilinux/build-scripts/kali-arm/-/blob/master/{build_script})"
+
+        name = image.get("name", default)
+        slug = image.get("slug", default)
+
+        if name and slug:
+            name = f"[{name}](https://www.kali.org/docs/arm/{slug}/)"
+
+        support = image.get("support", default)
+
+        if support == "kali":
+            status = "x |  | "
+            self.qty_image_kali += 1
+
+        elif support == "community":
+            status = " | x | "
+            self.qty_image_community += 1
+
+        elif support == "eol":
+            status = " |  | x"
+            self.qty_image_eol += 1
+
+        else:
+            status = " |  | "
+            self.qty_image_unknown += 1
+
+        self.rows.append(f"| {name} | {build_script} | {status} |\n")
+
+    def stats(self):
+        stats = f"- The official [Kali ARM repository]({repo_url}) contains [build-scripts](({repo_url})) to create [**{self.qty_images}** unique Kali ARM images](image-stats.html) for **{self.qty_devices}** devices\n"
+        stats += f"- The [next release](https://www.kali.org/releases/) cycle will include [**{self.qty_image_kali}** Kali ARM images](image-stats.html) _([ready to download](https://www.kali.org/get-kali/#kali-arm))_, **{self.qty_image_community}** images which can be [built]({repo_url}), and {self.qty_image_eol} retired images\n"
+        stats += "- [Kali ARM Statistics](index.html)\n\n"
+
+        return stats
+
+    def table(self):
+        return "".join(self.rows)
+
+    def summary(self):
+        return [
+            f"Devices: {self.qty_devices}",
+            f"Images : {self.qty_images}",
+            f"- Kali     : {self.qty_image_kali}",
+            f"- Community: {self.qty_image_community}",
+            f"- EOL      : {self.qty_image_eol}",
+            f"- Unknown  : {self.qty_image_unknown}"
+        ]
+
+
+class ImageStats(Report):
+    output_file = "image-stats.md"
+    title = "Kali ARM Image Statistics"
+
+    def __init__(self):
+        self.images = set()
+
+    def image(self, vendor, board, image):
+        self.images.add(f"{image.get('name', default)} ({image.get('architecture', default)})")
+
+    def stats(self):
+        stats = f"- The official [Kali ARM repository]({repo_url}) contains [build-scripts](({repo_url})) to create [**{len(self.images)}** unique Kali ARM images](images.html)\n"
+        stats += "- [Kali ARM Statistics](index.html)\n\n"
+
+        return stats
+
+    def table(self):
+        rows = [
+            "| [Image Name](images.html) (Architecture) |\n",
+            "|---------------------------|\n"
+        ]
+        rows.extend(f"| {device} |\n" for device in sorted(self.images))
+
+        return "".join(rows)
+
+    def summary(self):
+        return [f"Images: {len(self.images)}"]
+
+
+class ImagesTable(Report):
+    output_file = "images.md"
+    title = "Kali ARM Images"
+
+    def __init__(self):
+        self.images = set()
+        self.images_released = set()
+        self.qty_devices = 0
+        self.rows = [
+            "| Image Name | Filename | Architecture | Preferred | Support | [Documentation](https://www.kali.org/docs/arm/) | [Kernel](kernel-stats.html) | Kernel Version | Notes |\n",
+            "|------------|----------|--------------|-----------|---------|-------------------------------------------------|-----------------------|----------------|-------|\n"
+        ]
+
+    def board(self, vendor, board):
+        self.qty_devices += 1
+
+    def image(self, vendor, board, image):
+        self.images.add(f"{image.get('name', default)}")
+
+        if image.get("support", default) == "kali":
+            self.images_released.add(f"{image.get('name', default)}")
+
+        slug = image.get("slug", default)
+
+        if slug:
+            slug = f"[{slug}](https://www.kali.org/docs/arm/{slug}/)"
+
+        self.rows.append(f"| {image.get('name', default)} | {image.get('image', default)} | {image.get('architecture', default)} | {image.get('preferred-image', default)} | {image.get('support', default)} | {slug} | {image.get('kernel', default)} | {image.get('kernel-version', default)} | {image.get('image-notes', default)} |\n")
+
+    def stats(self):
+        stats = f"- The official [Kali ARM repository]({repo_url}) contains [build-scripts](({repo_url})) to create [**{len(self.images)}** unique Kali ARM images](image-stats.html) for **{self.qty_devices}** devices\n"
+        stats += f"- The [next release](https://www.kali.org/releases/) cycle will include [**{len(self.images_released)}** Kali ARM images](image-stats.html) _([ready to download](https://www.kali.org/get-kali/#kali-arm))_\n"
+        stats += "- [Kali ARM Statistics](index.html)\n\n"
+
+        return stats
+
+    def table(self):
+        return "".join(self.rows)
+
+    def summary(self):
+        return [
+            f"Devices        : {self.qty_devices}",
+            f"Images         : {len(self.images)}",
+            f"Images Released: {len(self.images_released)}"
+        ]
+
+
+class KernelStats(Report):
+    output_file = "kernel-stats.md"
+    title = "Kali ARM Kernel Statistics"
+
+    def __init__(self):
+        self.images = set()
+        self.qty_kernels = 0
+        self.qty_versions = {
+            "custom":  0,
+            "kali":    0,
+            "vendor":  0
+        }
+
+    def image(self, vendor, board, image):
+        # ALT: image["image"]
+        if image["name"] in self.images:
+            return
+
+        self.images.add(image["name"])
+        self.qty_kernels += 1
+
+        kernel = image.get("kernel", "unknown")
+        self.qty_versions[kernel] = self.qty_versions.get(kernel, 0) + 1
+
+    def stats(self):
+        stats = f"- The official [Kali ARM repository]({repo_url}) contains [build-scripts](({repo_url})) to create [**{self.qty_kernels}** unique Kali ARM images](images.html)\n"
+        stats += "- [Kali ARM Statistics](index.html)\n\n"
+
+        return stats
+
+    def table(self):
+        rows = [
+            "| Kernel | Qty |\n",
+            "|--------|-----|\n"
+        ]
+        rows.extend(f"| {v.capitalize()} | {qty} |\n" for v, qty in self.qty_versions.items())
+
+        return "".join(rows)
+
+    def summary(self):
+        return [f"Kernels: {self.qty_kernels}"]
+
+
+class Manifest(Report):
+    # manifest.json: maps each release image to its display name, per vendor
+    output_file = "manifest.json"
+
+    def __init__(self, release):
+        self.release = release
+        self.devices = {}
+        self.img_seen = set()
+        self.qty_devices = 0
+        self.qty_images = 0
+        self.qty_release_images = 0
+
+    def vendor(self, vendor):
+        # Ready to have a unique name in the entry
+        self.img_seen = set()
+
+    def board(self, vendor, board):
+        self.qty_devices += 1
+
+    def image(self, vendor, board, image):
+        self.qty_images += 1
+
+        # Check that it's not EOL or community supported
+        if image.get("support") != "kali":
+            return
+
+        name = image.get("name", default)
+
+        # If we haven't seen this image before for this vendor
+        if name in self.img_seen:
+            return
+
+        self.img_seen.add(name)
+        self.qty_release_images += 1
+
+        self.devices.setdefault(vendor, []).append({
+            "name": name,
+            "filename": f"kali-linux-{self.release}-{image.get('image', default)}",
+            "preferred": image.get("preferred-image", default),
+            "slug": image.get("slug", default)
+        })
+
+    def render(self):
+        return json.dumps(self.devices, indent=2)
+
+    def summary(self):
+        return [
+            f"  - Total devices\t: {self.qty_devices}",
+            f"  - Total images\t: {self.qty_images}",
+            f"  - {self.release} images\t: {self.qty_release_images}"
+        ]
@@ -0,0 +1,828 @@
+#!/usr/bin/env python3
+
+###############################################
+# Which .debs the selected builds install, resolved offline from the
+# suite's Packages indexes
+#
+# Every build (one per build-script and architecture, as ./bin/build.py
+# runs them) installs:
+# - the Essential, required and important packages and debootstrap_base
+#   (first stage, no Recommends)
+# - third_stage_pkgs, packages, desktop_pkgs and extra, and the packages
+#   named on the `apt-get install` lines of the build-script and the
+#   common.d/ files it includes (third stage, with Recommends unless the
+#   variant is minimal or slim)
+# The package lists are read by sourcing common.d/packages.sh in bash with
+# the build's desktop, hw_model, --arch and build-script options (after
+# "--"), as the build does.
+#
+# Each list is expanded to its dependency closure (Pre-Depends, Depends,
+# the first alternative that can be installed, virtual packages through
+# Provides). Conflicts and Breaks are not looked at, so it can differ from
+# apt in corner cases.
+#
+# The Packages indexes (-p: files, Packages, Packages.gz, Packages.xz or
+# apt's *_Packages lists, or directories holding them; the architecture
+# comes from "binary-<arch>" in the path) are streamed, keeping only the
+# fields used here.
+#
+# Output:
+# - a table of the builds: packages, download and installed size
+# - per architecture, the union of the .debs of every build (each fetched
+#   once, instead of once per build)
+# - with -o: the plan as JSON, with the installed size of every build for
+#   the image sizing, and its first stage packages for ./bin/bootstrap.py
+# - with -f: the .debs are fetched from the mirror (-u), -j at a time and
+#   checked against their SHA256, into a pool under -D (a local mirror)
+#   and/or through the proxy -P (e.g. ./bin/apt-proxy.py, which then has
+#   them when the builds start)
+#
+# Dependencies:
+# sudo apt -y install python3 python3-yaml
+#
+# Usage:
+# ./bin/resolve-packages.py -p <Packages file or dir>... [-i <input file>] [-s <support>] [-a <architecture>] [-V <vendor>]
+#                           [-o <output.json>] [-f] [-u <mirror URL>] [-P <proxy URL>] [-D <download dir>] [-j <jobs>]
+#                           [-- <build script options>]
+#
+# E.g.:
+# ./bin/resolve-packages.py -p /var/lib/apt/lists -s kali -a arm64
+# ./bin/resolve-packages.py -p local/indexes -o local/packages.json -f -P http://127.0.0.1:3142 -j 16
+# ./bin/resolve-packages.py -p local/indexes -f -D local/mirror -- --minimal
+
+import collections
+import concurrent.futures
+import getopt
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import re
+import shlex
+import subprocess
+import sys
+import urllib.request
+
+import build
+import catalog
+
+inputfile = ""
+
+indexes = []
+
+supports = ["kali"]
+
+architectures = []
+
+vendors = []
+
+outputfile = ""
+
+fetch = False
+
+mirror = "http://http.kali.org/kali"
+
+proxy = ""
+
+downloaddir = ""
+
+jobs = 8
+
+script_args = []
+
+# Only these fields of a Packages stanza are kept
+FIELDS = {"Package", "Version", "Pre-Depends", "Depends", "Recommends", "Provides", "Priority", "Essential",
+          "Filename", "Size", "SHA256", "Installed-Size"}
+
+PRIORITIES = {"required": 0, "important": 1, "standard": 2, "optional": 3, "extra": 4}
+
+# name[:arch] [(op version)]
+RELATION = re.compile(r"^\s*([^\s:(\[<]+)(?::[\w-]+)?\s*(?:\(\s*(<<|<=|=|>=|>>|<|>)\s*([^)\s]+)\s*\))?")
+
+ASSIGNMENT = re.compile(r"^(\w+)=\"([^\"]*)\"", re.M)
+
+DEFAULT = re.compile(r"^(hw_model|desktop)=\$\{\1:-\"?([^\"}]*)\"?\}", re.M)
+
+INSTALL = re.compile(r"\bapt(?:-get)?\s+(?:-\S+\s+)*install\b([^\n|&;]*)")
+
+INCLUDE = re.compile(r"^\s*include\s+([\w-]+)", re.M)
+
+# A build-script that runs another one: ./raspberry-pi.sh --arch arm64 "$@"
+WRAPPER = re.compile(r"^(?:exec\s+)?\./([\w.-]+\.sh)\s+(.*?)\s*\"\$@\"\s*$", re.M)
+
+VARIABLE = re.compile(r"^\$\{?(\w+)\}?$")
+
+# A package name, maybe with "=version" or "/suite"
+PACKAGE = re.compile(r"^([a-z0-9][a-z0-9+.-]+)(?:[=/][^\s<>]+)?$")
+
+CHUNK_SIZE = 1 << 20
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} -p <Packages file or dir>... [-i <input file>] [-s <support>] [-a <architecture>] [-V <vendor>]"
+        outstr += "\n       [-o <output.json>] [-f] [-u <mirror URL>] [-P <proxy URL>] [-D <download dir>] [-j <jobs>] [-- <build script options>]"
+        outstr += f"\nE.g. : {prog} -p /var/lib/apt/lists -s kali -a arm64 -o packages.json\n"
+
+    print(outstr, file=sys.stderr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global inputfile, indexes, supports, architectures, vendors, outputfile, fetch, mirror, proxy, downloaddir, jobs, script_args
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hp:i:s:a:V:o:fu:P:D:j:",
+            [
+                "packages=",
+                "inputfile=",
+                "support=",
+                "arch=",
+                "vendor=",
+                "output=",
+                "fetch",
+                "mirror=",
+                "proxy=",
+                "download-dir=",
+                "jobs="
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-p", "--packages"):
+                indexes.append(arg)
+
+            elif opt in ("-i", "--inputfile"):
+                inputfile = arg
+
+            elif opt in ("-s", "--support"):
+                supports = arg.split(",")
+
+            elif opt in ("-a", "--arch"):
+                architectures = arg.split(",")
+
+            elif opt in ("-V", "--vendor"):
+                vendors = arg.split(",")
+
+            elif opt in ("-o", "--output"):
+                outputfile = arg
+
+            elif opt in ("-f", "--fetch"):
+                fetch = True
+
+            elif opt in ("-u", "--mirror"):
+                mirror = arg.rstrip("/")
+
+            elif opt in ("-P", "--proxy"):
+                proxy = arg
+
+            elif opt in ("-D", "--download-dir"):
+                downloaddir = arg
+
+            elif opt in ("-j", "--jobs"):
+                jobs = int(arg)
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    except ValueError as e:
+        bail(f"Invalid value: {e}")
+
+    if not indexes:
+        bail("Missing required argument: -p/--packages")
+
+    if fetch and not (downloaddir or proxy):
+        bail("Fetching needs a download dir (-D) or a proxy (-P) to fill")
+
+    if jobs < 1:
+        bail("Jobs must be positive")
+
+    # Anything after "--" goes to every build script, e.g. --minimal or --desktop=kde
+    script_args = args
+
+    if not inputfile:
+        inputfile = os.path.join(build.repodir, "devices.yml")
+
+    return 0
+
+
+def order(c):
+    # dpkg: "~" sorts before anything, even the end; letters before non-letters
+    if c == "~":
+        return -1
+
+    if c.isalpha():
+        return ord(c)
+
+    return ord(c) + 256
+
+
+def compare_part(a, b):
+    # dpkg's verrevcmp(), on the upstream version or the revision
+    i = j = 0
+
+    while i < len(a) or j < len(b):
+        first_diff = 0
+
+        while (i < len(a) and not a[i].isdigit()) or (j < len(b) and not b[j].isdigit()):
+            ac = order(a[i]) if i < len(a) and not a[i].isdigit() else 0
+            bc = order(b[j]) if j < len(b) and not b[j].isdigit() else 0
+
+            if ac != bc:
+                return ac - bc
+
+            i += 1
+            j += 1
+
+        while i < len(a) and a[i] == "0":
+            i += 1
+
+        while j < len(b) and b[j] == "0":
+            j += 1
+
+        while i < len(a) and a[i].isdigit() and j < len(b) and b[j].isdigit():
+            if not first_diff:
+                first_diff = ord(a[i]) - ord(b[j])
+
+            i += 1
+            j += 1
+
+        if i < len(a) and a[i].isdigit():
+            return 1
+
+        if j < len(b) and b[j].isdigit():
+            return -1
+
+        if first_diff:
+            return first_diff
+
+    return 0
+
+
+def split_version(version):
+    epoch, _, rest = version.partition(":") if ":" in version else ("0", "", version)
+    upstream, _, revision = rest.rpartition("-") if "-" in rest else (rest, "", "0")
+
+    return int(epoch or 0), upstream, revision
+
+
+def compare_versions(a, b):
+    ea, ua, ra = split_version(a)
+    eb, ub, rb = split_version(b)
+
+    if ea != eb:
+        return ea - eb
+
+    return compare_part(ua, ub) or compare_part(ra, rb)
+
+
+def satisfies(version, op, wanted):
+    if not op:
+        return True
+
+    if version is None:
+        return False
+
+    result = compare_versions(version, wanted)
+
+    return {"<<": result < 0, "<": result <= 0, "<=": result <= 0, "=": result == 0,
+            ">=": result >= 0, ">": result >= 0, ">>": result > 0}[op]
+
+
+def parse_relations(value):
+    # "a (>= 1) | b, c" -> [[(a, >=, 1), (b, None, None)], [(c, None, None)]]
+    groups = []
+
+    for group in value.split(","):
+        alternatives = []
+
+        for alternative in group.split("|"):
+            match = RELATION.match(alternative)
+
+            if match:
+                alternatives.append(match.groups())
+
+        if alternatives:
+            groups.append(alternatives)
+
+    return groups
+
+
+class Package:
+    __slots__ = ("name", "version", "fields")
+
+    def __init__(self, stanza):
+        self.name = stanza.pop("Package")
+        self.version = stanza.pop("Version", "0")
+        self.fields = stanza
+
+    def relations(self, field):
+        # Parsed when needed, each package is only expanded once
+        return parse_relations(self.fields.get(field, ""))
+
+    def priority(self):
+        return PRIORITIES.get(self.fields.get("Priority"), len(PRIORITIES))
+
+    def size(self):
+        return int(self.fields.get("Size", 0))
+
+    def installed_size(self):
+        # Installed-Size is in KiB
+        return int(self.fields.get("Installed-Size", 0)) * 1024
+
+
+def stanzas(path):
+    # Packages file -> {field: value} with only FIELDS, one stanza in memory at a time
+    if path.endswith(".gz"):
+        f = gzip.open(path, "rt", encoding="utf-8", errors="replace")
+
+    elif path.endswith(".xz"):
+        f = lzma.open(path, "rt", encoding="utf-8", errors="replace")
+
+    else:
+        f = open(path, encoding="utf-8", errors="replace")
+
+    with f:
+        stanza = {}
+        key = None
+
+        for line in f:
+            if line == "\n":
+                if "Package" in stanza:
+                    yield stanza
+
+                stanza = {}
+                key = None
+
+            elif line[0] in " \t":
+                # Continuation of a kept field (Description, Conffiles, ... are not kept)
+                if key:
+                    stanza[key] += " " + line.strip()
+
+            else:
+                key, _, value = line.partition(":")
+
+                if key in FIELDS:
+                    stanza[key] = value.strip()
+
+                else:
+                    key = None
+
+        if "Package" in stanza:
+            yield stanza
+
+
+class Index:
+    # Packages of one architecture, the highest version of each name
+    def __init__(self, architecture):
+        self.architecture = architecture
+        self.packages = {}
+        self.providers = None
+
+    def read(self, path):
+        count = 0
+
+        for stanza in stanzas(path):
+            package = Package(stanza)
+            known = self.packages.get(package.name)
+
+            if known is None or compare_versions(package.version, known.version) > 0:
+                self.packages[package.name] = package
+
+            count += 1
+
+        self.providers = None
+
+        return count
+
+    def provided(self):
+        # {virtual name: [(package, provided version or None)]}
+        if self.providers is None:
+            self.providers = collections.defaultdict(list)
+
+            for package in self.packages.values():
+                for group in package.relations("Provides"):
+                    name, _, version = group[0]
+                    self.providers[name].append((package, version))
+
+        return self.providers
+
+    def base(self, priority="important"):
+        # What the first stage installs: Essential, required and important
+        return sorted(name for name, package in self.packages.items()
+                      if package.fields.get("Essential") == "yes" or package.priority() <= PRIORITIES[priority])
+
+    def candidates(self, name, op, version):
+        # Packages that can satisfy "name (op version)", the real package first
+        found = []
+        package = self.packages.get(name)
+
+        if package and satisfies(package.version, op, version):
+            found.append(package)
+
+        providers = [p for p, provided in self.provided().get(name, []) if satisfies(provided, op, version)]
+        found += sorted(providers, key=lambda p: (p.priority(), p.name))
+
+        return found
+
+    def closure(self, roots, recommends, selected=None):
+        # {name: Package} of roots and everything they need, added to selected; names that cannot be installed
+        selected = selected if selected is not None else collections.OrderedDict()
+        missing = []
+        queue = collections.deque()
+
+        def add(package):
+            if package.name not in selected:
+                selected[package.name] = package
+                queue.append(package)
+
+        for name in roots:
+            found = self.candidates(name, None, None)
+
+            if found:
+                add(found[0])
+
+            elif name not in missing:
+                missing.append(name)
+
+        while queue:
+            package = queue.popleft()
+            fields = ["Pre-Depends", "Depends"] + (["Recommends"] if recommends else [])
+
+            for field in fields:
+                for group in package.relations(field):
+                    options = [self.candidates(*alternative) for alternative in group]
+
+                    # Already there
+                    if any(candidate.name in selected for found in options for candidate in found):
+                        continue
+
+                    found = [candidates[0] for candidates in options if candidates]
+
+                    if found:
+                        add(found[0])
+
+                    elif field != "Recommends":
+                        missing.append(" | ".join(alternative[0] for alternative in group))
+
+        return selected, missing
+
+
+def index_files(path):
+    # Packages files under path, one compression per list
+    if os.path.isfile(path):
+        return [path]
+
+    found = {}
+
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+
+        for name in sorted(names):
+            if not re.search(r"(^|_)Packages(\.gz|\.xz)?$", name):
+                continue
+
+            base = os.path.join(root, re.sub(r"\.(gz|xz)$", "", name))
+
+            # Uncompressed first, it is the fastest to read
+            if base not in found or name.endswith("Packages"):
+                found[base] = os.path.join(root, name)
+
+    return list(found.values())
+
+
+def load_indexes(wanted):
+    # {architecture: Index} from the -p paths
+    loaded = {}
+
+    for path in indexes:
+        files = index_files(path)
+
+        if not files:
+            bail(f"No Packages index in {path}")
+
+        for file in files:
+            match = re.search(r"binary-([\w-]+?)(?:[/_]|$)", file)
+
+            if not match:
+                bail(f"No architecture in the path of {file} (expected binary-<arch>)")
+
+            # binary-all holds the Architecture: all packages of every architecture
+            for architecture in sorted(wanted) if match.group(1) == "all" else [match.group(1)]:
+                if architecture not in wanted:
+                    continue
+
+                index = loaded.setdefault(architecture, Index(architecture))
+
+                try:
+                    count = index.read(file)
+
+                except (OSError, EOFError, lzma.LZMAError) as e:
+                    bail(f"Cannot read {file}", str(e))
+
+                print(f"[i] {file}: {count} packages ({architecture})", file=sys.stderr)
+
+    return loaded
+
+
+def script_files(script):
+    # The build-script, and the common.d/ files it includes or sources (with base_image.sh's)
+    text = open(os.path.join(build.repodir, script), errors="replace").read()
+    files = [(script, text)]
+    names = INCLUDE.findall(text)
+
+    if "common.d/base_image.sh" in text:
+        names = ["base_image"] + names
+
+    for name in names:
+        path = os.path.join("common.d", f"{name}.sh")
+
+        if os.path.isfile(os.path.join(build.repodir, path)) and path not in [f for f, t in files]:
+            with open(os.path.join(build.repodir, path), errors="replace") as f:
+                files.append((path, f.read()))
+
+    return files
+
+
+def build_roots(script, architecture, options=()):
+    # (first stage packages, third stage packages, Recommends installed) of a build
+    files = script_files(script)
+    text = files[0][1]
+    modern = "common.d/base_image.sh" in text
+    wrapper = WRAPPER.search(text)
+
+    if wrapper and not modern:
+        return build_roots(wrapper.group(1), architecture, list(options) + shlex.split(wrapper.group(2)))
+    words = []
+
+    for path, content in files:
+        for match in INSTALL.finditer(content):
+            words += match.group(1).split()
+
+    # Variables named on the install lines, "\$x" is expanded in the container, not here
+    names = sorted({VARIABLE.match(word).group(1) for word in words if VARIABLE.match(word)})
+    names += ["debootstrap_base", "third_stage_pkgs", "packages", "desktop_pkgs", "extra", "desktop", "variant"]
+
+    defaults = "".join(f"{name}=\"{value}\"\n" for name, value in DEFAULT.findall(text))
+
+    # The package lists as the build-script sees them
+    program = "\n".join([
+        "source ./common.d/functions.sh",
+        "function log() { :; }",
+        "function usage() { exit 1; }",
+        defaults,
+        "arguments \"$@\"",
+        "source ./common.d/packages.sh" if modern else "",
+        # Legacy build-scripts set their lists at the top, e.g. packages="${arm} ${base}"
+        "" if modern else "\n".join(f"{name}=\"{value}\"" for name, value in ASSIGNMENT.findall(text) if "$(" not in value and "`" not in value),
+        "for name in " + " ".join(names) + "; do printf '%s\\0%s\\0' \"${name}\" \"${!name}\"; done"
+    ])
+
+    proc = subprocess.run(["bash", "-c", program, "bash", "--arch", architecture] + list(options) + script_args,
+                          cwd=build.repodir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+
+    if proc.returncode != 0:
+        raise OSError(f"Cannot read the package lists of {script} ({proc.returncode})")
+
+    fields = proc.stdout.split("\0")
+    values = dict(zip(fields[0::2], fields[1::2]))
+
+    first = values.get("debootstrap_base", "").replace(",", " ").split()
+    third = []
+
+    if modern:
+        third += values["third_stage_pkgs"].split() + values["packages"].split()
+
+        if values.get("desktop") != "none":
+            third += values["desktop_pkgs"].split() + values["extra"].split()
+
+    for word in words:
+        variable = VARIABLE.match(word)
+
+        if variable:
+            third += values.get(variable.group(1), "").split()
+
+        elif PACKAGE.match(word):
+            third.append(PACKAGE.match(word).group(1))
+
+    recommends = not re.search(r"minimal|slim", values.get("variant") or values.get("desktop", ""))
+
+    return first, list(collections.OrderedDict.fromkeys(third)), recommends
+
+
+def resolve(selection, loaded):
+    # [{script, architecture, images, packages {name: Package}, required, bootstrap, missing}]
+    builds = []
+
+    for (script, architecture), job in selection.jobs.items():
+        index = loaded.get(architecture)
+
+        if index is None:
+            print(f"[-] {script} ({architecture}): no Packages index for {architecture}", file=sys.stderr)
+
+            continue
+
+        try:
+            first, third, recommends = build_roots(script, architecture)
+
+        except OSError as e:
+            print(f"[-] {script} ({architecture}): {e}", file=sys.stderr)
+
+            continue
+
+        # debootstrap's "required" (extracted by the first stage), then its "base"
+        required, missing = index.closure(index.base("required"), False)
+        selected, more = index.closure(index.base() + first, False, collections.OrderedDict(required))
+        bootstrap = list(selected)
+        selected, third_missing = index.closure(third, recommends, selected)
+
+        builds.append({"script": script, "architecture": architecture, "images": job.images,
+                       "packages": selected, "required": list(required), "bootstrap": bootstrap,
+                       "missing": missing + more + third_missing})
+
+    return builds
+
+
+def union(builds):
+    # {architecture: {filename: Package}}, every .deb once
+    debs = collections.OrderedDict()
+
+    for entry in builds:
+        found = debs.setdefault(entry["architecture"], collections.OrderedDict())
+
+        for package in entry["packages"].values():
+            if "Filename" in package.fields:
+                found.setdefault(package.fields["Filename"], package)
+
+    return debs
+
+
+def fetch_deb(opener, package):
+    # Download one .deb and check it, (package, error or None)
+    filename = package.fields["Filename"]
+    target = os.path.join(downloaddir, filename) if downloaddir else ""
+    sha256 = package.fields.get("SHA256", "")
+
+    if target and os.path.isfile(target) and os.path.getsize(target) == package.size():
+        return package, None
+
+    h = hashlib.sha256()
+    tmp = f"{target}.part" if target else ""
+
+    try:
+        if target:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        with opener.open(f"{mirror}/{filename}", timeout=60) as response:
+            out = open(tmp, "wb") if tmp else None
+
+            try:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+
+                    if not chunk:
+                        break
+
+                    h.update(chunk)
+
+                    if out:
+                        out.write(chunk)
+
+            finally:
+                if out:
+                    out.close()
+
+        if sha256 and h.hexdigest() != sha256:
+            raise OSError(f"SHA256 mismatch ({h.hexdigest()})")
+
+        if tmp:
+            os.rename(tmp, target)
+
+    except (OSError, ValueError) as e:
+        if tmp and os.path.exists(tmp):
+            os.unlink(tmp)
+
+        return package, str(e)
+
+    return package, None
+
+
+def prefetch(debs):
+    # Fetch every .deb once (Architecture: all ones are in every architecture), jobs at a time; the number of failures
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({"http": proxy, "https": proxy} if proxy else {}))
+    packages = list(collections.OrderedDict((filename, package) for found in debs.values() for filename, package in found.items()).values())
+    failed = 0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(fetch_deb, opener, package) for package in packages]
+
+        for count, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            package, error = future.result()
+
+            if error:
+                failed += 1
+                print(f"[-] {package.fields['Filename']}: {error}", file=sys.stderr)
+
+            elif count % 100 == 0 or count == len(packages):
+                print(f"[+] Fetched {count}/{len(packages)}", file=sys.stderr)
+
+    return failed
+
+
+def size(value):
+    return f"{value / (1 << 20):.0f} MiB"
+
+
+def main(argv):
+    getargs(argv)
+
+    selection = build.Selection(supports, architectures, vendors)
+    catalog.walk(catalog.load(inputfile), [selection])
+
+    if not selection.jobs:
+        bail("No image selected")
+
+    loaded = load_indexes({arch for script, arch in selection.jobs})
+    builds = resolve(selection, loaded)
+    debs = union(builds)
+
+    rows = [("Build script", "Architecture", "Images", "Packages", "Download", "Installed", "Missing")]
+
+    for entry in builds:
+        packages = entry["packages"].values()
+        entry["download"] = sum(package.size() for package in packages)
+        entry["installed_size"] = sum(package.installed_size() for package in packages)
+        rows.append((entry["script"], entry["architecture"], str(len(entry["images"])), str(len(entry["packages"])),
+                     size(entry["download"]), size(entry["installed_size"]), ", ".join(entry["missing"][:3]) + (" ..." if len(entry["missing"]) > 3 else "")))
+
+    print("")
+
+    for line in build.table(rows):
+        print(line)
+
+    print("")
+
+    for architecture, found in debs.items():
+        per_build = sum(entry["download"] for entry in builds if entry["architecture"] == architecture)
+        print(f"[i] {architecture}: {len(found)} .deb(s), {size(sum(p.size() for p in found.values()))} to fetch once ({size(per_build)} fetched build by build)")
+
+    if outputfile:
+        with open(outputfile, "w") as f:
+            json.dump({
+                "mirror": mirror,
+                "builds": [{
+                    "script": entry["script"],
+                    "architecture": entry["architecture"],
+                    "images": entry["images"],
+                    "packages": sorted(entry["packages"]),
+                    "required": sorted(entry["required"]),
+                    "bootstrap": sorted(entry["bootstrap"]),
+                    "download": entry["download"],
+                    "installed_size": entry["installed_size"],
+                    "missing": entry["missing"]
+                } for entry in builds],
+                "debs": {architecture: [{
+                    "package": p.name,
+                    "version": p.version,
+                    "filename": filename,
+                    "size": p.size(),
+                    "sha256": p.fields.get("SHA256", "")
+                } for filename, p in found.items()] for architecture, found in debs.items()}
+            }, f, indent=2)
+
+        print(f"\nPlan file created\t: {outputfile}")
+
+    if fetch:
+        failed = prefetch(debs)
+
+        if failed:
+            print(f"\n[-] {failed} .deb(s) could not be fetched", file=sys.stderr)
+
+            exit(1)
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+
+###############################################
+# Cache of base rootfs snapshots, taken after the common third stage
+#
+# Every build bootstraps a rootfs and runs the same apt installs from
+# ./common.d/base_image.sh before any device specific step. Builds with
+# the same inputs (architecture, suite, components, mirror, package lists,
+# and the files that stage reads: base_image.sh, apt_options.sh, bsp/)
+# end up with the same rootfs, so ./common.d/base_image.sh keeps a
+# snapshot of it keyed by a hash of those inputs (rootfs_cache=yes).
+#
+# Snapshots are stored in the cache directory as either:
+# - dir: a copy of the tree, restored with "cp --reflink=auto" (near free on
+#   btrfs/xfs, where the cache and base/ share the filesystem)
+# - tar: a tarball (zstd, else pigz, else gzip), with xattrs and ACLs, so
+#   file capabilities survive
+# "auto" picks dir where the cache directory supports reflinks, tar
+# otherwise.
+#
+# Eviction: after each save, least recently used snapshots are removed
+# until the cache fits in -s GiB. Snapshots older than -m days are misses,
+# so package updates are picked up at least that often (base_image.sh also
+# runs a dist-upgrade on top of a restored snapshot).
+#
+# Builds running at the same time share the cache: restores take a
+# shared lock, saves and evictions an exclusive one, and a snapshot is only
+# visible once it is complete.
+#
+# Dependencies:
+# sudo apt -y install python3 tar zstd
+#
+# Usage:
+# ./bin/rootfs-cache.py key [-e <value>]... [<file or directory>]...
+# ./bin/rootfs-cache.py restore -c <cache dir> [-m <max age days>] <key> <target dir>
+# ./bin/rootfs-cache.py save -c <cache dir> [-f auto|dir|tar] [-s <max size GiB>] <key> <source dir>
+# ./bin/rootfs-cache.py list -c <cache dir>
+# ./bin/rootfs-cache.py prune -c <cache dir> [-s <max size GiB>] [-m <max age days>]
+#
+# E.g.:
+# ./bin/rootfs-cache.py key -e arm64 -e kali-rolling common.d/base_image.sh bsp/
+# ./bin/rootfs-cache.py restore -c local/rootfs-cache 3f2a...c1 base/rpi-xfce-arm64/working
+
+import fcntl
+import getopt
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+command = ""
+
+cachedir = ""
+
+max_size = 32  # GiB
+
+max_age = 7  # Days
+
+snapshot_format = "auto"
+
+values = []
+
+args = []
+
+META_FILE = "meta.json"
+
+TAR_OPTIONS = ["--numeric-owner", "--xattrs", "--xattrs-include=*", "--acls"]
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} key [-e <value>]... [<file or directory>]..."
+        outstr += f"\n       {prog} restore -c <cache dir> [-m <max age days>] <key> <target dir>"
+        outstr += f"\n       {prog} save -c <cache dir> [-f auto|dir|tar] [-s <max size GiB>] <key> <source dir>"
+        outstr += f"\n       {prog} list -c <cache dir>"
+        outstr += f"\n       {prog} prune -c <cache dir> [-s <max size GiB>] [-m <max age days>]"
+        outstr += f"\nE.g. : {prog} key -e arm64 -e kali-rolling common.d/base_image.sh bsp/\n"
+
+    print(outstr, file=sys.stderr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global command, cachedir, max_size, max_age, snapshot_format, values, args
+
+    commands = {"key": 0, "restore": 2, "save": 2, "list": 0, "prune": 0}
+
+    if not argv or argv[0] not in commands:
+        bail("Expected a command: " + ", ".join(commands))
+
+    command = argv[0]
+
+    try:
+        opts, args = getopt.getopt(
+            argv[1:],
+            "hc:e:f:m:s:",
+            [
+                "cachedir=",
+                "value=",
+                "format=",
+                "max-age=",
+                "max-size="
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-c", "--cachedir"):
+                cachedir = arg
+
+            elif opt in ("-e", "--value"):
+                values.append(arg)
+
+            elif opt in ("-f", "--format"):
+                snapshot_format = arg
+
+            elif opt in ("-m", "--max-age"):
+                max_age = float(arg)
+
+            elif opt in ("-s", "--max-size"):
+                max_size = float(arg)
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    except ValueError as e:
+        bail(f"Invalid value: {e}")
+
+    if command != "key" and not cachedir:
+        bail("Missing required argument: -c/--cachedir")
+
+    if commands[command] and len(args) != commands[command]:
+        bail(f"{command} takes a key and a directory")
+
+    if snapshot_format not in ("auto", "dir", "tar"):
+        bail(f"Unknown format: {snapshot_format}")
+
+    return 0
+
+
+def cache_key(values, paths):
+    # SHA-256 over the values, then every file (name, mode, content) in path order
+    h = hashlib.sha256()
+
+    for value in values:
+        h.update(f"value:{len(value)}:{value}\n".encode())
+
+    for path in paths:
+        files = [path]
+
+        if os.path.isdir(path):
+            files = []
+
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+
+                files += [os.path.join(root, name) for name in sorted(names)]
+
+        elif not os.path.exists(path):
+            raise OSError(f"No such file or directory: {path}")
+
+        for file in files:
+            st = os.lstat(file)
+            h.update(f"file:{file}:{st.st_mode & 0o777:o}\n".encode())
+
+            if os.path.islink(file):
+                h.update(os.readlink(file).encode())
+
+            else:
+                with open(file, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        h.update(chunk)
+
+    return h.hexdigest()
+
+
+def tree_size(path):
+    # Disk usage of a tree, hard links counted once
+    seen = set()
+    total = 0
+
+    for root, dirs, names in os.walk(path):
+        for name in dirs + names:
+            st = os.lstat(os.path.join(root, name))
+
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                total += st.st_blocks * 512
+
+    return total
+
+
+def compressor():
+    # tar -I program, fastest available
+    for program in (["zstd", "-T0", "-3"], ["pigz"], ["gzip", "-1"]):
+        if shutil.which(program[0]):
+            return program
+
+    return ["gzip"]
+
+
+def reflinks(directory):
+    # Does the filesystem of directory support cp --reflink=always?
+    fd, src = tempfile.mkstemp(dir=directory, prefix=".reflink-")
+    os.close(fd)
+    dst = f"{src}.copy"
+
+    try:
+        return subprocess.run(["cp", "--reflink=always", src, dst], stderr=subprocess.DEVNULL).returncode == 0
+
+    finally:
+        for file in (src, dst):
+            if os.path.exists(file):
+                os.unlink(file)
+
+
+class Cache:
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock_fd = os.open(os.path.join(self.directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+
+    def lock(self, exclusive):
+        fcntl.flock(self.lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def unlock(self):
+        fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+    def entries(self):
+        # [(key, meta, last used)], least recently used first
+        found = []
+
+        for key in os.listdir(self.directory):
+            meta_file = os.path.join(self.directory, key, META_FILE)
+
+            try:
+                with open(meta_file) as f:
+                    meta = json.load(f)
+
+                found.append((key, meta, os.stat(meta_file).st_mtime))
+
+            except (OSError, ValueError):
+                continue
+
+        return sorted(found, key=lambda entry: entry[2])
+
+    def remove(self, key):
+        # Lock held by the caller
+        shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+
+    def expired(self, meta):
+        return max_age > 0 and time.time() - meta.get("created", 0) > max_age * 86400
+
+    def restore(self, key, target):
+        # True on a hit, target then holds the snapshot
+        entry = os.path.join(self.directory, key)
+        part = f"{target.rstrip('/')}.part"
+
+        if os.path.exists(target):
+            raise OSError(f"Target already exists: {target}")
+
+        self.lock(False)
+
+        try:
+            try:
+                with open(os.path.join(entry, META_FILE)) as f:
+                    meta = json.load(f)
+
+            except (OSError, ValueError):
+                return False
+
+            if self.expired(meta):
+                print(f"[i] Snapshot {key[:12]} is older than {max_age:g} day(s)", file=sys.stderr)
+
+                return False
+
+            if meta["format"] == "dir":
+                cmd = ["cp", "-a", "--reflink=auto", os.path.join(entry, "rootfs"), part]
+
+            else:
+                os.makedirs(part)
+                cmd = ["tar"] + TAR_OPTIONS + ["-I", " ".join(meta["compressor"]), "-C", part, "-xpf", os.path.join(entry, meta["file"])]
+
+            if subprocess.run(cmd).returncode != 0:
+                shutil.rmtree(part, ignore_errors=True)
+                print(f"[-] Cannot restore snapshot {key[:12]}", file=sys.stderr)
+
+                return False
+
+            os.rename(part, target)
+
+            # Last used, for the LRU eviction
+            os.utime(os.path.join(entry, META_FILE))
+
+        finally:
+            self.unlock()
+
+        return True
+
+    def save(self, key, source):
+        # Snapshot source, then evict down to max_size
+        fmt = snapshot_format
+
+        if fmt == "auto":
+            fmt = "dir" if reflinks(self.directory) else "tar"
+
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix=f".{key[:12]}-")
+        meta = {"key": key, "format": fmt, "created": time.time()}
+
+        try:
+            if fmt == "dir":
+                ret = subprocess.run(["cp", "-a", "--reflink=auto", source, os.path.join(tmp, "rootfs")]).returncode
+                meta["size"] = tree_size(os.path.join(tmp, "rootfs"))
+
+            else:
+                meta["compressor"] = compressor()
+                meta["file"] = "rootfs.tar"
+                ret = subprocess.run(["tar"] + TAR_OPTIONS + ["-I", " ".join(meta["compressor"]), "-C", source, "-cf", os.path.join(tmp, meta["file"]), "."]).returncode
+                meta["size"] = os.path.getsize(os.path.join(tmp, meta["file"]))
+
+            if ret != 0:
+                raise OSError(f"Cannot snapshot {source}")
+
+            with open(os.path.join(tmp, META_FILE), "w") as f:
+                json.dump(meta, f, indent=2)
+
+            self.lock(True)
+
+            try:
+                # Another build may have saved the same key meanwhile
+                if os.path.exists(os.path.join(self.directory, key)):
+                    self.remove(key)
+
+                os.rename(tmp, os.path.join(self.directory, key))
+                self.evict(keep=key)
+
+            finally:
+                self.unlock()
+
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        return meta
+
+    def evict(self, keep=None):
+        # Lock held by the caller. Expired first, then least recently used
+        entries = self.entries()
+        total = sum(meta.get("size", 0) for key, meta, last_used in entries)
+        removed = []
+
+        for key, meta, last_used in entries:
+            if key == keep:
+                continue
+
+            if self.expired(meta) or total > max_size * (1 << 30):
+                self.remove(key)
+                total -= meta.get("size", 0)
+                removed.append(key)
+
+        return removed
+
+
+def main(argv):
+    getargs(argv)
+
+    if command == "key":
+        try:
+            print(cache_key(values, args))
+
+        except OSError as e:
+            bail("Cannot compute the key", str(e))
+
+        exit(0)
+
+    cache = Cache(cachedir)
+
+    if command == "restore":
+        try:
+            hit = cache.restore(args[0], args[1])
+
+        except OSError as e:
+            bail("Cannot restore", str(e))
+
+        print(f"[{'+' if hit else 'i'}] Rootfs snapshot {args[0][:12]}: {'hit' if hit else 'miss'}", file=sys.stderr)
+
+        exit(0 if hit else 1)
+
+    elif command == "save":
+        try:
+            meta = cache.save(args[0], args[1])
+
+        except OSError as e:
+            bail("Cannot save", str(e))
+
+        print(f"[+] Rootfs snapshot {args[0][:12]} saved ({meta['format']}, {meta['size'] / (1 << 20):.0f} MiB)", file=sys.stderr)
+
+    elif command == "list":
+        for key, meta, last_used in cache.entries():
+            print(f"{key}  {meta['format']:<3}  {meta.get('size', 0) / (1 << 20):>8.0f} MiB  {time.strftime('%Y-%m-%d %H:%M', time.localtime(last_used))}")
+
+    elif command == "prune":
+        cache.lock(True)
+
+        try:
+            removed = cache.evict()
+
+        finally:
+            cache.unlock()
+
+        print(f"[+] Removed {len(removed)} snapshot(s)", file=sys.stderr)
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+###############################################
+# Find the data and hole extents of a (sparse) file
+#
+# make_image() in ./common.d/functions.sh fallocates the image with
+# headroom for $free_space and $bootsize; most of that is never written.
+# SEEK_DATA/SEEK_HOLE report those ranges as holes (unwritten extents
+# read as zeros), so readers can produce the zeros without any I/O.
+#
+# Where SEEK_DATA/SEEK_HOLE are not supported (old kernels, some
+# filesystems, Python builds without them) the whole file is one data
+# extent, which is the same as a dense read.
+#
+# Dependencies:
+# sudo apt -y install python3
+#
+# Usage:
+# ./bin/sparse.py <file> [<file> ...]
+#
+# E.g.:
+# ./bin/sparse.py images/kali-linux-2022.3-raspberry-pi-arm64.img
+#
+# From another script in ./bin/:
+# import sparse
+# with open("image.img", "rb") as f:
+#     for offset, length, data in sparse.extents(f.fileno()):
+#         ...
+
+import errno
+import os
+import sys
+
+
+def extents(fd, size=None):
+    # Yields (offset, length, is_data) covering [0, size) in order. Moves the
+    # file position, readers must seek to each data extent
+    if size is None:
+        size = os.fstat(fd).st_size
+
+    if size == 0:
+        return
+
+    if not hasattr(os, "SEEK_DATA"):
+        yield 0, size, True
+
+        return
+
+    offset = 0
+
+    while offset < size:
+        try:
+            data = os.lseek(fd, offset, os.SEEK_DATA)
+
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # No data after offset: the rest of the file is a hole
+                yield offset, size - offset, False
+
+                break
+
+            if offset == 0:
+                # Not supported here, read it all
+                yield 0, size, True
+
+                return
+
+            raise
+
+        data = min(data, size)
+
+        if data > offset:
+            yield offset, data - offset, False
+
+        if data >= size:
+            break
+
+        hole = min(os.lseek(fd, data, os.SEEK_HOLE), size)
+        yield data, hole - data, True
+        offset = hole
+
+
+def main(argv):
+    if not argv or argv[0] in ("-h", "--help"):
+        print(f"\nUsage: {sys.argv[0]} <file> [<file> ...]\n")
+        sys.exit(2)
+
+    ret = 0
+
+    for file in argv:
+        try:
+            with open(file, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                ranges = list(extents(f.fileno(), size))
+
+        except OSError as e:
+            print(f"[-] {file}: {e.strerror}")
+            ret = 1
+
+            continue
+
+        mapped = sum(length for offset, length, is_data in ranges if is_data)
+
+        print(file)
+        print(f"  Size       : {size} B")
+        print(f"  Data       : {mapped} B ({mapped * 100 // max(size, 1)}%)")
+        print(f"  Extents    : {sum(1 for r in ranges if r[2])} data, {sum(1 for r in ranges if not r[2])} hole")
+
+    exit(ret)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+
+###############################################
+# Block-parallel xz encoder
+#
+# Splits the input into fixed-size blocks, compresses the blocks on a pool
+# of workers with Python's lzma, and writes them as one standard
+# multi-block .xz stream with a complete index. The output decompresses
+# with stock xz, and because every block has its sizes in its header and
+# in the index, xz (>= 5.4)/pixz can decompress it in parallel and tools
+# can seek in it.
+#
+# liblzma releases the GIL while it compresses, so the workers are
+# threads: the blocks are not copied between processes, and at most
+# <workers> blocks are being compressed at any time. Memory use is about
+# (2 x <workers> + 1) x <block size>, plus the lzma encoder state per
+# worker (~94 MiB at preset 6).
+#
+# Used by ./bin/compress-image.py when pixz is not available.
+#
+# Format: https://tukaani.org/xz/xz-file-format.txt
+#
+# Dependencies:
+# sudo apt -y install python3
+#
+# Usage:
+# ./bin/xzblock.py [-T <workers>] [-b <block size in MiB>] [-p <preset>] <input> [<output>]
+#
+# E.g.:
+# ./bin/xzblock.py -T 4 images/kali-linux-2022.3-raspberry-pi-arm64.img
+#
+# From another script in ./bin/:
+# import xzblock
+# with open("image.img.xz", "wb") as f:
+#     encoder = xzblock.BlockEncoder(f, workers=4)
+#     encoder.write(data)
+#     encoder.close()
+
+import collections
+import concurrent.futures
+import getopt
+import io
+import lzma
+import os
+import struct
+import sys
+import zlib
+
+import xzindex
+
+# CRC64 is what xz uses by default; the check is computed by liblzma per block
+CHECK_FLAGS = b"\x00\x04"
+CHECK_SIZE = 8
+
+# Block flags: compressed size and uncompressed size present in the block header
+BLOCK_COMPRESSED_SIZE = 0x40
+BLOCK_UNCOMPRESSED_SIZE = 0x80
+
+BLOCK_SIZE = 16 << 20
+
+PRESET = 6
+
+workers = os.cpu_count() or 1
+
+block_size = BLOCK_SIZE
+
+preset = PRESET
+
+
+def encode_vli(value):
+    out = bytearray()
+
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+
+    out.append(value)
+
+    return bytes(out)
+
+
+def stream_header():
+    return xzindex.HEADER_MAGIC + CHECK_FLAGS + struct.pack("<I", zlib.crc32(CHECK_FLAGS))
+
+
+def stream_index(blocks):
+    index = bytearray(b"\x00")
+    index += encode_vli(len(blocks))
+
+    for block in blocks:
+        index += encode_vli(block.unpadded_size)
+        index += encode_vli(block.uncompressed_size)
+
+    index += b"\0" * (xzindex.padded(len(index)) - len(index))
+    index += struct.pack("<I", zlib.crc32(index))
+
+    return bytes(index)
+
+
+def stream_footer(index_size):
+    tail = struct.pack("<I", index_size // 4 - 1) + CHECK_FLAGS
+
+    return struct.pack("<I", zlib.crc32(tail)) + tail + xzindex.FOOTER_MAGIC
+
+
+def block_header(compressed_size, uncompressed_size, filter_flags):
+    # Block header with both sizes, as xz -T writes it: xz >= 5.4 decompresses in parallel only then
+    flags = BLOCK_COMPRESSED_SIZE | BLOCK_UNCOMPRESSED_SIZE | (filter_flags[0] - 1)
+    body = bytes([flags]) + encode_vli(compressed_size) + encode_vli(uncompressed_size) + filter_flags[1]
+    size = xzindex.padded(1 + len(body) + 4)
+    header = bytes([size // 4 - 1]) + body + b"\0" * (size - 1 - len(body) - 4)
+
+    return header + struct.pack("<I", zlib.crc32(header))
+
+
+def parse_block_header(block):
+    # (header size, (number of filters, filter flags)) of a block liblzma wrote
+    size = (block[0] + 1) * 4
+    flags = block[1]
+    pos = 2
+
+    if flags & BLOCK_COMPRESSED_SIZE:
+        pos = xzindex.decode_vli(block, pos)[1]
+
+    if flags & BLOCK_UNCOMPRESSED_SIZE:
+        pos = xzindex.decode_vli(block, pos)[1]
+
+    start = pos
+
+    for i in range((flags & 0x03) + 1):
+        pos = xzindex.decode_vli(block, pos)[1]
+        properties, pos = xzindex.decode_vli(block, pos)
+        pos += properties
+
+    if pos > size - 4:
+        raise xzindex.XZError("Invalid block header")
+
+    return size, ((flags & 0x03) + 1, block[start:pos])
+
+
+def compress_block(data, preset=PRESET):
+    # Compress one block, returns (padded block bytes incl. check, xzindex.Block)
+    stream = lzma.compress(data, format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC64, preset=preset)
+
+    # liblzma wrote a whole single-block stream, without the sizes in the block header;
+    # keep its LZMA2 data and CRC64, under a header that has them
+    start, blocks, check = xzindex.read_stream(io.BytesIO(stream), len(stream))
+
+    if len(blocks) != 1:
+        raise xzindex.XZError(f"Expected one block, liblzma wrote {len(blocks)}")
+
+    block = stream[xzindex.HEADER_SIZE:xzindex.HEADER_SIZE + xzindex.padded(blocks[0].unpadded_size)]
+    size, filter_flags = parse_block_header(block)
+    compressed_size = blocks[0].unpadded_size - size - CHECK_SIZE
+    header = block_header(compressed_size, len(data), filter_flags)
+
+    payload = block[size:size + compressed_size]
+    payload += b"\0" * (xzindex.padded(compressed_size) - compressed_size)
+
+    return header + payload + block[-CHECK_SIZE:], xzindex.Block(len(header) + compressed_size + CHECK_SIZE, len(data))
+
+
+class BlockEncoder:
+    def __init__(self, out, workers=None, block_size=BLOCK_SIZE, preset=PRESET):
+        self.out = out
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.block_size = block_size
+        self.preset = preset
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        self.pending = collections.deque()
+        self.buffer = bytearray()
+        self.blocks = []
+
+        self.out.write(stream_header())
+
+    def write(self, data):
+        self.buffer += data
+
+        while len(self.buffer) >= self.block_size:
+            self.submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+
+        return len(data)
+
+    def submit(self, data):
+        # Bound the blocks in flight, writing finished ones in order
+        while len(self.pending) >= self.workers:
+            self.flush_one()
+
+        self.pending.append(self.pool.submit(compress_block, data, self.preset))
+
+    def flush_one(self):
+        block, record = self.pending.popleft().result()
+
+        self.out.write(block)
+        self.blocks.append(record)
+
+    def close(self):
+        try:
+            if self.buffer:
+                self.submit(bytes(self.buffer))
+                self.buffer = bytearray()
+
+            while self.pending:
+                self.flush_one()
+
+        finally:
+            self.pool.shutdown(wait=True)
+
+        index = stream_index(self.blocks)
+
+        self.out.write(index)
+        self.out.write(stream_footer(len(index)))
+
+        return 0
+
+
+def bail(message="", strerror=""):
+    outstr = ""
+
+    prog = sys.argv[0]
+
+    if message != "":
+        outstr = f"\nError: {message}"
+
+    if strerror != "":
+        outstr += f"\nMessage: {strerror}\n"
+
+    else:
+        outstr += f"\n\nUsage: {prog} [-T <workers>] [-b <block size in MiB>] [-p <preset>] <input> [<output>]"
+        outstr += f"\nE.g. : {prog} -T 4 images/kali-linux-2022.3-raspberry-pi-arm64.img\n"
+
+    print(outstr)
+
+    sys.exit(2)
+
+
+def getargs(argv):
+    global workers, block_size, preset
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hT:b:p:",
+            [
+                "threads=",
+                "block-size=",
+                "preset="
+            ]
+        )
+
+    except getopt.GetoptError as e:
+        bail(f"Incorrect arguments: {e}")
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                bail()
+
+            elif opt in ("-T", "--threads"):
+                workers = max(1, int(arg))
+
+            elif opt in ("-b", "--block-size"):
+                block_size = int(arg) << 20
+
+            elif opt in ("-p", "--preset"):
+                preset = int(arg)
+
+            else:
+                bail(f"Unrecognised argument: {opt}")
+
+    except ValueError as e:
+        bail(f"Invalid value: {e}")
+
+    if block_size < 1 or not 0 <= preset <= 9:
+        bail("Block size must be at least 1 MiB and the preset between 0 and 9")
+
+    if len(args) not in (1, 2):
+        bail("Expected an input file and an optional output file")
+
+    return args[0], args[1] if len(args) == 2 else f"{args[0]}.xz"
+
+
+def main(argv):
+    src, dst = getargs(argv)
+    tmp = f"{dst}.part"
+
+    try:
+        with open(src, "rb") as fin, open(tmp, "wb") as fout:
+            encoder = BlockEncoder(fout, workers, block_size, preset)
+
+            while True:
+                chunk = fin.read(block_size)
+
+                if not chunk:
+                    break
+
+                encoder.write(chunk)
+
+            encoder.close()
+
+        os.replace(tmp, dst)
+
+    except (OSError, lzma.LZMAError, xzindex.XZError) as e:
+        bail(f"Cannot compress: {src}", str(e))
+
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+    print(f"[+] {dst}: {len(encoder.blocks)} blocks")
+
+    exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
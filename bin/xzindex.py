@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+###############################################
+# Read the index of an .xz file without decompressing it
+#
+# An .xz file is one or more streams, each ending with a 12 byte footer
+# that points back at the stream index. The index lists every block with
+# its unpadded (compressed) and uncompressed size. Reading the footer and
+# the index from the end of the file gives the uncompressed size and the
+# block layout after reading a few KB, however large the image is.
+# The first two bytes of every block header tell whether the block has
+# its sizes there too, which xz (>= 5.4) needs to decompress in parallel.
+#
+# Format: https://tukaani.org/xz/xz-file-format.txt
+#
+# Dependencies:
+# sudo apt -y install python3
+#
+# Usage:
+# ./bin/xzindex.py <file.xz> [<file.xz> ...]
+#
+# E.g.:
+# ./bin/xzindex.py images/kali-linux-2022.3-raspberry-pi-arm64.img.xz
+#
+# From another script in ./bin/:
+# import xzindex
+# info = xzindex.read_index("kali-linux-2022.3-raspberry-pi-arm64.img.xz")
+# info.uncompressed_size, len(info.blocks)
+
+import collections
+import os
+import struct
+import sys
+import zlib
+
+HEADER_MAGIC = b"\xfd7zXZ\x00"
+FOOTER_MAGIC = b"YZ"
+HEADER_SIZE = 12
+FOOTER_SIZE = 12
+
+# Stream flags, second byte: integrity check type
+CHECKS = {
+    0x00: "None",
+    0x01: "CRC32",
+    0x04: "CRC64",
+    0x0A: "SHA-256"
+}
+
+# Block flags: compressed and uncompressed size present in the block header
+BLOCK_SIZES = 0xC0
+
+# Largest index xz itself accepts is far below this, anything bigger is corrupt
+MAX_INDEX_SIZE = 1 << 30
+
+Block = collections.namedtuple("Block", ["unpadded_size", "uncompressed_size"])
+
+XZInfo = collections.namedtuple("XZInfo", [
+    "file_size",
+    "uncompressed_size",
+    "streams",
+    "blocks",
+    "check",
+    "sized"
+])
+
+
+class XZError(Exception):
+    pass
+
+
+def padded(size):
+    return (size + 3) & ~3
+
+
+def decode_vli(buf, pos):
+    # xz variable-length integer: 7 bits per byte, little endian, at most 9 bytes
+    value = 0
+
+    for i in range(9):
+        if pos >= len(buf):
+            raise XZError("Truncated index")
+
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << (i * 7)
+
+        if not byte & 0x80:
+            if byte == 0 and i > 0:
+                raise XZError("Invalid integer encoding in index")
+
+            return value, pos
+
+    raise XZError("Integer too long in index")
+
+
+def parse_footer(footer):
+    if footer[10:12] != FOOTER_MAGIC:
+        raise XZError("Stream footer magic not found")
+
+    crc, backward_size, flags = struct.unpack("<II2s", footer[:10])
+
+    if zlib.crc32(footer[4:10]) != crc:
+        raise XZError("Stream footer CRC32 mismatch")
+
+    if flags[0] != 0 or flags[1] & 0xF0:
+        raise XZError("Unsupported stream flags")
+
+    return (backward_size + 1) * 4, flags
+
+
+def parse_index(index):
+    if index[0] != 0x00:
+        raise XZError("Index indicator not found")
+
+    crc = struct.unpack("<I", index[-4:])[0]
+
+    if zlib.crc32(index[:-4]) != crc:
+        raise XZError("Index CRC32 mismatch")
+
+    count, pos = decode_vli(index, 1)
+
+    blocks = []
+
+    for i in range(count):
+        unpadded, pos = decode_vli(index, pos)
+        uncompressed, pos = decode_vli(index, pos)
+
+        if unpadded == 0:
+            raise XZError("Invalid block size in index")
+
+        blocks.append(Block(unpadded, uncompressed))
+
+    # Index padding, then the CRC32
+    if padded(pos) != len(index) - 4 or any(index[pos:-4]):
+        raise XZError("Invalid index padding")
+
+    return blocks
+
+
+def read_stream(f, end):
+    # Parse the stream ending at offset end, return (stream start, blocks, check)
+    if end < HEADER_SIZE + FOOTER_SIZE:
+        raise XZError("File too small to be an xz stream")
+
+    f.seek(end - FOOTER_SIZE)
+    index_size, flags = parse_footer(f.read(FOOTER_SIZE))
+
+    index_start = end - FOOTER_SIZE - index_size
+
+    if index_size > MAX_INDEX_SIZE or index_start < HEADER_SIZE:
+        raise XZError("Index size out of range")
+
+    f.seek(index_start)
+    blocks = parse_index(f.read(index_size))
+
+    start = index_start - sum(padded(b.unpadded_size) for b in blocks) - HEADER_SIZE
+
+    if start < 0:
+        raise XZError("Block sizes in index exceed the file size")
+
+    f.seek(start)
+    header = f.read(HEADER_SIZE)
+
+    if header[:6] != HEADER_MAGIC:
+        raise XZError(f"Stream header magic not found at offset {start}")
+
+    if zlib.crc32(header[6:8]) != struct.unpack("<I", header[8:12])[0]:
+        raise XZError("Stream header CRC32 mismatch")
+
+    if header[6:8] != flags:
+        raise XZError("Stream header and footer flags differ")
+
+    return start, blocks, flags[1]
+
+
+def sized_blocks(f, start, blocks):
+    # Do all the blocks of the stream at start have both sizes in their header?
+    offset = start + HEADER_SIZE
+
+    for block in blocks:
+        f.seek(offset)
+        header = f.read(2)
+
+        if len(header) != 2 or header[1] & BLOCK_SIZES != BLOCK_SIZES:
+            return False
+
+        offset += padded(block.unpadded_size)
+
+    return True
+
+
+def skip_padding(f, end):
+    # Stream padding: multiples of four null bytes, after any stream
+    while end >= 4:
+        f.seek(end - 4)
+
+        if f.read(4) != b"\0\0\0\0":
+            break
+
+        end -= 4
+
+    return end
+
+
+def read_index(file):
+    try:
+        with open(file, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+
+            if file_size % 4:
+                raise XZError("File size is not a multiple of four")
+
+            streams = 0
+            blocks = []
+            checks = set()
+            sized = True
+
+            end = skip_padding(f, file_size)
+
+            # Walk the streams back to front
+            while end > 0:
+                start, stream_blocks, check = read_stream(f, end)
+
+                streams += 1
+                blocks[:0] = stream_blocks
+                checks.add(check)
+                sized = sized and sized_blocks(f, start, stream_blocks)
+
+                end = skip_padding(f, start)
+
+    except OSError as e:
+        raise XZError(f"Cannot read {file}: {e.strerror}")
+
+    if streams == 0:
+        raise XZError("No xz stream found")
+
+    if len(checks) == 1:
+        check = CHECKS.get(checks.pop(), "Unknown")
+
+    else:
+        check = "Mixed"
+
+    return XZInfo(
+        file_size=file_size,
+        uncompressed_size=sum(b.uncompressed_size for b in blocks),
+        streams=streams,
+        blocks=blocks,
+        check=check,
+        sized=sized
+    )
+
+
+def main(argv):
+    if not argv or argv[0] in ("-h", "--help"):
+        print(f"\nUsage: {sys.argv[0]} <file.xz> [<file.xz> ...]\n")
+        sys.exit(2)
+
+    ret = 0
+
+    for file in argv:
+        try:
+            info = read_index(file)
+
+        except XZError as e:
+            print(f"[-] {file}: {e}")
+            ret = 1
+
+            continue
+
+        print(file)
+        print(f"  Streams          : {info.streams}")
+        print(f"  Blocks           : {len(info.blocks)}")
+        print(f"  Compressed size  : {info.file_size} B")
+        print(f"  Uncompressed size: {info.uncompressed_size} B")
+        print(f"  Check            : {info.check}")
+        print(f"  Sizes in headers : {'Yes' if info.sized else 'No'}")
+
+    exit(ret)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -379,34 +379,84 @@ deb ${mirror} ${suite} ${components//,/ }
 #deb-src ${mirror} ${suite} ${components//,/ }
 EOF
 
+# git_mirror=yes: clone from the local mirrors of the repositories, see ./bin/git-mirror.py
+git_mirror_args="-m ${git_mirror_dir:-${repo_dir}/local/git-mirror} -r ${git_mirror_refresh:-3600}"
+
+if [ "${git_mirror_offline:-no}" = "yes" ]; then
+    git_mirror_args="${git_mirror_args} --offline"
+
+fi
+
 # Pull in the gcc 4.7 cross compiler to build the kernel
 # Debian uses a gcc that the chromebook kernel doesn't have support for
 cd "${base_dir}"
-git clone --depth 1 https://gitlab.com/kalilinux/packages/gcc-arm-linux-gnueabihf-4-7.git gcc-arm-linux-gnueabihf-4.7
+if [ "${git_mirror:-no}" = "yes" ]; then
+    "${repo_dir}"/bin/git-mirror.py clone ${git_mirror_args} --depth 1 https://gitlab.com/kalilinux/packages/gcc-arm-linux-gnueabihf-4-7.git gcc-arm-linux-gnueabihf-4.7
+
+else
+    git clone --depth 1 https://gitlab.com/kalilinux/packages/gcc-arm-linux-gnueabihf-4-7.git gcc-arm-linux-gnueabihf-4.7
+
+fi
 
 # Kernel section.  If you want to use a custom kernel, or configuration, replace
 # them in this section
-git clone --depth 1 https://chromium.googlesource.com/chromiumos/third_party/kernel -b release-${kernel_release} ${work_dir}/usr/src/kernel
-cd ${work_dir}/usr/src/kernel
-cp ${repo_dir}/kernel-configs/chromebook-3.8.config .config
-cp ${repo_dir}/kernel-configs/chromebook-3.8.config ../exynos.config
-cp ${repo_dir}/kernel-configs/chromebook-3.8_wireless-3.4.config exynos_wifi34.config
-git rev-parse HEAD >${work_dir}/usr/src/kernel-at-commit
-export ARCH=arm
-
-# Edit the CROSS_COMPILE variable as needed
-export CROSS_COMPILE="${base_dir}"/gcc-arm-linux-gnueabihf-4.7/bin/arm-linux-gnueabihf-
-patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/mac80211.patch
-patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/0001-exynos-drm-smem-start-len.patch
-patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/0001-mwifiex-do-not-create-AP-and-P2P-interfaces-upon-dri.patch
-patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/0001-Commented-out-pr_debug-line.patch
-patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/0002-Fix-udl_connector-include.patch
-make oldconfig || die "Kernel config options added"
-make -j $(grep -c processor /proc/cpuinfo)
-make dtbs
-make modules_install INSTALL_MOD_PATH=${work_dir}
-
-cat <<__EOF__ >${work_dir}/usr/src/kernel/arch/arm/boot/kernel-exynos.its
+
+# Kernel, modules and kernel.bin from an earlier build of the same inputs when there is one (kernel_cache=yes),
+# see ./bin/kernel-cache.py
+kernel_cache_key=""
+kernel_cache_dir=${kernel_cache_dir:-"${repo_dir}/local/kernel-cache"}
+kernel_source="https://chromium.googlesource.com/chromiumos/third_party/kernel#release-${kernel_release}"
+
+if [ "${kernel_cache:-no}" = "yes" ] && [ "${git_mirror:-no}" = "yes" ]; then
+    # The revision from the local mirror, so offline builds hit the cache too
+    kernel_source="${kernel_source%%#*}#$("${repo_dir}"/bin/git-mirror.py rev ${git_mirror_args} "${kernel_source%%#*}" release-${kernel_release})" ||
+        kernel_source=""
+
+fi
+
+if [ "${kernel_cache:-no}" = "yes" ] && [ -n "${kernel_source}" ]; then
+    kernel_cache_key=$("${repo_dir}"/bin/kernel-cache.py key -e "${architecture}" -g "${kernel_source}" \
+        -t "${base_dir}"/gcc-arm-linux-gnueabihf-4.7/bin/arm-linux-gnueabihf-gcc "${repo_dir}"/chromebook-exynos.sh \
+        "${repo_dir}"/kernel-configs/chromebook-3.8.config "${repo_dir}"/kernel-configs/chromebook-3.8_wireless-3.4.config \
+        "${repo_dir}"/patches/mac80211.patch "${repo_dir}"/patches/0001-exynos-drm-smem-start-len.patch \
+        "${repo_dir}"/patches/0001-mwifiex-do-not-create-AP-and-P2P-interfaces-upon-dri.patch \
+        "${repo_dir}"/patches/0001-Commented-out-pr_debug-line.patch "${repo_dir}"/patches/0002-Fix-udl_connector-include.patch) ||
+        kernel_cache_key=""
+
+fi
+
+if [ -n "${kernel_cache_key}" ] && "${repo_dir}"/bin/kernel-cache.py restore -c "${kernel_cache_dir}" -m "${kernel_cache_days:-30}" "${kernel_cache_key}" "${base_dir}"; then
+    echo "[+] Restored kernel build ${kernel_cache_key:0:12}"
+
+else
+    if [ "${git_mirror:-no}" = "yes" ]; then
+        "${repo_dir}"/bin/git-mirror.py clone ${git_mirror_args} --depth 1 https://chromium.googlesource.com/chromiumos/third_party/kernel -b release-${kernel_release} ${work_dir}/usr/src/kernel
+
+    else
+        git clone --depth 1 https://chromium.googlesource.com/chromiumos/third_party/kernel -b release-${kernel_release} ${work_dir}/usr/src/kernel
+
+    fi
+
+    cd ${work_dir}/usr/src/kernel
+    cp ${repo_dir}/kernel-configs/chromebook-3.8.config .config
+    cp ${repo_dir}/kernel-configs/chromebook-3.8.config ../exynos.config
+    cp ${repo_dir}/kernel-configs/chromebook-3.8_wireless-3.4.config exynos_wifi34.config
+    git rev-parse HEAD >${work_dir}/usr/src/kernel-at-commit
+    export ARCH=arm
+
+    # Edit the CROSS_COMPILE variable as needed
+    export CROSS_COMPILE="${base_dir}"/gcc-arm-linux-gnueabihf-4.7/bin/arm-linux-gnueabihf-
+    patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/mac80211.patch
+    patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/0001-exynos-drm-smem-start-len.patch
+    patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/0001-mwifiex-do-not-create-AP-and-P2P-interfaces-upon-dri.patch
+    patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/0001-Commented-out-pr_debug-line.patch
+    patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/0002-Fix-udl_connector-include.patch
+    make oldconfig || die "Kernel config options added"
+    make -j $(grep -c processor /proc/cpuinfo)
+    make dtbs
+    make modules_install INSTALL_MOD_PATH=${work_dir}
+
+    cat <<__EOF__ >${work_dir}/usr/src/kernel/arch/arm/boot/kernel-exynos.its
 /dts-v1/;
 
 / {
@@ -637,21 +687,31 @@ cat <<__EOF__ >${work_dir}/usr/src/kernel/arch/arm/boot/kernel-exynos.its
 };
 __EOF__
 
-cd ${work_dir}/usr/src/kernel/arch/arm/boot
-mkimage -D "-I dts -O dtb -p 2048" -f kernel-exynos.its exynos-kernel
+    cd ${work_dir}/usr/src/kernel/arch/arm/boot
+    mkimage -D "-I dts -O dtb -p 2048" -f kernel-exynos.its exynos-kernel
+
+    # microSD Card
+    echo 'noinitrd console=tty1 quiet root=PARTUUID=%U/PARTNROFF=1 rootwait rw lsm.module_locking=0 net.ifnames=0 rootfstype=$fstype' >cmdline
+
+    # Pulled from ChromeOS, this is exactly what they do because there's no
+    # bootloader in the kernel partition on ARM
+    dd if=/dev/zero of=bootloader.bin bs=512 count=1
+
+    vbutil_kernel --arch arm --pack "${base_dir}"/kernel.bin --keyblock /usr/share/vboot/devkeys/kernel.keyblock --signprivate /usr/share/vboot/devkeys/kernel_data_key.vbprivk --version 1 --config cmdline --bootloader bootloader.bin --vmlinuz exynos-kernel
 
-# microSD Card
-echo 'noinitrd console=tty1 quiet root=PARTUUID=%U/PARTNROFF=1 rootwait rw lsm.module_locking=0 net.ifnames=0 rootfstype=$fstype' >cmdline
+    cd ${work_dir}/usr/src/kernel/
+    make mrproper
+    cp ../exynos.config .config
 
-# Pulled from ChromeOS, this is exactly what they do because there's no
-# bootloader in the kernel partition on ARM
-dd if=/dev/zero of=bootloader.bin bs=512 count=1
+    if [ -n "${kernel_cache_key}" ]; then
+        "${repo_dir}"/bin/kernel-cache.py save -c "${kernel_cache_dir}" -s "${kernel_cache_size:-16}" -m "${kernel_cache_days:-30}" "${kernel_cache_key}" "${base_dir}" \
+            kali-${architecture}/usr/src/kernel kali-${architecture}/usr/src/exynos.config kali-${architecture}/usr/src/kernel-at-commit kali-${architecture}/lib/modules kernel.bin ||
+            echo "[-] Could not save the kernel build, continuing"
 
-vbutil_kernel --arch arm --pack "${base_dir}"/kernel.bin --keyblock /usr/share/vboot/devkeys/kernel.keyblock --signprivate /usr/share/vboot/devkeys/kernel_data_key.vbprivk --version 1 --config cmdline --bootloader bootloader.bin --vmlinuz exynos-kernel
+    fi
+
+fi
 
-cd ${work_dir}/usr/src/kernel/
-make mrproper
-cp ../exynos.config .config
 cd "${base_dir}"
 
 # Fix up the symlink for building external modules
@@ -795,7 +855,7 @@ UUID=$(blkid -s UUID -o value ${rootp})
 echo "UUID=$UUID /               $fstype    errors=remount-ro 0       1" >>${work_dir}/etc/fstab
 
 echo "Rsyncing rootfs into image file"
-rsync -HPavz -q ${work_dir}/ ${base_dir}/root/
+rsync -Hav -q ${work_dir}/ ${base_dir}/root/
 
 # Unmount partition
 sync
@@ -377,38 +377,70 @@ EOF
 
 cd ${base_dir}
 
+# git_mirror=yes: clone from the local mirrors of the repositories, see ./bin/git-mirror.py
+git_mirror_args="-m ${git_mirror_dir:-${repo_dir}/local/git-mirror} -r ${git_mirror_refresh:-3600}"
+
+if [ "${git_mirror_offline:-no}" = "yes" ]; then
+    git_mirror_args="${git_mirror_args} --offline"
+
+fi
+
 # Kernel section.  If you want to use a custom kernel, or configuration, replace
 # them in this section
-# Mainline kernel branch
-git clone https://kernel.googlesource.com/pub/scm/linux/kernel/git/stable/linux.git -b linux-4.19.y ${work_dir}/usr/src/kernel
 
-# ChromeOS kernel branch
-#git clone --depth 1 https://chromium.googlesource.com/chromiumos/third_party/kernel.git -b release-${kernel_release} ${work_dir}/usr/src/kernel
-cd ${work_dir}/usr/src/kernel
+# Kernel, modules and kernel.bin from an earlier build of the same inputs when there is one (kernel_cache=yes),
+# see ./bin/kernel-cache.py
+kernel_cache_key=""
+kernel_cache_dir=${kernel_cache_dir:-"${repo_dir}/local/kernel-cache"}
+
+if [ "${kernel_cache:-no}" = "yes" ]; then
+    kernel_cache_key=$("${repo_dir}"/bin/kernel-cache.py key -e "${architecture}" -t arm-linux-gnueabihf-gcc \
+        -g "https://kernel.googlesource.com/pub/scm/linux/kernel/git/stable/linux.git#17a87580a8856170d59aab302226811a4ae69149" \
+        "${repo_dir}"/chromebook-veyron.sh "${repo_dir}"/kernel-configs/veyron-4.19.config "${repo_dir}"/patches/veyron/4.19) ||
+        kernel_cache_key=""
+
+fi
+
+if [ -n "${kernel_cache_key}" ] && "${repo_dir}"/bin/kernel-cache.py restore -c "${kernel_cache_dir}" -m "${kernel_cache_days:-30}" "${kernel_cache_key}" "${base_dir}"; then
+    echo "[+] Restored kernel build ${kernel_cache_key:0:12}"
+
+else
+    # Mainline kernel branch
+    if [ "${git_mirror:-no}" = "yes" ]; then
+        "${repo_dir}"/bin/git-mirror.py clone ${git_mirror_args} https://kernel.googlesource.com/pub/scm/linux/kernel/git/stable/linux.git -b linux-4.19.y ${work_dir}/usr/src/kernel
+
+    else
+        git clone https://kernel.googlesource.com/pub/scm/linux/kernel/git/stable/linux.git -b linux-4.19.y ${work_dir}/usr/src/kernel
+
+    fi
 
-# Check out 4.19.133 which was known to work..
-git checkout 17a87580a8856170d59aab302226811a4ae69149
+    # ChromeOS kernel branch
+    #git clone --depth 1 https://chromium.googlesource.com/chromiumos/third_party/kernel.git -b release-${kernel_release} ${work_dir}/usr/src/kernel
+    cd ${work_dir}/usr/src/kernel
 
-# Mainline kernel config
-cp ${base_dir}/../kernel-configs/veyron-4.19.config .config
+    # Check out 4.19.133 which was known to work..
+    git checkout 17a87580a8856170d59aab302226811a4ae69149
 
-# (Currently not working) chromeos-based kernel config
-#cp ${base_dir}/../kernel-configs/veyron-4.19-cros.config .config
-cp .config ${work_dir}/usr/src/veyron.config
-export ARCH=arm
+    # Mainline kernel config
+    cp ${base_dir}/../kernel-configs/veyron-4.19.config .config
 
-# Edit the CROSS_COMPILE variable as needed
-export CROSS_COMPILE=arm-linux-gnueabihf-
+    # (Currently not working) chromeos-based kernel config
+    #cp ${base_dir}/../kernel-configs/veyron-4.19-cros.config .config
+    cp .config ${work_dir}/usr/src/veyron.config
+    export ARCH=arm
 
-# This allows us to patch the kernel without it adding -dirty to the kernel version
-touch .scmversion
-patch -p1 --no-backup-if-mismatch <${base_dir}/../patches/veyron/4.19/kali-wifi-injection.patch
-patch -p1 --no-backup-if-mismatch <${base_dir}/../patches/veyron/4.19/wireless-carl9170-Enable-sniffer-mode-promisc-flag-t.patch
-make -j$(grep -c processor /proc/cpuinfo)
-make dtbs
-make modules_install INSTALL_MOD_PATH=${work_dir}
+    # Edit the CROSS_COMPILE variable as needed
+    export CROSS_COMPILE=arm-linux-gnueabihf-
 
-cat <<__EOF__ >${work_dir}/usr/src/kernel/arch/arm/boot/kernel-veyron.its
+    # This allows us to patch the kernel without it adding -dirty to the kernel version
+    touch .scmversion
+    patch -p1 --no-backup-if-mismatch <${base_dir}/../patches/veyron/4.19/kali-wifi-injection.patch
+    patch -p1 --no-backup-if-mismatch <${base_dir}/../patches/veyron/4.19/wireless-carl9170-Enable-sniffer-mode-promisc-flag-t.patch
+    make -j$(grep -c processor /proc/cpuinfo)
+    make dtbs
+    make modules_install INSTALL_MOD_PATH=${work_dir}
+
+    cat <<__EOF__ >${work_dir}/usr/src/kernel/arch/arm/boot/kernel-veyron.its
 /dts-v1/;
 
 / {
@@ -543,21 +575,31 @@ cat <<__EOF__ >${work_dir}/usr/src/kernel/arch/arm/boot/kernel-veyron.its
 };
 __EOF__
 
-cd ${work_dir}/usr/src/kernel/arch/arm/boot
-mkimage -D "-I dts -O dtb -p 2048" -f kernel-veyron.its veyron-kernel
+    cd ${work_dir}/usr/src/kernel/arch/arm/boot
+    mkimage -D "-I dts -O dtb -p 2048" -f kernel-veyron.its veyron-kernel
+
+    # BEHOLD THE MAGIC OF PARTUUID/PARTNROFF
+    echo 'noinitrd console=tty1 quiet root=PARTUUID=%U/PARTNROFF=1 rootwait rw lsm.module_locking=0 net.ifnames=0 rootfstype=$fstype' >cmdline
 
-# BEHOLD THE MAGIC OF PARTUUID/PARTNROFF
-echo 'noinitrd console=tty1 quiet root=PARTUUID=%U/PARTNROFF=1 rootwait rw lsm.module_locking=0 net.ifnames=0 rootfstype=$fstype' >cmdline
+    # Pulled from ChromeOS, this is exactly what they do because there's no
+    # bootloader in the kernel partition on ARM
+    dd if=/dev/zero of=bootloader.bin bs=512 count=1
 
-# Pulled from ChromeOS, this is exactly what they do because there's no
-# bootloader in the kernel partition on ARM
-dd if=/dev/zero of=bootloader.bin bs=512 count=1
+    vbutil_kernel --arch arm --pack "${base_dir}"/kernel.bin --keyblock /usr/share/vboot/devkeys/kernel.keyblock --signprivate /usr/share/vboot/devkeys/kernel_data_key.vbprivk --version 1 --config cmdline --bootloader bootloader.bin --vmlinuz veyron-kernel
+    cd ${work_dir}/usr/src/kernel
+    make mrproper
+    cp ${base_dir}/../kernel-configs/veyron-4.19.config .config
+    #cp ${base_dir}/../kernel-configs/veyron-4.19-cros.config .config
+
+    if [ -n "${kernel_cache_key}" ]; then
+        "${repo_dir}"/bin/kernel-cache.py save -c "${kernel_cache_dir}" -s "${kernel_cache_size:-16}" -m "${kernel_cache_days:-30}" "${kernel_cache_key}" "${base_dir}" \
+            kali-${architecture}/usr/src/kernel kali-${architecture}/usr/src/veyron.config kali-${architecture}/lib/modules kernel.bin ||
+            echo "[-] Could not save the kernel build, continuing"
+
+    fi
+
+fi
 
-vbutil_kernel --arch arm --pack "${base_dir}"/kernel.bin --keyblock /usr/share/vboot/devkeys/kernel.keyblock --signprivate /usr/share/vboot/devkeys/kernel_data_key.vbprivk --version 1 --config cmdline --bootloader bootloader.bin --vmlinuz veyron-kernel
-cd ${work_dir}/usr/src/kernel
-make mrproper
-cp ${base_dir}/../kernel-configs/veyron-4.19.config .config
-#cp ${base_dir}/../kernel-configs/veyron-4.19-cros.config .config
 cd ${base_dir}
 
 # Fix up the symlink for building external modules
@@ -660,7 +702,7 @@ UUID=$(blkid -s UUID -o value ${rootp})
 echo "UUID=$UUID /               $fstype    errors=remount-ro 0       1" >>${work_dir}/etc/fstab
 
 echo "Rsyncing rootfs into image file"
-rsync -HPavz -q ${work_dir}/ ${base_dir}/root/
+rsync -Hav -q ${work_dir}/ ${base_dir}/root/
 
 # Unmount partitions
 sync
@@ -31,25 +31,9 @@ source ./common.d/check.sh
 # Packages build list
 include packages
 
-# Execute initial debootstrap
-debootstrap_exec http://http.kali.org/kali
-
-# Define sources.list
-sources_list
-
-# APT options
-include apt_options
-
-# Disable suspend/resume - speeds up boot massively
-mkdir -p "${work_dir}/etc/initramfs-tools/conf.d/"
-echo "RESUME=none" >"${work_dir}/etc/initramfs-tools/conf.d/resume"
-
-# Copy directory bsp into build dir
-status "Copy directory bsp into build dir"
-cp -rp bsp "${work_dir}"
-
-# Third stage
-cat <<EOF >"${work_dir}/third-stage"
+# Third stage header, the device scripts append their steps after it
+function third_stage_header() {
+    cat <<EOF >"${work_dir}/third-stage"
 #!/usr/bin/env bash
 # Stop on error
 set -e
@@ -59,9 +43,60 @@ status_3t=\$(grep '^status_stage3 ' \$0 | wc -l)
 
 status_stage3() {
   status_3i=\$((status_3i+1))
+  echo "\$(date +%s.%N) \$1" >>/third-stage.events
   echo  "  $(tput setaf 15)✅ Stage 3 (\${status_3i}/\${status_3t}):$(tput setaf 2) \$1$(tput sgr0)"
 }
 
+EOF
+}
+
+# Restore the rootfs as an earlier build with the same inputs left it after the common third stage
+# See ./bin/rootfs-cache.py
+rootfs_cache_hit=0
+
+if [ "${rootfs_cache}" = "yes" ]; then
+    rootfs_cache_key=$(./bin/rootfs-cache.py key -e "${architecture}" -e "${suite}" -e "${components}" -e "${mirror}" \
+        -e "${variant}" -e "${desktop}" -e "${debootstrap_base}" -e "${third_stage_pkgs}" -e "${packages}" \
+        -e "${desktop_pkgs} ${extra}" -e "$(lsb_release -sc)" common.d/base_image.sh common.d/apt_options.sh bsp)
+
+    if ./bin/rootfs-cache.py restore -c "${rootfs_cache_dir}" -m "${rootfs_cache_days}" "${rootfs_cache_key}" "${work_dir}"; then
+        status "Restored rootfs snapshot ${rootfs_cache_key:0:12}"
+        rootfs_cache_hit=1
+
+        # apt_options writes the proxy of this build
+        rm -f "${work_dir}"/etc/apt/apt.conf.d/66proxy
+
+    fi
+
+fi
+
+if [ "${rootfs_cache_hit}" = 0 ]; then
+    # Execute initial debootstrap
+    debootstrap_exec http://http.kali.org/kali
+
+    # Define sources.list
+    sources_list
+
+fi
+
+# APT options
+include apt_options
+
+if [ "${rootfs_cache_hit}" = 0 ]; then
+    # Disable suspend/resume - speeds up boot massively
+    mkdir -p "${work_dir}/etc/initramfs-tools/conf.d/"
+    echo "RESUME=none" >"${work_dir}/etc/initramfs-tools/conf.d/resume"
+
+    # Copy directory bsp into build dir
+    status "Copy directory bsp into build dir"
+    cp -rp bsp "${work_dir}"
+
+fi
+
+# Third stage
+third_stage_header
+
+cat <<EOF >>"${work_dir}/third-stage"
 status_stage3 'Update apt'
 export DEBIAN_FRONTEND=noninteractive
 eatmydata apt-get update
@@ -161,3 +196,34 @@ systemctl mask smartmontools
 status_stage3 'Add arch to /var/lib/dpkg/arch file'
 echo 'arm64' | tee /var/lib/dpkg/arch
 EOF
+
+if [ "${rootfs_cache}" = "yes" ]; then
+    if [ "${rootfs_cache_hit}" = 0 ]; then
+        # Run the common part now, so that the snapshot has it
+        chmod 0755 "${work_dir}/third-stage"
+        status "Run common third stage"
+        systemd-nspawn_exec /third-stage
+        rm -f "${work_dir}/third-stage"
+        event_stage3
+
+        status "Save rootfs snapshot ${rootfs_cache_key:0:12}"
+        ./bin/rootfs-cache.py save -c "${rootfs_cache_dir}" -s "${rootfs_cache_size}" -m "${rootfs_cache_days}" \
+            "${rootfs_cache_key}" "${work_dir}" || log "Could not save the rootfs snapshot, continuing" yellow
+
+    fi
+
+    # The device specific steps get a third stage of their own
+    third_stage_header
+
+    if [ "${rootfs_cache_hit}" = 1 ]; then
+        cat <<EOF >>"${work_dir}/third-stage"
+status_stage3 'Update the packages of the rootfs snapshot'
+export DEBIAN_FRONTEND=noninteractive
+eatmydata apt-get update
+eatmydata apt-get -y dist-upgrade
+
+EOF
+
+    fi
+
+fi
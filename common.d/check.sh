@@ -61,6 +61,7 @@ elif [[ ${repo_dir} =~ [[:space:]] ]]; then
 else
     print_config
     mkdir -p ${base_dir}
+    work_tmpfs_mount
 
 fi
 
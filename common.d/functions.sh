@@ -193,6 +193,16 @@ function systemd-nspawn_exec() {
 function debootstrap_exec() {
     status " debootstrap ${suite} $*"
 
+    # First stage from the packages resolved and fetched by ./bin/resolve-packages.py, see ./bin/bootstrap.py
+    if [ -n "${bootstrap_plan}" ]; then
+        "${repo_dir}"/bin/bootstrap.py -p "${bootstrap_plan}" -D "${bootstrap_pool}" -a "${architecture}" -b "$0" \
+            -s "${suite}" -u "${mirror}" -c "${components}" -j "${num_cores}" "${work_dir}"
+        systemd-nspawn_exec /debootstrap/debootstrap --second-stage
+
+        return
+
+    fi
+
     if [ "$(lsb_release -sc)" == "bullseye" ]; then
     eatmydata debootstrap --merged-usr --keyring=/usr/share/keyrings/kali-archive-keyring.gpg --components="${components}" \
         --include="${debootstrap_base}" --arch "${architecture}" "${suite}" "${work_dir}" "$@"
@@ -238,13 +248,24 @@ EOF
 }
 
 # Limit CPU function
+# On cgroup v2 hosts, ./bin/cgroup-run.py also limits memory and I/O, and
+# reports what the command used (to events_file, when set)
 function limit_cpu() {
+    local runner=()
+    local cgroup_v2=0
+
+    [ -e /sys/fs/cgroup/cgroup.controllers ] && cgroup_v2=1
+
     if [[ ${cpu_limit:=} -lt "1" ]]; then
         cpu_limit=-1
         log "CPU limiting has been disabled" yellow
-        eval "${@}"
 
-        return $?
+        if [ "${cgroup_v2}" = 0 ]; then
+            eval "${@}"
+
+            return $?
+
+        fi
 
     elif [[ ${cpu_limit:=} -gt "100" ]]; then
         log "CPU limit (${cpu_limit}) is higher than 100" yellow
@@ -252,28 +273,56 @@ function limit_cpu() {
 
     fi
 
-    if [[ -z $cpu_limit ]]; then
-        log "CPU limit unset" yellow
-        local cpu_shares=$((num_cores * 1024))
-        local cpu_quota="-1"
+    if [ "${cgroup_v2}" = 1 ]; then
+        runner=(python3 "${repo_dir}"/bin/cgroup-run.py -n "${num_cores}" -N "${image_name:-kali}" -d "${image_dir:-.}")
+        [[ ${cpu_limit} -ge 1 ]] && log "Limiting CPU (${cpu_limit}%)" yellow && runner+=(-c "${cpu_limit}")
+        [ -n "${memory_limit}" ] && log "Limiting memory (${memory_limit})" yellow && runner+=(-m "${memory_limit}")
+        [ -n "${io_read_limit}" ] && runner+=(-r "${io_read_limit}")
+        [ -n "${io_write_limit}" ] && runner+=(-w "${io_write_limit}")
+
+        if [ -n "${events_file}" ]; then
+            mkdir -p "$(dirname "${events_file}")"
+            runner+=(-o "${events_file}" -l build="${event_build_id}" -l release="${version}" -l image="${image_name}" \
+                -l arch="${architecture}" -l host="${event_host}" -l step="${event_name}")
+
+        fi
+
+        runner+=(--)
+
+        # Not limited: one run and its exit status, as without cgroups
+        if [[ ${cpu_limit} -lt "1" ]]; then
+            "${runner[@]}" "$@"
+
+            return $?
+
+        fi
 
     else
-        log "Limiting CPU (${cpu_limit}%)" yellow
-        local cpu_shares=$((1024 * num_cores * cpu_limit / 100))  # 1024 max value per core
-        local cpu_quota=$((100000 * num_cores * cpu_limit / 100)) # 100000 max value per core
+        if [[ -z $cpu_limit ]]; then
+            log "CPU limit unset" yellow
+            local cpu_shares=$((num_cores * 1024))
+            local cpu_quota="-1"
 
-    fi
+        else
+            log "Limiting CPU (${cpu_limit}%)" yellow
+            local cpu_shares=$((1024 * num_cores * cpu_limit / 100))  # 1024 max value per core
+            local cpu_quota=$((100000 * num_cores * cpu_limit / 100)) # 100000 max value per core
+
+        fi
 
-    # Random group name
-    local rand
-    rand=$(
-        tr -cd 'A-Za-z0-9' </dev/urandom | head -c4
-        echo
-    )
+        # Random group name
+        local rand
+        rand=$(
+            tr -cd 'A-Za-z0-9' </dev/urandom | head -c4
+            echo
+        )
 
-    cgcreate -g cpu:/cpulimit-"$rand"
-    cgset -r cpu.shares="$cpu_shares" cpulimit-"$rand"
-    cgset -r cpu.cfs_quota_us="$cpu_quota" cpulimit-"$rand"
+        cgcreate -g cpu:/cpulimit-"$rand"
+        cgset -r cpu.shares="$cpu_shares" cpulimit-"$rand"
+        cgset -r cpu.cfs_quota_us="$cpu_quota" cpulimit-"$rand"
+        runner=(cgexec -g cpu:cpulimit-"$rand")
+
+    fi
 
     # Retry command
     local n=1
@@ -282,7 +331,7 @@ function limit_cpu() {
 
     while true; do
         # shellcheck disable=SC2015
-        cgexec -g cpu:cpulimit-"$rand" "$@" && break || {
+        "${runner[@]}" "$@" && break || {
             if [[ $n -lt $max ]]; then
                 ((n++))
                 log "Command failed. Attempt $n/$max" red
@@ -297,7 +346,117 @@ function limit_cpu() {
 
     done
 
-    cgdelete -g cpu:/cpulimit-"$rand"
+    [ "${cgroup_v2}" = 0 ] && cgdelete -g cpu:/cpulimit-"$rand"
+
+    return 0
+}
+
+# git_clone <git clone arguments>: git clone, from the local mirror of the repository when git_mirror=yes
+# See ./bin/git-mirror.py
+function git_clone() {
+    local offline=""
+
+    if [ "${git_mirror}" != "yes" ]; then
+        git clone "$@"
+
+        return
+
+    fi
+
+    if [ "${git_mirror_offline}" = "yes" ]; then
+        offline="--offline"
+
+    fi
+
+    "${repo_dir}"/bin/git-mirror.py clone -m "${git_mirror_dir}" -r "${git_mirror_refresh}" ${offline} "$@"
+}
+
+# git_mirror_rev <url> [<branch or tag>]: commit of the ref in the local mirror of the repository (git_mirror=yes)
+function git_mirror_rev() {
+    local offline=""
+
+    if [ "${git_mirror_offline}" = "yes" ]; then
+        offline="--offline"
+
+    fi
+
+    "${repo_dir}"/bin/git-mirror.py rev -m "${git_mirror_dir}" -r "${git_mirror_refresh}" ${offline} "$@"
+}
+
+# Kernel and bootloader builds cached by ./bin/kernel-cache.py (kernel_cache=yes)
+# kernel_cache_restore <target dir> <key arguments>...: 0 when the build was restored into the target dir.
+# On a miss the target dir is recorded, for kernel_cache_save to store what the build adds to it.
+# With git_mirror=yes the -g revisions come from the local mirrors, so offline builds hit the cache too
+function kernel_cache_restore() {
+    local target="$1"
+    shift
+    local key_args=()
+    local revision
+    kernel_cache_key=""
+
+    [ "${kernel_cache}" = "yes" ] || return 1
+
+    if [ "${git_mirror}" = "yes" ]; then
+        while [ $# -gt 0 ]; do
+            if [ "$1" = "-g" ]; then
+                local url="${2%%#*}" ref="HEAD"
+                [[ "$2" == *"#"* ]] && ref="${2#*#}"
+
+                if ! revision=$(git_mirror_rev "${url}" "${ref}"); then
+                    log "No revision of ${url} ${ref}, building" yellow
+
+                    return 1
+
+                fi
+
+                key_args+=(-g "${url}#${revision}")
+                shift 2
+
+            else
+                key_args+=("$1")
+                shift
+
+            fi
+
+        done
+
+        set -- "${key_args[@]}"
+
+    fi
+
+    if ! kernel_cache_key=$("${repo_dir}"/bin/kernel-cache.py key -e "${architecture}" "$@"); then
+        log "No kernel cache key, building" yellow
+        kernel_cache_key=""
+
+        return 1
+
+    fi
+
+    if "${repo_dir}"/bin/kernel-cache.py restore -c "${kernel_cache_dir}" -m "${kernel_cache_days}" "${kernel_cache_key}" "${target}"; then
+        status "Restored kernel build ${kernel_cache_key:0:12}"
+
+        return 0
+
+    fi
+
+    "${repo_dir}"/bin/kernel-cache.py mark "${target}" "${base_dir}/kernel-cache.manifest" || kernel_cache_key=""
+
+    return 1
+}
+
+# kernel_cache_save <target dir> [<path>]...: store the paths, or all that the build added to the target dir
+function kernel_cache_save() {
+    local target="$1"
+    shift
+
+    [ -n "${kernel_cache_key}" ] || return 0
+
+    "${repo_dir}"/bin/kernel-cache.py save -c "${kernel_cache_dir}" -s "${kernel_cache_size}" -m "${kernel_cache_days}" \
+        -M "${base_dir}/kernel-cache.manifest" "${kernel_cache_key}" "${target}" "$@" ||
+        log "Could not save the kernel build, continuing" yellow
+
+    rm -f "${base_dir}/kernel-cache.manifest"
+    kernel_cache_key=""
 }
 
 function sources_list() {
@@ -408,6 +567,78 @@ function make_swap() {
     fi
 }
 
+# Keep the rootfs size of the build, the next builds size their tmpfs from it
+function rootfs_size_record() {
+    local boot_size
+    boot_size=$(du -s -B1 "${work_dir}"/boot 2>/dev/null | cut -f1)
+
+    mkdir -p "$(dirname "${rootfs_sizes}")"
+    echo "$(date +%s) ${hw_model}-${variant} ${architecture} ${desktop} $((root_size + ${boot_size:-0}))" >>"${rootfs_sizes}" ||
+        true
+}
+
+# Largest of the last rootfs sizes (bytes) of this image, else of the same architecture and desktop
+function rootfs_size_estimate() {
+    [ -f "${rootfs_sizes}" ] || return 0
+
+    local size
+    size=$(awk -v image="${hw_model}-${variant}" '$2 == image { print $5 }' "${rootfs_sizes}" | tail -n 5 | sort -n | tail -n 1)
+
+    if [ -z "${size}" ]; then
+        size=$(awk -v arch="${architecture}" -v desktop="${desktop}" '$3 == arch && $4 == desktop { print $5 }' "${rootfs_sizes}" |
+            tail -n 5 | sort -n | tail -n 1)
+
+    fi
+
+    echo "${size}"
+}
+
+# Build in RAM: tmpfs on base_dir (working dir and rootfs cache restores), see work_tmpfs in ./common.d/variables.sh
+function work_tmpfs_mount() {
+    [ "${work_tmpfs}" = "auto" ] || [ "${work_tmpfs}" = "yes" ] || return 0
+
+    local size available reserved
+
+    if [ -n "${work_tmpfs_size}" ]; then
+        size=$((work_tmpfs_size * 1024 * 1024))
+
+    else
+        size=$(rootfs_size_estimate)
+
+        # No build yet, a guess
+        if [ -z "${size}" ]; then
+            [ "${desktop}" = "none" ] && size=$((4 << 30)) || size=$((12 << 30))
+
+        fi
+
+        # Room for the packages downloaded during the third stage (KiB)
+        size=$((size * 3 / 2 / 1024))
+
+    fi
+
+    # MemAvailable (KiB), less what the tmpfs of other builds can still take
+    available=$(awk '/^MemAvailable:/ { print $2 }' /proc/meminfo)
+    reserved=$(findmnt -rnb -t tmpfs -S kali-arm-build -o SIZE,USED 2>/dev/null | awk '{ sum += $1 - $2 } END { print int(sum / 1024) }')
+    available=$((available - ${reserved:-0}))
+
+    if [ $((size + work_tmpfs_reserve * 1024 * 1024)) -gt "${available}" ]; then
+        if [ "${work_tmpfs}" = "yes" ]; then
+            log "Not enough memory to build in RAM: $((size >> 10))MiB needed + ${work_tmpfs_reserve}GiB reserve, $((available >> 10))MiB available" red
+
+            exit 1
+
+        fi
+
+        log "Not enough memory to build in RAM ($((size >> 10))MiB needed), building on disk" yellow
+
+        return 0
+
+    fi
+
+    log "Building in RAM: $(tput sgr0)tmpfs of $((size >> 10))MiB on ${base_dir}" cyan
+    mount -t tmpfs -o size="${size}k",mode=0755 kali-arm-build "${base_dir}"
+}
+
 # Print current config.
 function print_config() {
     log "\n Compilation info" bold
@@ -426,6 +657,7 @@ function print_config() {
 function make_image() {
     # Calculate the space to create the image.
     root_size=$(du -s -B1 "${work_dir}" --exclude="${work_dir}"/boot | cut -f1)
+    rootfs_size_record
     root_extra=$((root_size * 5 * 1024 / 5 / 1024 / 1000))
     raw_size=$(($((free_space * 1024)) + root_extra + $((bootsize * 1024)) + 4096))
     img_size=$(echo "${raw_size}"Ki | numfmt --from=iec-i --to=si)
@@ -474,6 +706,30 @@ function make_loop() {
     fi
 }
 
+# Partition variables of an image put together by ./bin/assemble-image.py, in place of make_image/make_loop/mkfs_partitions
+function assemble_prepare() {
+    img="${image_dir}/${image_name}.img"
+    disk_id=$(od -An -N4 -tx4 /dev/urandom | tr -d ' ')
+    bootfstype=${bootfstype:-"vfat"}
+    rootfstype=${rootfstype:-"$fstype"}
+
+    # No devices, make_fstab only needs to know there is a boot partition
+    bootp="${img}1"
+    rootp="${img}2"
+    root_partuuid="${disk_id}-02"
+}
+
+# Write the image from the working dir, once fstab and the boot files are in place
+function assemble_image() {
+    root_size=$(du -s -B1 "${work_dir}" --exclude="${work_dir}"/boot | cut -f1)
+    rootfs_size_record
+
+    status "Assemble the image file"
+    mkdir -p "${image_dir}"
+    python3 "${repo_dir}"/bin/assemble-image.py -b "${bootsize}" -t "${bootfstype}" -f "${rootfstype}" -F "${free_space}" \
+        -U "${root_uuid}" -i "${disk_id}" "${work_dir}" "${img}"
+}
+
 # Create fstab file.
 function make_fstab() {
     status "Create /etc/fstab"
@@ -541,20 +797,26 @@ function mkfs_partitions() {
 }
 
 # Compress image compilation
+# The image is read once: ./bin/compress-image.py hashes it, compresses it and hashes the
+# compressed output in the same pass, and writes both .sha256sum files
 function compress_img() {
     if [ "${compress:=}" = xz ]; then
         status "Compressing file: ${image_name}.img"
 
         if [ "$(arch)" == 'x86_64' ] || [ "$(arch)" == 'aarch64' ]; then
-            limit_cpu pixz -p "${num_cores:=}" "${image_dir}/${image_name}.img" # -p Nº cpu cores use
+            limit_cpu python3 "${repo_dir}/bin/compress-image.py" -e pixz -T "${num_cores:=}" "${image_dir}/${image_name}.img" # -T Nº cpu cores use
 
         else
-            xz --memlimit-compress=50% -T "$num_cores" "${image_dir}/${image_name}.img" # -T Nº cpu cores use
+            # Block-parallel lzma encoder, honours cpu_limit itself instead of cgroups
+            python3 "${repo_dir}/bin/compress-image.py" -e builtin -T "$num_cores" -l "${cpu_limit:=-1}" "${image_dir}/${image_name}.img" # -T Nº cpu cores use
 
         fi
 
         img="${image_dir}/${image_name}.img.xz"
 
+    else
+        python3 "${repo_dir}/bin/compress-image.py" -c none "${image_dir}/${image_name}.img"
+
     fi
 
     chmod 0644 "$img"
@@ -595,6 +857,10 @@ function umount_partitions() {
 
 # Clean up all the temporary build stuff and remove the directories.
 function clean_build() {
+    # Stage 3 of a build that failed inside the container
+    event_stage3
+    event_step "Clean up"
+
     log "Cleaning up" green
 
     # unmount anything that may be mounted
@@ -603,15 +869,18 @@ function clean_build() {
     # Delete files
     log "Cleaning up the temporary build files..." green
     rm -rf "${work_dir}"
+    ! mountpoint -q "${base_dir}" || umount -q "${base_dir}" || umount -lq "${base_dir}"
     rm -rf "${base_dir}"
 
     # Done
     log "Done" green
+    event_build
     total_time $SECONDS
 }
 
 function check_trap() {
     log "\n ⚠️  An error has occurred!\n" red
+    event_result="failed"
     clean_build
 
     exit 1
@@ -622,4 +891,68 @@ status() {
     status_i=$((status_i + 1))
     [[ $debug = 1 ]] && timestamp="($(date +"%Y-%m-%d %H:%M:%S"))" || timestamp=""
     log " ✅ ${status_i}/${status_t}:$(tput sgr0) $1 $timestamp" green
+    event_step "$1"
+}
+
+# Timing events, one JSON object per line in $events_file (see ./bin/build-stats.py)
+# A step runs from its status line to the next one, the build from the first status to clean_build
+function event_write() {
+    # scope, step, start, end
+    [ -z "${events_file}" ] && return 0
+
+    local step="${2//\\/\\\\}"
+    step="${step//\"/\\\"}"
+
+    printf '{"build": "%s", "release": "%s", "image": "%s", "arch": "%s", "host": "%s", "scope": "%s", "step": "%s", "start": %s, "end": %s%s}\n' \
+        "${event_build_id}" "${version}" "${image_name}" "${architecture}" "${event_host}" "$1" "${step}" "$3" "$4" "${5:-}" \
+        >>"${events_file}" || true
+}
+
+function event_step() {
+    # Ends the running step, and starts $1 (if any)
+    local now
+    now=$(date +%s.%N)
+
+    if [ -z "${event_build_id}" ]; then
+        event_host=$(uname -n)
+        event_build_id="${event_host}-$$-${now%.*}"
+        event_build_start=${now}
+        mkdir -p "$(dirname "${events_file:-.}")"
+
+    elif [ -n "${event_name}" ]; then
+        event_write step "${event_name}" "${event_start}" "${now}"
+
+    fi
+
+    event_name="$1"
+    event_start=${now}
+}
+
+function event_stage3() {
+    # status_stage3 leaves "<time> <step>" lines in /third-stage.events, each step ends where the next starts
+    local events="${work_dir}/third-stage.events" now time step prev_time="" prev_step=""
+
+    [ -f "${events}" ] || return 0
+
+    now=$(date +%s.%N)
+
+    while read -r time step; do
+        [ -n "${prev_time}" ] && event_write stage3 "${prev_step}" "${prev_time}" "${time}"
+        prev_time=${time}
+        prev_step=${step}
+
+    done <"${events}"
+
+    [ -n "${prev_time}" ] && event_write stage3 "${prev_step}" "${prev_time}" "${now}"
+
+    rm -f "${events}"
+}
+
+function event_build() {
+    # Once per build: clean_build runs again from the EXIT trap
+    [ -z "${event_build_id}" ] || [ -n "${event_build_done}" ] && return 0
+
+    event_step ""
+    event_write build "${image_name}" "${event_build_start}" "$(date +%s.%N)" ", \"result\": \"${event_result:-ok}\""
+    event_build_done=1
 }
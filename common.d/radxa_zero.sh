@@ -57,7 +57,7 @@ include clean_system
 # Kernel section. If you want to use a custom kernel, or configuration, replace
 # them in this section
 status "Kernel stuff"
-git clone --depth 1 -b radxa-zero-linux-5.10.y https://github.com/steev/linux.git ${work_dir}/usr/src/kernel
+git_clone --depth 1 -b radxa-zero-linux-5.10.y https://github.com/steev/linux.git ${work_dir}/usr/src/kernel
 cd ${work_dir}/usr/src/kernel
 git rev-parse HEAD >${work_dir}/usr/src/kernel-at-commit
 rm -rf .git
@@ -137,7 +137,7 @@ echo 'U_BOOT_MENU_LABEL="Kali Linux"' >>${work_dir}/etc/default/u-boot
 echo 'U_BOOT_PARAMETERS="earlyprintk console=ttyAML0,115200 console=tty1 console=both swiotlb=1 coherent_pool=1m ro rootwait"' >>${work_dir}/etc/default/u-boot
 
 status "Rsyncing rootfs into image file"
-rsync -HPavz -q --exclude boot "${work_dir}"/ "${base_dir}"/root/
+rsync -Hav -q --exclude boot "${work_dir}"/ "${base_dir}"/root/
 sync
 
 status "Rsyncing boot into image file (/boot)"
@@ -146,8 +146,8 @@ sync
 
 status "u-Boot"
 cd "${work_dir}"
-git clone https://github.com/radxa/fip.git
-git clone https://github.com/u-boot/u-boot.git -b v2022.10 --depth 1
+git_clone https://github.com/radxa/fip.git
+git_clone https://github.com/u-boot/u-boot.git -b v2022.10 --depth 1
 cd u-boot
 
 # Remove amlogic from the config, this matches what LibreElec does, as well as the vendor u-boot
@@ -10,3 +10,4 @@ EOF
 chmod 0755 "${work_dir}/third-stage"
 status "Run third stage"
 systemd-nspawn_exec /third-stage
+event_stage3
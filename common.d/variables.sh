@@ -61,13 +61,66 @@ disable_ipv6="yes"
 swap="no"
 
 # Use 0 for unlimited CPU cores, -1 to subtract 1 cores from the total
-cpu_cores="4"
+cpu_cores=${cpu_cores:-"4"}
 
 # 0 or 100 No limit, 10 = percentage use, 50, 75, 90, etc
 # Percentage to limit CPU (via cgroups)
 # -1 to disable the feature
 # 1 -> 100. 10 = percentage use, 50, 75, 90, etc
-cpu_limit="-1"
+cpu_limit=${cpu_limit:-"-1"}
+
+# cgroup v2 only: memory (e.g. 8G) and disk bandwidth (bytes per second, e.g. 200M) limits. Empty for no limit
+# See ./bin/cgroup-run.py
+memory_limit=${memory_limit:-""}
+io_read_limit=${io_read_limit:-""}
+io_write_limit=${io_write_limit:-""}
+
+# Reuse the rootfs of earlier builds with the same architecture and package set (yes or no)
+# See ./bin/rootfs-cache.py
+rootfs_cache=${rootfs_cache:-"no"}
+rootfs_cache_dir=${rootfs_cache_dir:-"${repo_dir}/local/rootfs-cache"}
+
+# Rootfs cache size in GiB, and the age in days after which a snapshot is rebuilt
+rootfs_cache_size=${rootfs_cache_size:-"32"}
+rootfs_cache_days=${rootfs_cache_days:-"7"}
+
+# Reuse the kernel and bootloader builds of earlier builds with the same sources, config, patches and toolchain (yes or no)
+# See ./bin/kernel-cache.py
+kernel_cache=${kernel_cache:-"no"}
+kernel_cache_dir=${kernel_cache_dir:-"${repo_dir}/local/kernel-cache"}
+
+# Kernel cache size in GiB, and the age in days after which a build is redone
+kernel_cache_size=${kernel_cache_size:-"16"}
+kernel_cache_days=${kernel_cache_days:-"30"}
+
+# Clone the kernel, u-boot and toolchain git repositories from local mirrors (yes or no)
+# See ./bin/git-mirror.py
+git_mirror=${git_mirror:-"no"}
+git_mirror_dir=${git_mirror_dir:-"${repo_dir}/local/git-mirror"}
+
+# Fetch a mirror again when it is older than this, in seconds. Offline (yes): only use what is mirrored already
+git_mirror_refresh=${git_mirror_refresh:-"3600"}
+git_mirror_offline=${git_mirror_offline:-"no"}
+
+# Bootstrap from the packages resolved and fetched beforehand, in parallel, instead of debootstrap/mmdebstrap downloading them
+# The plan of ./bin/resolve-packages.py -o, and the pool it fetched the .debs into (-f -D). See ./bin/bootstrap.py
+bootstrap_plan=${bootstrap_plan:-""}
+bootstrap_pool=${bootstrap_pool:-"${repo_dir}/local/pool"}
+
+# Write the image straight from the working dir, without loop devices or mounts (yes or no)
+# For the build-scripts that call assemble_prepare/assemble_image, see ./bin/assemble-image.py
+loopless=${loopless:-"no"}
+
+# Build the rootfs in RAM, on a tmpfs: no, auto (when there is enough free memory, else on disk) or yes (refuse to start otherwise)
+work_tmpfs=${work_tmpfs:-"no"}
+
+# tmpfs size in GiB, empty to size it from the previous builds (rootfs_sizes), and memory in GiB to leave to the rest of the host
+work_tmpfs_size=${work_tmpfs_size:-""}
+work_tmpfs_reserve=${work_tmpfs_reserve:-"2"}
+rootfs_sizes=${rootfs_sizes:-"${repo_dir}/logs/rootfs-sizes"}
+
+# Timing events of the build steps, in JSON lines (see ./bin/build-stats.py). Empty to disable
+events_file=${events_file-"${repo_dir}/logs/events.jsonl"}
 
 # If you have your own preferred mirrors, set them here
 mirror=${mirror:-"http://http.kali.org/kali"}
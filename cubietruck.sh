@@ -35,28 +35,34 @@ include clean_system
 # Kernel section.  If you want to us ea custom kernel, or configuration, replace
 # them in this section
 # Get, compile and install kernel
-git clone --depth 1 https://github.com/linux-sunxi/u-boot-sunxi
-git clone --depth 1 https://github.com/linux-sunxi/linux-sunxi -b stage/sunxi-3.4 ${work_dir}/usr/src/kernel
-git clone --depth 1 https://github.com/linux-sunxi/sunxi-tools
-git clone --depth 1 https://github.com/linux-sunxi/sunxi-boards
+git_clone --depth 1 https://github.com/linux-sunxi/sunxi-tools
+git_clone --depth 1 https://github.com/linux-sunxi/sunxi-boards
 
 cd "${base_dir}"/sunxi-tools
 make fex2bin
 ./fex2bin "${base_dir}"/sunxi-boards/sys_config/a20/cubietruck.fex ${work_dir}/boot/script.bin
 
-cd ${work_dir}/usr/src/kernel
-git rev-parse HEAD >../kernel-at-commit
-patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/mac80211.patch
-touch .scmversion
 export ARCH=arm
 export CROSS_COMPILE=arm-linux-gnueabihf-
-cp ${repo_dir}/kernel-configs/sun7i.config .config
-cp ${repo_dir}/kernel-configs/sun7i.config ${work_dir}/usr/src/sun7i.config
-make -j $(grep -c processor /proc/cpuinfo) uImage modules
-make modules_install INSTALL_MOD_PATH=${work_dir}
-cp arch/arm/boot/uImage ${work_dir}/boot
-make mrproper
-cp ../sun7i.config .config
+
+if ! kernel_cache_restore "${work_dir}" -g "https://github.com/linux-sunxi/linux-sunxi#stage/sunxi-3.4" -t "${CROSS_COMPILE}gcc" -e "uImage modules" \
+    "${repo_dir}"/kernel-configs/sun7i.config "${repo_dir}"/patches/mac80211.patch; then
+    git_clone --depth 1 https://github.com/linux-sunxi/linux-sunxi -b stage/sunxi-3.4 ${work_dir}/usr/src/kernel
+    cd ${work_dir}/usr/src/kernel
+    git rev-parse HEAD >../kernel-at-commit
+    patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/mac80211.patch
+    touch .scmversion
+    cp ${repo_dir}/kernel-configs/sun7i.config .config
+    cp ${repo_dir}/kernel-configs/sun7i.config ${work_dir}/usr/src/sun7i.config
+    make -j $(grep -c processor /proc/cpuinfo) uImage modules
+    make modules_install INSTALL_MOD_PATH=${work_dir}
+    cp arch/arm/boot/uImage ${work_dir}/boot
+    make mrproper
+    cp ../sun7i.config .config
+    kernel_cache_save "${work_dir}"
+
+fi
+
 cd "${base_dir}"
 
 # Fix up the symlink for building external modules
@@ -107,14 +113,20 @@ mkdir -p "${base_dir}"/root/boot
 mount "${bootp}" "${base_dir}"/root/boot
 
 echo "Rsyncing rootfs to image file"
-rsync -HPavz -q ${work_dir}/ ${base_dir}/root/
-
-cd "${base_dir}"/u-boot-sunxi/
+rsync -Hav -q ${work_dir}/ ${base_dir}/root/
 
 # Build u-boot
-make distclean
-make Cubietruck_config
-make -j $(grep -c processor /proc/cpuinfo)
+if ! kernel_cache_restore "${base_dir}"/u-boot-sunxi -g "https://github.com/linux-sunxi/u-boot-sunxi#HEAD" -t "${CROSS_COMPILE}gcc" -e Cubietruck_config; then
+    git_clone --depth 1 https://github.com/linux-sunxi/u-boot-sunxi "${base_dir}"/u-boot-sunxi
+    cd "${base_dir}"/u-boot-sunxi/
+    make distclean
+    make Cubietruck_config
+    make -j $(grep -c processor /proc/cpuinfo)
+    kernel_cache_save "${base_dir}"/u-boot-sunxi u-boot-sunxi-with-spl.bin
+
+fi
+
+cd "${base_dir}"/u-boot-sunxi/
 
 dd if=u-boot-sunxi-with-spl.bin of=${loopdevice} bs=1024 seek=8
 
@@ -38,7 +38,7 @@ include clean_system
 # For some reason the brcm firmware doesn't work properly in linux-firmware git
 # so we grab the ones from OpenELEC
 cd ${base_dir}
-git clone https://github.com/OpenELEC/wlan-firmware
+git_clone https://github.com/OpenELEC/wlan-firmware
 cd wlan-firmware
 rm -rf ${work_dir}/lib/firmware/brcm
 cp -a firmware/brcm ${work_dir}/lib/firmware/
@@ -81,7 +81,7 @@ echo 'U_BOOT_MENU_LABEL="Kali Linux"' >>${work_dir}/etc/default/u-boot
 echo 'U_BOOT_PARAMETERS="console=tty1 consoleblank=0 ro rootwait"' >>${work_dir}/etc/default/u-boot
 
 status "Rsyncing rootfs into image file"
-rsync -HPavz -q ${work_dir}/ ${base_dir}/root/
+rsync -Hav -q ${work_dir}/ ${base_dir}/root/
 sync
 
 status "dd to ${loopdevice} (u-boot bootloader)"
@@ -31,25 +31,32 @@ include clean_system
 
 # We need an older cross compiler due to kernel age
 cd "${base_dir}"
-git clone --depth 1 https://gitlab.com/kalilinux/packages/gcc-arm-linux-gnueabihf-4-7.git gcc-arm-linux-gnueabihf-4.7
+git_clone --depth 1 https://gitlab.com/kalilinux/packages/gcc-arm-linux-gnueabihf-4-7.git gcc-arm-linux-gnueabihf-4.7
 
 # Kernel section. If you want to use a custom kernel, or configuration, replace
 # them in this section
-git clone --depth 1 https://github.com/rabeeh/linux.git ${work_dir}/usr/src/kernel
-cd ${work_dir}/usr/src/kernel
-git rev-parse HEAD >${work_dir}/usr/src/kernel-at-commit
-patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/mac80211.patch
-patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/remove-defined-from-timeconst.patch
-touch .scmversion
 export ARCH=arm
 export CROSS_COMPILE="${base_dir}"/gcc-arm-linux-gnueabihf-4.7/bin/arm-linux-gnueabihf-
-make cubox_defconfig
-cp .config ${work_dir}/usr/src/cubox.config
-make -j $(grep -c processor /proc/cpuinfo) uImage modules
-make modules_install INSTALL_MOD_PATH=${work_dir}
-cp arch/arm/boot/uImage ${work_dir}/boot
-make mrproper
-cp ../cubox.config .config
+
+if ! kernel_cache_restore "${work_dir}" -g "https://github.com/rabeeh/linux.git#HEAD" -t "${CROSS_COMPILE}gcc" -e "cubox_defconfig uImage modules" \
+    "${repo_dir}"/patches/mac80211.patch "${repo_dir}"/patches/remove-defined-from-timeconst.patch; then
+    git_clone --depth 1 https://github.com/rabeeh/linux.git ${work_dir}/usr/src/kernel
+    cd ${work_dir}/usr/src/kernel
+    git rev-parse HEAD >${work_dir}/usr/src/kernel-at-commit
+    patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/mac80211.patch
+    patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/remove-defined-from-timeconst.patch
+    touch .scmversion
+    make cubox_defconfig
+    cp .config ${work_dir}/usr/src/cubox.config
+    make -j $(grep -c processor /proc/cpuinfo) uImage modules
+    make modules_install INSTALL_MOD_PATH=${work_dir}
+    cp arch/arm/boot/uImage ${work_dir}/boot
+    make mrproper
+    cp ../cubox.config .config
+    kernel_cache_save "${work_dir}"
+
+fi
+
 cd "${base_dir}"
 
 # Fix up the symlink for building external modules
@@ -128,7 +135,7 @@ mkdir -p "${base_dir}"/root/
 mount "${rootp}" "${base_dir}"/root
 
 echo "Rsyncing rootfs into image file"
-rsync -HPavz -q ${work_dir}/ ${base_dir}/root/
+rsync -Hav -q ${work_dir}/ ${base_dir}/root/
 
 # Load default finish_image configs
 include finish_image
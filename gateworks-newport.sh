@@ -51,42 +51,50 @@ cd "${base_dir}/"
 
 # Do the kernel stuff
 status "Kernel stuff"
-git clone --depth 1 -b v5.4.45-newport https://github.com/gateworks/linux-newport ${work_dir}/usr/src/kernel
-cd ${work_dir}/usr/src/kernel
-
-# Don't change the version because of our patches
-touch .scmversion
 export ARCH=arm64
 export CROSS_COMPILE=aarch64-linux-gnu-
-patch -p1 <${repo_dir}/patches/kali-wifi-injection-5.4.patch
-patch -p1 <${repo_dir}/patches/0001-wireless-carl9170-Enable-sniffer-mode-promisc-flag-t.patch
-cp ${repo_dir}/kernel-configs/gateworks-newport-5.4.45.config .config
-cp ${repo_dir}/kernel-configs/gateworks-newport-5.4.45.config ${work_dir}/usr/src/gateworks-newport-5.4.45.config
-#build
-make -j $(grep -c processor /proc/cpuinfo)
-
-# Install compressed kernel in a kernel.itb
-mkimage -f auto -A arm64 -O linux -T kernel -C gzip -n "Newport Kali Kernel" -a 20080000 -e 20080000 -d arch/arm64/boot/Image.gz kernel.itb
-cp kernel.itb ${work_dir}/boot
-
-# Install kernel modules
-make INSTALL_MOD_STRIP=1 INSTALL_MOD_PATH=${work_dir} modules_install
-make INSTALL_HDR_PATH=${work_dir}/usr headers_install
-
-# cryptodev-linux build/install
-git clone --depth 1 https://github.com/cryptodev-linux/cryptodev-linux ${work_dir}/usr/src/cryptodev-linux
-cd ${work_dir}/usr/src
-make -C cryptodev-linux KERNEL_DIR=${work_dir}/usr/src/kernel
-make -C cryptodev-linux KERNEL_DIR=${work_dir}/usr/src/kernel DESTDIR=${work_dir} INSTALL_MOD_PATH=${work_dir} install
-
-# wireguard-linux-compat build/install
-git clone --depth 1 https://git.zx2c4.com/wireguard-linux-compat ${work_dir}/usr/src/wireguard-linux-compat
-make -C ${work_dir}/usr/src/kernel M=../wireguard-linux-compat/src modules
-make -C ${work_dir}/usr/src/kernel M=../wireguard-linux-compat/src INSTALL_MOD_PATH=${work_dir} modules_install
-
-# Cleanup
-cd ${work_dir}/usr/src/kernel
-make mrproper
+
+if ! kernel_cache_restore "${work_dir}" -g "https://github.com/gateworks/linux-newport#v5.4.45-newport" -t "${CROSS_COMPILE}gcc" \
+    -g "https://github.com/cryptodev-linux/cryptodev-linux#HEAD" -g "https://git.zx2c4.com/wireguard-linux-compat#HEAD" \
+    "${repo_dir}"/patches/kali-wifi-injection-5.4.patch "${repo_dir}"/patches/0001-wireless-carl9170-Enable-sniffer-mode-promisc-flag-t.patch \
+    "${repo_dir}"/kernel-configs/gateworks-newport-5.4.45.config; then
+    git_clone --depth 1 -b v5.4.45-newport https://github.com/gateworks/linux-newport ${work_dir}/usr/src/kernel
+    cd ${work_dir}/usr/src/kernel
+
+    # Don't change the version because of our patches
+    touch .scmversion
+    patch -p1 <${repo_dir}/patches/kali-wifi-injection-5.4.patch
+    patch -p1 <${repo_dir}/patches/0001-wireless-carl9170-Enable-sniffer-mode-promisc-flag-t.patch
+    cp ${repo_dir}/kernel-configs/gateworks-newport-5.4.45.config .config
+    cp ${repo_dir}/kernel-configs/gateworks-newport-5.4.45.config ${work_dir}/usr/src/gateworks-newport-5.4.45.config
+    #build
+    make -j $(grep -c processor /proc/cpuinfo)
+
+    # Install compressed kernel in a kernel.itb
+    mkimage -f auto -A arm64 -O linux -T kernel -C gzip -n "Newport Kali Kernel" -a 20080000 -e 20080000 -d arch/arm64/boot/Image.gz kernel.itb
+    cp kernel.itb ${work_dir}/boot
+
+    # Install kernel modules
+    make INSTALL_MOD_STRIP=1 INSTALL_MOD_PATH=${work_dir} modules_install
+    make INSTALL_HDR_PATH=${work_dir}/usr headers_install
+
+    # cryptodev-linux build/install
+    git_clone --depth 1 https://github.com/cryptodev-linux/cryptodev-linux ${work_dir}/usr/src/cryptodev-linux
+    cd ${work_dir}/usr/src
+    make -C cryptodev-linux KERNEL_DIR=${work_dir}/usr/src/kernel
+    make -C cryptodev-linux KERNEL_DIR=${work_dir}/usr/src/kernel DESTDIR=${work_dir} INSTALL_MOD_PATH=${work_dir} install
+
+    # wireguard-linux-compat build/install
+    git_clone --depth 1 https://git.zx2c4.com/wireguard-linux-compat ${work_dir}/usr/src/wireguard-linux-compat
+    make -C ${work_dir}/usr/src/kernel M=../wireguard-linux-compat/src modules
+    make -C ${work_dir}/usr/src/kernel M=../wireguard-linux-compat/src INSTALL_MOD_PATH=${work_dir} modules_install
+
+    # Cleanup
+    cd ${work_dir}/usr/src/kernel
+    make mrproper
+    kernel_cache_save "${work_dir}"
+
+fi
 
 # U-boot script
 status "U-boot script"
@@ -142,7 +150,7 @@ else
 fi
 
 status "Rsyncing rootfs into image file"
-rsync -HPavz -q ${work_dir}/ ${base_dir}/root/
+rsync -Hav -q ${work_dir}/ ${base_dir}/root/
 sync
 
 # Load default finish_image configs
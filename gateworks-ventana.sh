@@ -80,29 +80,36 @@ cd "${base_dir}"
 
 # Do the kernel stuff
 status "Kernel stuff"
-git clone --depth 1 -b gateworks_4.20.7 https://github.com/gateworks/linux-imx6 ${work_dir}/usr/src/kernel
-cd ${work_dir}/usr/src/kernel
-
-# Don't change the version because of our patches
-touch .scmversion
 export ARCH=arm
 export CROSS_COMPILE=arm-linux-gnueabihf- mrproper
-patch -p1 <${repo_dir}/patches/veyron/4.19/kali-wifi-injection.patch
-patch -p1 <${repo_dir}/patches/veyron/4.19/wireless-carl9170-Enable-sniffer-mode-promisc-flag-t.patch
-
-# Remove redundant YYLOC global declaration
-patch -p1 <${repo_dir}/patches/11647f99b4de6bc460e106e876f72fc7af3e54a6-1.patch
-cp ${repo_dir}/kernel-configs/gateworks-ventana-4.20.7.config .config
-cp ${repo_dir}/kernel-configs/gateworks-ventana-4.20.7.config ${work_dir}/usr/src/gateworks-ventana-4.20.7.config
-make -j $(grep -c processor /proc/cpuinfo)
-make uImage LOADADDR=0x10008000
-make modules_install INSTALL_MOD_PATH=${work_dir}
-cp arch/arm/boot/dts/imx6*-gw*.dtb ${work_dir}/boot/
-cp arch/arm/boot/uImage ${work_dir}/boot/
-
-# Cleanup
-cd ${work_dir}/usr/src/kernel
-make mrproper
+
+if ! kernel_cache_restore "${work_dir}" -g "https://github.com/gateworks/linux-imx6#gateworks_4.20.7" -t "${CROSS_COMPILE}gcc" -e "uImage LOADADDR=0x10008000" \
+    "${repo_dir}"/patches/veyron/4.19/kali-wifi-injection.patch "${repo_dir}"/patches/veyron/4.19/wireless-carl9170-Enable-sniffer-mode-promisc-flag-t.patch \
+    "${repo_dir}"/patches/11647f99b4de6bc460e106e876f72fc7af3e54a6-1.patch "${repo_dir}"/kernel-configs/gateworks-ventana-4.20.7.config; then
+    git_clone --depth 1 -b gateworks_4.20.7 https://github.com/gateworks/linux-imx6 ${work_dir}/usr/src/kernel
+    cd ${work_dir}/usr/src/kernel
+
+    # Don't change the version because of our patches
+    touch .scmversion
+    patch -p1 <${repo_dir}/patches/veyron/4.19/kali-wifi-injection.patch
+    patch -p1 <${repo_dir}/patches/veyron/4.19/wireless-carl9170-Enable-sniffer-mode-promisc-flag-t.patch
+
+    # Remove redundant YYLOC global declaration
+    patch -p1 <${repo_dir}/patches/11647f99b4de6bc460e106e876f72fc7af3e54a6-1.patch
+    cp ${repo_dir}/kernel-configs/gateworks-ventana-4.20.7.config .config
+    cp ${repo_dir}/kernel-configs/gateworks-ventana-4.20.7.config ${work_dir}/usr/src/gateworks-ventana-4.20.7.config
+    make -j $(grep -c processor /proc/cpuinfo)
+    make uImage LOADADDR=0x10008000
+    make modules_install INSTALL_MOD_PATH=${work_dir}
+    cp arch/arm/boot/dts/imx6*-gw*.dtb ${work_dir}/boot/
+    cp arch/arm/boot/uImage ${work_dir}/boot/
+
+    # Cleanup
+    cd ${work_dir}/usr/src/kernel
+    make mrproper
+    kernel_cache_save "${work_dir}"
+
+fi
 
 # Pull in imx6 smda/vpu firmware for vpu
 status "vpu"
@@ -150,7 +157,7 @@ else
 fi
 
 status "Rsyncing rootfs into image file"
-rsync -HPavz -q "${work_dir}"/ "${base_dir}"/root/
+rsync -Hav -q "${work_dir}"/ "${base_dir}"/root/
 sync
 
 # Load default finish_image configs
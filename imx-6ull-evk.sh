@@ -450,7 +450,7 @@ mkdir -p ${basedir}/root/boot
 mount ${bootp} ${basedir}/root/boot
 
 echo "Rsyncing rootfs into image file"
-rsync -HPavz -q --exclude boot ${work_dir}/ ${basedir}/root/
+rsync -Hav -q --exclude boot ${work_dir}/ ${basedir}/root/
 rsync -rtx -q ${work_dir}/boot ${basedir}/root
 sync
 
@@ -42,7 +42,7 @@ include clean_system
 # Kernel section. If you want to use a custom kernel, or configuration, replace
 # them in this section
 status "Kernel section"
-git clone --depth 1 https://github.com/friendlyarm/linux -b nanopi2-v4.4.y ${work_dir}/usr/src/kernel
+git_clone --depth 1 https://github.com/friendlyarm/linux -b nanopi2-v4.4.y ${work_dir}/usr/src/kernel
 cd ${work_dir}/usr/src/kernel/
 git rev-parse HEAD >${work_dir}/usr/src/kernel-at-commit
 touch .scmversion
@@ -112,7 +112,7 @@ mkdir -p "${base_dir}"/root/boot
 mount "${bootp}" "${base_dir}"/root/boot
 
 status "Rsyncing rootfs into image file"
-rsync -HPavz -q "${work_dir}"/ "${base_dir}"/root/
+rsync -Hav -q "${work_dir}"/ "${base_dir}"/root/
 sync
 
 # Samsung bootloaders must be signed
@@ -40,11 +40,11 @@ make_image
 
 # We need an older gcc because of kernel age
 cd "${base_dir}"
-git clone --depth 1 https://gitlab.com/kalilinux/packages/gcc-arm-linux-gnueabihf-4-7.git gcc-arm-linux-gnueabihf-4.7
+git_clone --depth 1 https://gitlab.com/kalilinux/packages/gcc-arm-linux-gnueabihf-4-7.git gcc-arm-linux-gnueabihf-4.7
 
 # Kernel section. If you want to use a custom kernel, or configuration, replace
 # them in this section
-git clone --depth 1 https://github.com/friendlyarm/linux-3.4.y -b nanopi2-lollipop-mr1 ${work_dir}/usr/src/kernel
+git_clone --depth 1 https://github.com/friendlyarm/linux-3.4.y -b nanopi2-lollipop-mr1 ${work_dir}/usr/src/kernel
 cd ${work_dir}/usr/src/kernel
 git rev-parse HEAD >${work_dir}/usr/src/kernel-at-commit
 touch .scmversion
@@ -95,7 +95,7 @@ cd "${base_dir}"
 cd ${work_dir}/usr/src/
 #wget https://www.kernel.org/pub/linux/kernel/projects/backports/stable/v4.4.2/backports-4.4.2-1.tar.xz
 #tar -xf backports-4.4.2-1.tar.xz
-git clone https://github.com/friendlyarm/wireless
+git_clone https://github.com/friendlyarm/wireless
 cd wireless
 cd backports-4.4.2-1
 patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/kali-wifi-injection-4.4.patch
@@ -164,7 +164,7 @@ mkdir -p "${base_dir}"/root/boot
 mount ${bootp} "${base_dir}"/root/boot
 
 echo "Rsyncing rootfs into image file"
-rsync -HPavz -q ${work_dir}/ ${base_dir}/root/
+rsync -Hav -q ${work_dir}/ ${base_dir}/root/
 
 # Samsung bootloaders must be signed
 # These are the same steps that are done by
@@ -116,7 +116,7 @@ echo 'U_BOOT_MENU_LABEL="Kali Linux"' >>${work_dir}/etc/default/u-boot
 echo 'U_BOOT_PARAMETERS="console=tty1 consoleblank=0 ro rootwait"' >>${work_dir}/etc/default/u-boot
 
 status "Rsyncing rootfs into image file"
-rsync -HPavz -q "${work_dir}"/ "${base_dir}"/root/
+rsync -Hav -q "${work_dir}"/ "${base_dir}"/root/
 sync
 
 # We are gonna use as much open source as we can here, hopefully we end up with a nice
@@ -132,9 +132,9 @@ unset CROSS_COMPILE
 status "Bootloader"
 mkdir -p ${base_dir}/bootloader
 cd ${base_dir}/bootloader
-git clone --depth 1 https://github.com/afaerber/meson-tools --depth 1
-git clone --depth 1 https://github.com/u-boot/u-boot.git -b v2022.04
-git clone --depth 1 https://github.com/hardkernel/u-boot -b odroidc2-v2015.01 u-boot-hk
+git_clone --depth 1 https://github.com/afaerber/meson-tools --depth 1
+git_clone --depth 1 https://github.com/u-boot/u-boot.git -b v2022.04
+git_clone --depth 1 https://github.com/hardkernel/u-boot -b odroidc2-v2015.01 u-boot-hk
 
 # First things first, let's build the meson-tools, of which, we only really need amlbootsig
 cd ${base_dir}/bootloader/meson-tools/
@@ -520,7 +520,7 @@ mount ${bootp} "${base_dir}"/root/boot
 echo "nameserver ${nameserver}" >"${work_dir}"/etc/resolv.conf
 
 echo "Rsyncing rootfs into image file"
-rsync -HPavz -q ${work_dir}/ ${base_dir}/root/
+rsync -Hav -q ${work_dir}/ ${base_dir}/root/
 
 # Unmount partitions
 sync
@@ -61,7 +61,7 @@ include clean_system
 # Kernel section. If you want to use a custom kernel, or configuration, replace
 # them in this section
 status "Kernel stuff"
-git clone --depth 1 -b odroidxu4-4.14.y https://github.com/hardkernel/linux.git ${work_dir}/usr/src/kernel
+git_clone --depth 1 -b odroidxu4-4.14.y https://github.com/hardkernel/linux.git ${work_dir}/usr/src/kernel
 cd ${work_dir}/usr/src/kernel
 git rev-parse HEAD >${work_dir}/usr/src/kernel-at-commit
 patch -p1 --no-backup-if-mismatch <${repo_dir}/patches/kali-wifi-injection-4.14.patch
@@ -173,13 +173,13 @@ mkdir -p "${base_dir}"/root/boot
 mount "${bootp}" "${base_dir}"/root/boot
 
 status "Rsyncing rootfs into image file"
-rsync -HPavz -q "${work_dir}"/ "${base_dir}"/root/
+rsync -Hav -q "${work_dir}"/ "${base_dir}"/root/
 sync
 
 # Write the signed u-boot binary to the image so that it will boot
 status "u-Boot"
 cd "${base_dir}"
-git clone --depth 1 -b odroidxu4-v2017.05 https://github.com/hardkernel/u-boot.git "${base_dir}"/u-boot
+git_clone --depth 1 -b odroidxu4-v2017.05 https://github.com/hardkernel/u-boot.git "${base_dir}"/u-boot
 cd "${base_dir}"/u-boot
 alias python=python3
 make odroid-xu4_defconfig
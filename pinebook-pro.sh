@@ -66,7 +66,7 @@ include clean_system
 
 # Pull in the wifi and bluetooth firmware from Armbian's git repository
 cd "${work_dir}"/
-git clone --depth 1 https://github.com/armbian/firmware.git
+git_clone --depth 1 https://github.com/armbian/firmware.git
 cd firmware/
 mkdir -p "${work_dir}"/lib/firmware/brcm/
 cp brcm/BCM4345C5.hcd "${work_dir}"/lib/firmware/brcm/BCM4345C5.hcd
@@ -133,7 +133,7 @@ echo 'U_BOOT_MENU_LABEL="Kali Linux"' >>"${work_dir}"/etc/default/u-boot
 echo 'U_BOOT_PARAMETERS="console=tty1 ro rootwait"' >>"${work_dir}"/etc/default/u-boot
 
 status "Rsyncing rootfs into image file"
-rsync -HPavz -q "${work_dir}"/ "${base_dir}"/root/
+rsync -Hav -q "${work_dir}"/ "${base_dir}"/root/
 sync
 
 # This comes from the u-boot-rockchip package which is installed into the image, and not the build machine
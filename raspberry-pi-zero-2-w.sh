@@ -101,7 +101,7 @@ mkdir -p "${base_dir}"/root/boot
 mount "${bootp}" "${base_dir}"/root/boot
 
 status "Rsyncing rootfs into image file"
-rsync -HPavz -q --exclude boot "${work_dir}"/ "${base_dir}"/root/
+rsync -Hav -q --exclude boot "${work_dir}"/ "${base_dir}"/root/
 sync
 
 status "Rsyncing rootfs into image file (/boot)"
@@ -26,7 +26,7 @@ basic_network
 #add_interface eth0
 
 # move P4wnP1 in (change to release blob when ready)
-git clone -b 'master' --single-branch --depth 1 https://github.com/rogandawes/P4wnP1_aloa "${work_dir}"/root/P4wnP1
+git_clone -b 'master' --single-branch --depth 1 https://github.com/rogandawes/P4wnP1_aloa "${work_dir}"/root/P4wnP1
 
 # Third stage
 cat <<EOF >>"${work_dir}"/third-stage
@@ -136,7 +136,7 @@ include third_stage
 cd "${base_dir}"
 
 status 'Clone bootloader and firmware'
-git clone -b 1.20181112 --depth 1 https://github.com/raspberrypi/firmware.git "${work_dir}"/rpi-firmware
+git_clone -b 1.20181112 --depth 1 https://github.com/raspberrypi/firmware.git "${work_dir}"/rpi-firmware
 cp -rf "${work_dir}"/rpi-firmware/boot/* "${work_dir}"/boot/
 
 # Copy over Pi specific libs (video core) and binaries (dtoverlay,dtparam ...)
@@ -145,13 +145,13 @@ rm -rf "${work_dir}"/rpi-firmware
 
 status 'Clone nexmon firmware'
 cd "${base_dir}"
-git clone https://github.com/mame82/nexmon_wifi_covert_channel.git -b p4wnp1 "${base_dir}"/nexmon --depth 1
+git_clone https://github.com/mame82/nexmon_wifi_covert_channel.git -b p4wnp1 "${base_dir}"/nexmon --depth 1
 
 status 'Clone and build kernel'
 cd "${base_dir}"
 
 # Re4son kernel 4.14.80 with P4wnP1 patches (dwc2 and brcmfmac)
-git clone --depth 1 https://github.com/Re4son/re4son-raspberrypi-linux -b rpi-4.14.80-re4son-p4wnp1 "${work_dir}"/usr/src/kernel
+git_clone --depth 1 https://github.com/Re4son/re4son-raspberrypi-linux -b rpi-4.14.80-re4son-p4wnp1 "${work_dir}"/usr/src/kernel
 
 cd "${work_dir}"/usr/src/kernel
 
@@ -287,7 +287,7 @@ mkdir -p "${base_dir}"/root/boot
 mount "${bootp}" "${base_dir}"/root/boot
 
 status "Rsyncing rootfs into image file"
-rsync -HPavz -q --exclude boot "${work_dir}"/ "${base_dir}"/root/
+rsync -Hav -q --exclude boot "${work_dir}"/ "${base_dir}"/root/
 sync
 
 status "Rsyncing rootfs into image file (/boot)"
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+###############################################
+# ./bin/rebuild-plan.py over the real devices.yml and build-scripts
+#
+# Usage:
+# python3 -m unittest discover -s tests -v
+
+import importlib.util
+import os
+import sys
+import unittest
+import unittest.mock
+
+repodir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(repodir, "bin"))
+
+import build  # noqa: E402
+import catalog  # noqa: E402
+
+spec = importlib.util.spec_from_file_location("rebuild_plan", os.path.join(repodir, "bin", "rebuild-plan.py"))
+rebuild_plan = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(rebuild_plan)
+
+
+def jobs(supports):
+    selection = build.Selection(supports, [])
+    catalog.walk(catalog.load(os.path.join(repodir, "devices.yml")), [selection])
+
+    return selection.jobs
+
+
+class RebuildPlanTest(unittest.TestCase):
+    def setUp(self):
+        rebuild_plan.inputfile = os.path.join(repodir, "devices.yml")
+        rebuild_plan.supports = ["kali"]
+        rebuild_plan.architectures = []
+
+    def plan(self, changed):
+        with unittest.mock.patch.object(rebuild_plan, "changed_files", return_value=changed):
+            return rebuild_plan.plan()[1]
+
+    def test_wrapper_script(self):
+        reached, patterns = rebuild_plan.Graph(repodir).closure("raspberry-pi-64-bit.sh")
+
+        self.assertIn("raspberry-pi.sh", reached)
+        self.assertIn("common.d/functions.sh", reached)
+
+    def test_functions_rebuilds_every_kali_build(self):
+        builds = self.plan(["common.d/functions.sh"])
+
+        self.assertIn(("raspberry-pi-64-bit.sh", "arm64"), builds)
+        self.assertEqual(set(builds), set(jobs(["kali"])))
+
+    def test_comments_are_not_dependencies(self):
+        reached, patterns = rebuild_plan.Graph(repodir).closure("raspberry-pi.sh")
+
+        for script in ("bin/release.py", "bin/reports.py", "bin/resolve-packages.py", "bin/build-stats.py"):
+            self.assertNotIn(script, reached)
+
+    def test_unrelated_change(self):
+        self.assertEqual(self.plan(["README.md"]), {})
+
+    def test_pipeline(self):
+        builds = self.plan(["common.d/functions.sh"])
+        include = [{"script": key[0], "architecture": key[1], "images": entry["job"].images} for key, entry in builds.items()]
+        pipeline = rebuild_plan.pipeline(include)
+
+        self.assertIn("build raspberry-pi-64-bit.sh arm64", pipeline)
+        self.assertEqual(len(pipeline) - 2, len(builds))
+        self.assertIn("no rebuild", rebuild_plan.pipeline([]))
+
+
+if __name__ == "__main__":
+    unittest.main()